@@ -0,0 +1,191 @@
+#!/usr/bin/env python
+'''Binary archives of l2planes data.
+
+Text dumps written with --dump2file have to be parsed again every time
+they are replayed. convertDump turns them into a compact binary file
+that Archive opens with numpy.memmap: opening is instant whatever the
+size, only the parts actually read are loaded, and the operating system
+shares those pages between all the processes reading the same archive.
+
+File layout (little endian, every section aligned to 8 bytes):
+
+    header      magic, version and number of rows of each table
+    planes      one column after another: mjd, epc (float64), id, code
+                (int32 indices into the id and code tables), lat, lon
+                (float64), alt, ran, az, el (float32), aux (3 x float32)
+    telescope   row (int64, number of plane rows preceding each
+                telescope line) and line (the raw line, 64 characters)
+    ids         interned plane ICAO ids (6 characters each)
+    codes       interned callsigns (8 characters each)
+
+Units are those of the data lines, as in beacons.PLANE_DTYPE.
+'''
+
+import struct
+import shutil
+import tempfile
+
+import numpy as np
+
+import beacons
+import dumpfile
+
+
+MAGIC = 'L2PARCH\0'
+VERSION = 1
+HEADER = struct.Struct('<8sIIQQQQ')
+
+PLANE_COLUMNS = [('mjd', '<f8', ()), ('epc', '<f8', ()),
+                 ('id', '<i4', ()), ('code', '<i4', ()),
+                 ('lat', '<f8', ()), ('lon', '<f8', ()),
+                 ('alt', '<f4', ()), ('ran', '<f4', ()),
+                 ('az', '<f4', ()), ('el', '<f4', ()),
+                 ('aux', '<f4', (3,))]
+TEL_COLUMNS = [('row', '<i8', ()), ('line', 'S64', ())]
+
+
+def _layout(nplanes, ntel, nids, ncodes):
+    """Offset, dtype and shape of every section of an archive"""
+    sections = ([(name, dtype, (nplanes,) + shape)
+                 for name, dtype, shape in PLANE_COLUMNS] +
+                [('tel_' + name, dtype, (ntel,) + shape)
+                 for name, dtype, shape in TEL_COLUMNS] +
+                [('ids', 'S6', (nids,)), ('codes', 'S8', (ncodes,))])
+    layout = []
+    offset = HEADER.size
+    for name, dtype, shape in sections:
+        offset = (offset + 7) // 8 * 8
+        layout.append((name, np.dtype(dtype), shape, offset))
+        offset += np.dtype(dtype).itemsize * int(np.prod(shape))
+    return layout
+
+
+def _table(interned):
+    """Interned strings sorted by their index"""
+    return sorted(interned, key=interned.get)
+
+
+def isArchive(fname):
+    """True if fname is a binary archive rather than a text dump"""
+    with open(fname, 'rb') as f:
+        return f.read(len(MAGIC)) == MAGIC
+
+
+def convertDump(src, dst, blocksize=2**24):
+    """Converts an l2planes text dump into a binary archive.
+
+    Parameters
+    ----------
+    src: l2planes dump file, possibly rotated or compressed (see
+         dumpfile.dumpParts)
+    dst: name of the binary archive to write
+    blocksize: approximate number of bytes parsed at a time
+
+    Returns
+    -------
+    nplanes, ntel: number of plane and telescope lines converted
+    """
+    ids, codes = {}, {}
+    names = ([name for name, _, _ in PLANE_COLUMNS] +
+             ['tel_' + name for name, _, _ in TEL_COLUMNS])
+    dtypes = dict((name, dtype) for name, dtype, _, _ in _layout(0, 0, 0, 0))
+    tmp = dict((name, tempfile.TemporaryFile()) for name in names)
+    nplanes, ntel = 0, 0
+    for block in dumpfile.readBlocks(dumpfile.dumpParts(src), blocksize):
+        precs, tlines, _, trows = beacons.parse_lines(block, rows=True)
+        cols = {'id': [ids.setdefault(k, len(ids)) for k in precs['id']],
+                'code': [codes.setdefault(k, len(codes))
+                         for k in precs['code']],
+                'tel_row': trows + nplanes,
+                'tel_line': [line.strip() for line in tlines]}
+        for name in names:
+            col = cols[name] if name in cols else precs[name]
+            tmp[name].write(np.asarray(col, dtype=dtypes[name]).tobytes())
+        nplanes += len(precs)
+        ntel += len(tlines)
+
+    with open(dst, 'wb') as f:
+        f.write(HEADER.pack(MAGIC, VERSION, 0, nplanes, ntel,
+                            len(ids), len(codes)))
+        for name, dtype, shape, offset in _layout(nplanes, ntel,
+                                                  len(ids), len(codes)):
+            f.write('\0' * (offset - f.tell()))
+            if name == 'ids':
+                f.write(np.array(_table(ids), dtype=dtype).tobytes())
+            elif name == 'codes':
+                f.write(np.array(_table(codes), dtype=dtype).tobytes())
+            else:
+                tmp[name].seek(0)
+                shutil.copyfileobj(tmp[name], f)
+                tmp[name].close()
+    return nplanes, ntel
+
+
+class Archive(object):
+    """Read-only, memory mapped binary archive.
+
+    Columns are available as attributes (e.g. a.epc, a.tel_row) and are
+    Numpy views into the mapped file.
+
+    Parameters
+    ----------
+    fname: archive file name
+    """
+    def __init__(self, fname):
+        self.fname = fname
+        self._mm = np.memmap(fname, dtype=np.uint8, mode='r')
+        header = HEADER.unpack(self._mm[:HEADER.size].tobytes())
+        magic, version, _, self.nplanes, self.ntel, nids, ncodes = header
+        if magic != MAGIC:
+            raise IOError('{} is not an l2pGUI archive'.format(fname))
+        if version != VERSION:
+            raise IOError('{}: unsupported archive version {}'.format(
+                          fname, version))
+        for name, dtype, shape, offset in _layout(self.nplanes, self.ntel,
+                                                  nids, ncodes):
+            setattr(self, name, np.ndarray(shape, dtype, buffer=self._mm,
+                                           offset=offset))
+
+    def __len__(self):
+        return self.nplanes
+
+    def planeRecords(self, start=0, stop=None):
+        """Plane rows start:stop as a PLANE_DTYPE record array"""
+        stop = self.nplanes if stop is None else min(stop, self.nplanes)
+        start = min(start, stop)
+        rec = np.empty(stop - start, beacons.PLANE_DTYPE)
+        for name, _, _ in PLANE_COLUMNS:
+            rec[name] = getattr(self, name)[start:stop]
+        rec['id'] = self.ids[self.id[start:stop]]
+        rec['code'] = self.codes[self.code[start:stop]]
+        return rec
+
+    def telLines(self, start=0, stop=None, rows=False):
+        """Telescope lines found among plane rows start:stop.
+
+        If rows is True, also return the number of plane rows preceding
+        each of them, counted from start.
+        """
+        if stop is None or stop >= self.nplanes:
+            stop = self.nplanes + 1
+        i, j = np.searchsorted(self.tel_row, (start, stop))
+        if rows:
+            return self.tel_line[i:j].tolist(), self.tel_row[i:j] - start
+        return self.tel_line[i:j].tolist()
+
+    def read(self, pos=0, N_lines=140, rows=False):
+        """Reads N_lines plane rows starting at row pos.
+
+        Returns
+        -------
+        precs: PLANE_DTYPE record array
+        tlines: list of telescope lines
+        trows: (only if rows is True) number of plane rows preceding
+               each telescope line, counted from pos
+        pos: row to continue reading from
+        """
+        stop = min(pos + N_lines, self.nplanes)
+        if rows:
+            tlines, trows = self.telLines(pos, stop, rows=True)
+            return self.planeRecords(pos, stop), tlines, trows, stop
+        return self.planeRecords(pos, stop), self.telLines(pos, stop), stop
@@ -0,0 +1,248 @@
+#!/usr/bin/env python
+'''Parsing of listen2planes data lines.
+
+l2planes sends three kinds of lines, told apart by their number of fields:
+
+    plane (13)      56395 40400.326 4ca626 RYR8JT 50.97158 -0.61729 29525
+                    68.6683 280.17873692 7.16197030 -474.0 191.0 1088
+    telescope (6)   56692 41847.094 telscp 75.00 65.00 1
+    control (2)     CONN ERROR
+
+parse_lines finds the fields of a whole block of lines from its raw bytes
+and converts all the numeric fields of the plane lines at once, returning
+them as a Numpy record array with dtype PLANE_DTYPE. Units are those of
+the data lines (altitude in feet, range in km, azimuth and elevation in
+degrees).
+'''
+
+from itertools import compress
+
+import numpy as np
+
+
+PLANE_DTYPE = np.dtype([('mjd', 'f8'), ('epc', 'f8'), ('id', 'S6'),
+                        ('code', 'S8'), ('lat', 'f8'), ('lon', 'f8'),
+                        ('alt', 'f8'), ('ran', 'f8'), ('az', 'f8'),
+                        ('el', 'f8'), ('aux', 'f8', (3,))])
+
+# Number of fields of each kind of line
+PLANE_FIELDS = 13
+TEL_FIELDS = 6
+CTRL_FIELDS = 2
+
+# MJD of the Unix epoch (1970-01-01)
+MJD_UNIX = 40587
+
+
+# Which of the fields of a plane line are numbers
+_NUMERIC = np.ones(PLANE_FIELDS, dtype=bool)
+_NUMERIC[[2, 3]] = False
+
+
+def unixTime(mjd, epc):
+    """Beacon time (Unix seconds) from MJD and seconds of day"""
+    return (mjd - MJD_UNIX) * 86400. + epc
+
+
+def fieldBounds(block):
+    """Fields of a text block, found from its raw bytes: any byte up to
+    ' ' separates fields.
+
+    Parameters
+    ----------
+    block: string; lines are separated by '\n'
+
+    Returns
+    -------
+    starts, stops: offsets of the start and end of each field
+    counts: number of fields of each line
+    """
+    b = np.frombuffer(block, dtype=np.uint8)
+    word = b > 32
+    edges = np.flatnonzero(word[1:] != word[:-1]) + 1
+    if len(b) and word[0]:
+        edges = np.r_[0, edges]
+    if len(b) and word[-1]:
+        edges = np.r_[edges, len(b)]
+    starts, stops = edges[::2], edges[1::2]
+    newlines = np.flatnonzero(b == 10)
+    counts = np.diff(np.r_[0, np.searchsorted(starts, newlines), len(starts)])
+    return starts, stops, counts
+
+
+def tokensPerLine(block):
+    """Number of fields on each line of a text block, as parse_lines
+    counts them (see fieldBounds)"""
+    return fieldBounds(block)[2]
+
+
+def planeRecords(ptoks):
+    """Converts plane line fields to a PLANE_DTYPE record array.
+
+    Parameters
+    ----------
+    ptoks: flat list with the 13 fields of each plane line, one line
+           after another
+
+    Returns
+    -------
+    rec: record array with one element per plane line; lines with a
+         field that is not a number are left out
+    """
+    return _records(ptoks)[0]
+
+
+def _records(ptoks):
+    """planeRecords, also returning which lines were kept (None if all)"""
+    N = len(ptoks) // PLANE_FIELDS
+    rec = np.empty(N, PLANE_DTYPE)
+    if N == 0:
+        return rec, None
+    # Numpy converts all the numbers from a single string in one call
+    nums = ' '.join(compress(ptoks, np.tile(_NUMERIC, N)))
+    a = np.fromstring(nums, sep=' ')
+    good = None
+    if a.size != N * _NUMERIC.sum():
+        # Something that is not a number: convert line by line and
+        # leave out the lines that fail
+        a = np.empty((N, _NUMERIC.sum()))
+        good = np.ones(N, dtype=bool)
+        numeric = np.flatnonzero(_NUMERIC)
+        for i in xrange(N):
+            fields = ptoks[i * PLANE_FIELDS:(i + 1) * PLANE_FIELDS]
+            try:
+                a[i] = [float(fields[j]) for j in numeric]
+            except ValueError:
+                good[i] = False
+        rec, a = rec[good], a[good]
+        ptoks = [tok for tok, keep in zip(ptoks, np.repeat(good, PLANE_FIELDS))
+                 if keep]
+    a = a.reshape(len(rec), -1)
+    for col, name in enumerate(('mjd', 'epc', 'lat', 'lon', 'alt', 'ran',
+                                'az', 'el')):
+        rec[name] = a[:, col]
+    rec['aux'] = a[:, 8:]
+    rec['id'] = ptoks[2::PLANE_FIELDS]
+    rec['code'] = ptoks[3::PLANE_FIELDS]
+    return rec, good
+
+
+def _ranges(starts, stops):
+    """Indices of all the elements of the slices starts[i]:stops[i]"""
+    n = stops - starts
+    if len(n) == 0:
+        return np.zeros(0, dtype=int)
+    return np.repeat(starts - np.cumsum(n) + n, n) + np.arange(n.sum())
+
+
+def _gather(b, starts, stops, size):
+    """Fields b[starts[i]:stops[i]] of a byte array as strings of at
+    most size characters"""
+    idx = np.minimum(starts[:, None] + np.arange(size), len(b) - 1)
+    chars = b[idx]
+    chars[np.arange(size) >= (stops - starts)[:, None]] = 0
+    return chars.view('S{}'.format(size)).ravel()
+
+
+def _fieldRecords(block, starts, stops):
+    """Plane records of the plane lines of a block, converted one by
+    one from their fields (starts and stops as given by fieldBounds,
+    one row per line); also returns which lines were kept (None if
+    all)"""
+    return _records([block[i:j] for i, j in zip(starts.ravel(),
+                                                stops.ravel())])
+
+
+def parse_lines(data, rows=False):
+    """Sorts and parses a block of l2planes output in a single pass.
+
+    Lines are only told apart by the number of fields they have, which
+    is worked out from the raw bytes (any byte up to ' ' separates
+    fields). The id and code fields of the plane lines, and all the
+    other lines, are then blanked out, so that all the numbers of the
+    plane lines are converted by a single np.fromstring call.
+    
+    Parameters
+    ----------
+    data: a string holding one or several lines, or a list of lines
+    rows: if True, also return where the telescope lines were
+
+    Returns
+    -------
+    precs: PLANE_DTYPE record array with the plane lines (those with
+           fields that are not numbers are left out)
+    tlines: list of telescope lines
+    clines: list of control lines
+    trows: (only if rows is True) number of plane lines preceding each
+           telescope line
+    """
+    block = data if isinstance(data, str) else '\n'.join(data)
+    b = np.frombuffer(block, dtype=np.uint8)
+    starts, stops, counts = fieldBounds(block)
+    if len(starts) == 0:
+        if rows:
+            return planeRecords([]), [], [], np.zeros(0, dtype=int)
+        return planeRecords([]), [], []
+    newlines = np.flatnonzero(b == 10)
+    isplane = counts == PLANE_FIELDS
+    allplane = (counts[~isplane] == 0).all()
+    if not allplane:
+        keep = np.repeat(isplane, counts)
+        starts, stops = starts[keep], stops[keep]
+    starts = starts.reshape(-1, PLANE_FIELDS)
+    stops = stops.reshape(-1, PLANE_FIELDS)
+    N = len(starts)
+
+    # Numbers of the plane lines only
+    numbers = b.copy()
+    # Separators are any byte up to ' ', which fromstring would not
+    # all take as such
+    numbers[numbers <= 32] = 32
+    numbers[_ranges(starts[:, 2], starts[:, 4])] = 32
+    if not allplane:
+        other = np.flatnonzero(~isplane & (counts > 0))
+        line_starts = np.r_[0, newlines + 1]
+        line_stops = np.r_[newlines, len(b)]
+        numbers[_ranges(line_starts[other], line_stops[other])] = 32
+    a = np.fromstring(numbers.tostring(), sep=' ')
+    lines = None
+    if a.size == N * _NUMERIC.sum():
+        precs, good = np.empty(N, PLANE_DTYPE), None
+        a = a.reshape(N, -1)
+        for col, name in enumerate(('mjd', 'epc', 'lat', 'lon', 'alt', 'ran',
+                                    'az', 'el')):
+            precs[name] = a[:, col]
+        precs['aux'] = a[:, 8:]
+        precs['id'] = _gather(b, starts[:, 2], stops[:, 2], 6)
+        precs['code'] = _gather(b, starts[:, 3], stops[:, 3], 8)
+    else:
+        # Something that is not a number: go line by line
+        precs, good = _fieldRecords(block, starts, stops)
+
+    tlines, clines = [], []
+    other = np.flatnonzero((counts == TEL_FIELDS) | (counts == CTRL_FIELDS))
+    if len(other):
+        lines = lines or block.split('\n')
+        for i in other:
+            if counts[i] == TEL_FIELDS:
+                tlines.append(lines[i])
+            else:
+                clines.append(lines[i])
+    if rows:
+        if good is not None:
+            isplane[np.flatnonzero(isplane)[~good]] = False
+        before = np.cumsum(isplane) - isplane
+        trows = before[counts == TEL_FIELDS]
+        return precs, tlines, clines, trows
+    return precs, tlines, clines
+
+
+def formatRecords(precs):
+    """Plane records back to l2planes plane lines.
+
+    Numbers are written with as many decimals as l2planes uses, so the
+    lines parse back to the same values.
+    """
+    fmt = ('{:.12g} {:.3f} {} {} {:.5f} {:.5f} {:.12g} {:.4f} {:.8f} '
+           '{:.8f} {:.12g} {:.12g} {:.12g}')
+    return [fmt.format(*(tuple(r)[:-1] + tuple(r[-1]))) for r in precs]
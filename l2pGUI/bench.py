@@ -0,0 +1,565 @@
+#!/usr/bin/env python
+'''Micro-benchmarks for the l2pGUI data paths.
+
+These are not needed to run the display; they exist to keep an eye on
+memory use and throughput of the core data structures. Run as:
+
+    python bench.py [name ...]
+
+with no arguments all benchmarks are run.
+'''
+
+import os
+import sys
+import gzip
+import time
+import shutil
+import tempfile
+import multiprocessing
+
+import numpy as np
+
+import beacons
+import tracks
+import archive
+import replay
+import merge
+import sunmoon
+import ephem
+import jdates
+import conflicts
+import predict
+import coords
+import loader
+import shmring
+
+
+def fakeLines(n_planes, n_points, t0=40000.0):
+    """Synthetic l2planes plane lines, n_points beacons (one a second
+    from second t0 of MJD 56395) for each of n_planes; the tests use
+    them too"""
+    lines = []
+    for k in xrange(n_points):
+        for j in xrange(n_planes):
+            lines.append('56395 {:.3f} {:06x} RYR{:04d} 50.97158 -0.61729 '
+                         '29525 68.6683 {:.5f} {:.5f} -474.0 191.0 1088'
+                         .format(t0 + k, j, j % 10000,
+                                 (j * 7.3) % 360, 5 + (k + j) % 60))
+    return lines
+
+
+def _list_sizeof(values):
+    """Approximate memory of a list of floats (list plus boxed floats)"""
+    return sys.getsizeof(values) + sum(sys.getsizeof(v) for v in values)
+
+
+def bench_tracks(n_planes=200, n_points=500):
+    """Compares TrackBuffer against the previous per-plane Python lists"""
+    rows = [(56395., 40000. + k, 50.9, -0.6, 9000., 68.6, 4.8, 7.1)
+            for k in xrange(n_points)]
+
+    t0 = time.time()
+    lists = []
+    for j in xrange(n_planes):
+        cols = [[] for c in tracks.COLUMNS]
+        for row in rows:
+            for col, v in zip(cols, row):
+                col.append(v)
+        lists.append(cols)
+    t_lists = time.time() - t0
+
+    t0 = time.time()
+    bufs = []
+    for j in xrange(n_planes):
+        buf = tracks.TrackBuffer()
+        for row in rows:
+            buf.append(row)
+        bufs.append(buf)
+    t_bufs = time.time() - t0
+
+    # Memory of one plane, built from fresh floats as parsing would do
+    one = [[float(repr(v)) for v in col] for col in zip(*rows)]
+    m_lists = sum(_list_sizeof(col) for col in one)
+    m_bufs = bufs[0].nbytes
+
+    # Per-frame access: slicing the trails alone, and as done by
+    # trails.TrackArtists, which needs the az/el of all the trails as
+    # one array to project them at once
+    N = 100
+    t0 = time.time()
+    for i in xrange(N):
+        [(c[6][-80::5], c[7][-80::5]) for c in lists]
+    t_flist = (time.time() - t0) / N
+    t0 = time.time()
+    for i in xrange(N):
+        [(b.column(6)[-80::5], b.column(7)[-80::5]) for b in bufs]
+    t_fbufs = (time.time() - t0) / N
+    t0 = time.time()
+    for i in xrange(N):
+        az, el = [], []
+        for cols in lists:
+            az.extend(cols[6][-80::5])
+            el.extend(cols[7][-80::5])
+        np.column_stack((az, el))
+    t_alist = (time.time() - t0) / N
+    t0 = time.time()
+    for i in xrange(N):
+        az, el = np.concatenate([b.recent(80)[6:8, ::5] for b in bufs],
+                                axis=1)
+        np.column_stack((az, el))
+    t_abufs = (time.time() - t0) / N
+
+    npts = n_planes * n_points
+    print('tracks: {} planes x {} points'.format(n_planes, n_points))
+    print('  memory/plane   lists {:8.1f} kB   buffer {:8.1f} kB'.format(
+          m_lists / 1e3, m_bufs / 1e3))
+    print('  append rate    lists {:8.0f} k/s  buffer {:8.0f} k/s'.format(
+          npts / t_lists / 1e3, npts / t_bufs / 1e3))
+    print('  frame slicing  lists {:8.3f} ms   buffer {:8.3f} ms'.format(
+          t_flist * 1e3, t_fbufs * 1e3))
+    print('  frame arrays   lists {:8.3f} ms   buffer {:8.3f} ms'.format(
+          t_alist * 1e3, t_abufs * 1e3))
+
+
+def bench_retention(n_planes=20, n_points=100000, keep=1000, chunk=10):
+    """Memory of long tracks with and without a Retention policy"""
+    recs = beacons.parse_lines(fakeLines(n_planes, n_points // 100))[0]
+    print('retention: {} planes x {} points'.format(n_planes, n_points))
+    for retention in (None, tracks.Retention(max_points=keep)):
+        P = {}
+        t0 = time.time()
+        for k in xrange(100):
+            recs['epc'] += n_points // 100
+            for start in xrange(0, len(recs), chunk * n_planes):
+                P = tracks.addPlanes(recs[start:start + chunk * n_planes], P,
+                                     retention=retention)
+        wall = time.time() - t0
+        print('  keep {:>6s}    {:8.1f} kB/plane  {:8.0f} k points/s'.format(
+              str(keep) if retention else 'all',
+              sum(p._track.nbytes for p in P.values()) / 1e3 / n_planes,
+              n_planes * n_points / wall / 1e3))
+
+
+def bench_parse(n_planes=300, n_points=500):
+    """Compares parse_lines against splitting and converting line by line"""
+    lines = fakeLines(n_planes, n_points)
+    block = '\n'.join(lines) + '\n'
+
+    # What loading used to do: split, float() and list appends per line
+    t0 = time.time()
+    P = {}
+    for line in lines:
+        l = line.split()
+        if len(l) == 13 and float(l[9]) > -5:
+            cols = P.setdefault(l[2], [[] for c in tracks.COLUMNS])
+            for col, v in zip(cols, (0, 1, 4, 5, 6, 7, 8, 9)):
+                col.append(float(l[v]))
+    t_lines = time.time() - t0
+
+    t0 = time.time()
+    beacons.parse_lines(block)
+    t_block = time.time() - t0
+
+    t0 = time.time()
+    tracks.addPlanes(beacons.parse_lines(block)[0], {})
+    t_add = time.time() - t0
+
+    print('parse: {} lines, {:.1f} MB'.format(len(lines), len(block) / 1e6))
+    for name, t in (('line by line', t_lines), ('parse_lines', t_block),
+                    ('+ addPlanes', t_add)):
+        print('  {:14s} {:8.0f} k lines/s'.format(name, len(lines) / t / 1e3))
+
+
+def bench_replay(n_planes=300, n_points=500, window=60, n_split=3):
+    """Replay throughput in simulated seconds per wall second, reading
+    'window' seconds of data per frame as fast as possible, from a text
+    dump, an archive and the same beacons split into n_split gzipped
+    dumps (merged while replaying)"""
+    tmpdir = tempfile.mkdtemp()
+    dump = os.path.join(tmpdir, 'dump.txt')
+    arch = os.path.join(tmpdir, 'dump.l2pa')
+    split = os.path.join(tmpdir, 'split')
+    os.mkdir(split)
+    lines = fakeLines(n_planes, n_points)
+    with open(dump, 'w') as f:
+        f.write(' \n'.join(lines) + ' \n')
+    archive.convertDump(dump, arch)
+    for k in xrange(n_split):
+        f = gzip.open(os.path.join(split, 'rx{}.txt.gz'.format(k)), 'wb')
+        f.write(' \n'.join(lines[k::n_split]) + ' \n')
+        f.close()
+    print('replay: {} planes x {} s, {}s per frame'.format(n_planes, n_points,
+                                                          window))
+    for fname in (dump, arch, split):
+        source = replay.openReplay(fname)
+        t = source.start
+        P = {}
+        t0 = time.time()
+        while not source.finished:
+            t += window
+            P = tracks.addPlanes(source.readUntil(t)[0], P, time_alive=15)
+        wall = time.time() - t0
+        label = (os.path.splitext(fname)[1][1:] or
+                 '{} x gz'.format(n_split))
+        print('  {:7s} {:8.0f} simulated s per wall s'.format(
+              label, (t - source.start) / wall))
+    shutil.rmtree(tmpdir)
+
+
+def bench_merge(n_planes=300, n_points=500, n_sources=3, chunk=3000):
+    """Merge rate of the same beacons received from several sources
+    with slightly different timestamps"""
+    precs = beacons.parse_lines(fakeLines(n_planes, n_points))[0]
+    rng = np.random.RandomState(0)
+    streams = []
+    for k in xrange(n_sources):
+        s = precs.copy()
+        s['epc'] += rng.uniform(-0.03, 0.03, len(s))
+        streams.append(s)
+    merger = merge.Merger()
+    n = 0
+    t0 = time.time()
+    for start in xrange(0, len(precs), chunk):
+        for k, s in enumerate(streams):
+            merger.push(k, s[start:start + chunk])
+        n += len(merger.pop())
+    n += len(merger.flush())
+    wall = time.time() - t0
+    print('merge: {} sources x {} beacons'.format(n_sources, len(precs)))
+    print('  merged         {:8.0f} k beacons/s ({} unique)'.format(
+          n_sources * len(precs) / wall / 1e3, n))
+
+
+def _ring_producer(ring, chunk, n_chunks):
+    for k in xrange(n_chunks):
+        ring.put(chunk)
+
+
+def _queue_producer(queue, lines, n_chunks):
+    for k in xrange(n_chunks):
+        queue.put(lines)
+    queue.put(None)
+
+
+def bench_ring(n_records=2000000, chunk=1000, n_lines=200000):
+    """Records per second from a producer process to this one, through
+    a shmring.BeaconRing and, as lines, through a multiprocessing.Queue"""
+    lines = fakeLines(chunk, 1)
+    recs = beacons.parse_lines(lines)[0]
+    ring = shmring.BeaconRing()
+    proc = multiprocessing.Process(target=_ring_producer,
+                                   args=(ring, recs, n_records // chunk))
+    n = 0
+    t0 = time.time()
+    proc.start()
+    while n + ring.dropped < n_records:
+        n += len(ring.drain())
+    t_ring = time.time() - t0
+    proc.join()
+
+    queue = multiprocessing.Queue()
+    proc = multiprocessing.Process(target=_queue_producer,
+                                   args=(queue, lines, n_lines // chunk))
+    m = 0
+    t0 = time.time()
+    proc.start()
+    for block in iter(queue.get, None):
+        m += len(block)
+    t_queue = time.time() - t0
+    proc.join()
+    print('ring: {} records in chunks of {}'.format(n_records, chunk))
+    print('  BeaconRing     {:8.0f} k records/s received, {} dropped'.format(
+          n / t_ring / 1e3, ring.dropped))
+    print('  Queue (lines)  {:8.0f} k lines/s'.format(m / t_queue / 1e3))
+
+
+def bench_expiry(n_planes=10000, n_frames=200, per_frame=500, time_alive=15):
+    """Cost of removing stale planes per frame with n_planes tracked:
+    scanning the whole dictionary against the PlaneDict expiry heap"""
+    recs = beacons.parse_lines(fakeLines(n_planes, 1))[0]
+    rng = np.random.RandomState(0)
+    frames = []
+    for k in xrange(n_frames):
+        block = recs[rng.randint(0, n_planes, per_frame)]
+        block['epc'] = 40001. + k
+        frames.append(block)
+
+    # What addPlanes used to do after each update
+    P = tracks.addPlanes(recs, {})
+    t_scan = 0.
+    for block in frames:
+        P = tracks.addPlanes(block, P)
+        t0 = time.time()
+        last_epoch = block['epc'][-1]
+        for key in [k for k, v in P.iteritems()
+                    if abs(last_epoch - v.last_epoch) > time_alive]:
+            del P[key]
+        t_scan += time.time() - t0
+
+    P = tracks.PlaneDict(tracks.addPlanes(recs, {}))
+    t_heap = 0.
+    for block in frames:
+        P = tracks.addPlanes(block, P)
+        t0 = time.time()
+        for key in set(block['id']):
+            P.touch(key)
+        P.now = beacons.unixTime(block['mjd'], block['epc']).max()
+        P.expire(time_alive)
+        t_heap += time.time() - t0
+
+    print('expiry: {} planes, {} updated per frame'.format(n_planes,
+                                                           per_frame))
+    print('  dict scan      {:8.3f} ms/frame'.format(t_scan / n_frames * 1e3))
+    print('  expiry heap    {:8.3f} ms/frame'.format(t_heap / n_frames * 1e3))
+
+
+def bench_render(n_old=25, n_new=500, n_points=200, n_frames=50):
+    """Blitted frame time: one Line2D per plane (as the display used to
+    draw, limited to 25 planes) against trails.TrackArtists"""
+    from matplotlib import cm
+    from matplotlib.figure import Figure
+    from matplotlib.backends.backend_agg import FigureCanvasAgg
+    import trails
+
+    def axes():
+        fig = Figure(figsize=(6, 6))
+        canvas = FigureCanvasAgg(fig)
+        ax = fig.add_subplot(111, projection='polar')
+        ax.set_ylim(0, 90)
+        canvas.draw()
+        return canvas, ax, canvas.copy_from_bbox(fig.bbox)
+
+    def planes(n):
+        # Planes scattered over the sky, moving a fraction of a degree
+        # per second (as seen from the ground)
+        rng = np.random.RandomState(0)
+        recs = np.zeros(n * n_points, beacons.PLANE_DTYPE)
+        k = np.arange(n_points)
+        for j in xrange(n):
+            rec = recs[j * n_points:(j + 1) * n_points]
+            rec['id'] = '{:06x}'.format(j)
+            rec['epc'] = 40000. + k
+            rec['az'] = rng.uniform(0, 360) + rng.uniform(-0.2, 0.2) * k
+            rec['el'] = np.clip(rng.uniform(5, 80) +
+                                rng.uniform(-0.05, 0.05) * k, 1, 89)
+        return tracks.addPlanes(recs, {}).values()
+
+    canvas, ax, background = axes()
+    lines = sum((ax.plot([], [], lw=4, markeredgewidth=0)
+                 for n in xrange(n_old)), [])
+    points = ax.plot([], [], 'o', markeredgewidth=0, ms=6, color='w')[0]
+    P = planes(n_old)
+    t0 = time.time()
+    for i in xrange(n_frames):
+        canvas.restore_region(background)
+        for line, p in zip(lines, P):
+            line.set_data(p.az[-80::5], 90 - p.el[-80::5])
+            line.set_color(cm.jet((p.el[-1] + 5) / 100))
+            ax.draw_artist(line)
+        points.set_data([p.az[-1] for p in P], [90 - p.el[-1] for p in P])
+        ax.draw_artist(points)
+    t_old = (time.time() - t0) / n_frames
+
+    canvas, ax, background = axes()
+    artists = trails.TrackArtists(ax)
+    P = planes(n_new)
+    t0 = time.time()
+    for i in xrange(n_frames):
+        canvas.restore_region(background)
+        artists.update(P)
+        for artist in artists.artists:
+            ax.draw_artist(artist)
+    t_new = (time.time() - t0) / n_frames
+
+    # Every plane carrying on with a new point every frame, as when live
+    t_moving = 0.
+    for i in xrange(n_frames):
+        for p in P:
+            rec = np.zeros(1, beacons.PLANE_DTYPE)
+            rec['id'] = p.id
+            for name in ('epc', 'az', 'el'):
+                track = getattr(p, name)
+                rec[name] = 2 * track[-1] - track[-2]
+            rec['az'] *= 180 / np.pi
+            p.addRecords(rec)
+        t0 = time.time()
+        canvas.restore_region(background)
+        artists.update(P)
+        for artist in artists.artists:
+            ax.draw_artist(artist)
+        t_moving += time.time() - t0
+    t_moving /= n_frames
+
+    print('render: {} frames'.format(n_frames))
+    print('  {:4d} Line2D     {:8.2f} ms/frame'.format(n_old, t_old * 1e3))
+    print('  {:4d} collection {:8.2f} ms/frame'.format(n_new, t_new * 1e3))
+    print('       all moving {:8.2f} ms/frame'.format(t_moving * 1e3))
+
+
+def bench_ephem(n_scalar=2000, n_day=86400):
+    """Sun and Moon az/el for a day at 1 s resolution: sunmoon scalar
+    functions (timed on n_scalar instants) against the Numpy versions
+    and the interpolating ephem.Ephemeris"""
+    JD = 2456395.5 + np.arange(n_day) / float(n_day)
+    t0 = time.time()
+    for j in JD[:n_scalar]:
+        sunmoon.sunazel(j)
+        sunmoon.moonazel(j)
+    t_scalar = (time.time() - t0) / n_scalar * n_day
+    t0 = time.time()
+    sunmoon.sunazel_vec(JD)
+    sunmoon.moonazel_vec(JD)
+    t_vec = time.time() - t0
+    # One query at a time, as the display does
+    e = ephem.Ephemeris(50.867387222, 0.33612916666, 75.357)
+    t = (JD[:n_scalar] - 2440587.5) * 86400
+    t0 = time.time()
+    for tk in t:
+        e.sunazel(tk)
+        e.moonazel(tk)
+    t_cached = (time.time() - t0) / n_scalar * n_day
+    print('ephem: Sun and Moon at {} instants'.format(n_day))
+    print('  scalar         {:8.2f} s (extrapolated)'.format(t_scalar))
+    print('  numpy          {:8.3f} s'.format(t_vec))
+    print('  Ephemeris      {:8.2f} s (extrapolated, one at a time)'.format(
+          t_cached))
+
+
+def bench_jdates(n=10**6, n_scalar=20000):
+    """(MJD, seconds of day) to JD and JD to calendar dates for n
+    timestamps: jdates scalar functions (timed on n_scalar of them)
+    against the array versions"""
+    rng = np.random.RandomState(0)
+    mjd = rng.randint(50000, 60000, n)
+    epc = rng.uniform(0, 86400, n)
+    t0 = time.time()
+    for m, e in zip(mjd[:n_scalar].tolist(), epc[:n_scalar].tolist()):
+        jdates.jd2gcal(m + 2400000.5 + e / 86400)
+    t_scalar = (time.time() - t0) / n_scalar * n
+    t0 = time.time()
+    jdates.jd2gcal_vec(jdates.mjd2jd(mjd, epc))
+    t_vec = time.time() - t0
+    print('jdates: {} timestamps to calendar dates'.format(n))
+    print('  scalar         {:8.2f} s (extrapolated)'.format(t_scalar))
+    print('  numpy          {:8.3f} s'.format(t_vec))
+
+
+def bench_conflicts(n_planes=(500, 5000, 50000), n_queries=10, repeat=20):
+    """Planes near the telescope: a single vectorised pass per query
+    against the grid, with n_queries directions per update"""
+    rng = np.random.RandomState(0)
+    print('conflicts: {} queries per update'.format(n_queries))
+    for n in n_planes:
+        az = rng.uniform(0, 2 * np.pi, n)
+        el = np.arcsin(rng.uniform(0, 1, n))
+        taz = rng.uniform(0, 2 * np.pi, n_queries)
+        tel = rng.uniform(0, np.pi / 2, n_queries)
+        times = []
+        for grid_min in (n + 1, 0):
+            check = conflicts.ConflictCheck(grid_min=grid_min)
+            t0 = time.time()
+            for k in xrange(repeat):
+                check.update(az, el)
+                for a, e in zip(taz, tel):
+                    check.level(a, e)
+            times.append((time.time() - t0) / repeat)
+        print('  {:6d} planes   single pass {:7.2f} ms   grid {:7.2f} ms'
+              .format(n, times[0] * 1e3, times[1] * 1e3))
+
+
+def bench_predict(n_planes=500, n_points=60):
+    """Alpha-beta filter updates per beacon, and closest approach of
+    all the planes to the telescope over the next 2 minutes"""
+    station = coords.Station(50.867387222, 0.33612916666, 75.357)
+    recs = beacons.parse_lines(fakeLines(n_planes, n_points))[0]
+    p = predict.Predictor(station)
+    t0 = time.time()
+    for k in xrange(0, len(recs), n_planes):
+        p.update(recs[k:k + n_planes])
+    t_update = (time.time() - t0) / len(recs)
+    N = 20
+    t0 = time.time()
+    for k in xrange(N):
+        p.closestApproach(1., 0.5)
+    t_ca = (time.time() - t0) / N
+    print('predict: {} planes'.format(n_planes))
+    print('  update         {:8.2f} us/beacon'.format(t_update * 1e6))
+    print('  closest appr.  {:8.2f} ms'.format(t_ca * 1e3))
+
+
+def bench_load(n_planes=500, n_points=2000, blocksize=2**22):
+    """Offline loading of a text dump: loadPlanesFile against the
+    parallel loader with increasing numbers of workers"""
+    from l2pGUI import loadPlanesFile
+    tmpdir = tempfile.mkdtemp()
+    dump = os.path.join(tmpdir, 'dump.txt')
+    with open(dump, 'w') as f:
+        f.write(' \n'.join(fakeLines(n_planes, n_points)) + ' \n')
+    print('load: {} planes x {} points ({:.0f} MB)'.format(
+          n_planes, n_points, os.path.getsize(dump) / 1e6))
+    ncpu = multiprocessing.cpu_count()
+    counts = [1] + [w for w in sorted(set([2, 4, ncpu])) if 1 < w <= ncpu]
+    for workers in counts:
+        t0 = time.time()
+        if workers == 1:
+            loadPlanesFile(dump, blocksize=blocksize)
+        else:
+            loader.loadParallel(dump, workers=workers, blocksize=blocksize)
+        wall = time.time() - t0
+        print('  {:2d} worker{}     {:8.2f} s'.format(
+              workers, 's' if workers > 1 else ' ', wall))
+    t0 = time.time()
+    loader.loadParallel(dump, workers=1, blocksize=blocksize)
+    print('  pool of 1      {:8.2f} s'.format(time.time() - t0))
+    shutil.rmtree(tmpdir)
+
+
+def bench_export(n_planes=100, n_points=1800, speed=60, fps=10):
+    """Headless export of a replay to PNG frames, and the time a day of
+    data would take at the same rate"""
+    import export
+    tmpdir = tempfile.mkdtemp()
+    dump = os.path.join(tmpdir, 'dump.txt')
+    with open(dump, 'w') as f:
+        f.write(' \n'.join(fakeLines(n_planes, n_points)) + ' \n')
+    station = (50.867387222, 0.33612916666, 75.357)
+    t0 = time.time()
+    n = export.exportReplay(dump, os.path.join(tmpdir, 'frames'), station,
+                            speed=speed, fps=fps)
+    wall = time.time() - t0
+    day = 86400. / speed * fps
+    print('export: {} planes, {} s of data, {} frames'.format(
+          n_planes, n_points, n))
+    print('  PNG frames     {:8.1f} frames/s'.format(n / wall))
+    print('  a day          {:8.1f} min ({:.0f} frames)'.format(
+          day * wall / n / 60, day))
+    shutil.rmtree(tmpdir)
+
+
+BENCHMARKS = [
+    ('tracks', bench_tracks),
+    ('retention', bench_retention),
+    ('parse', bench_parse),
+    ('replay', bench_replay),
+    ('merge', bench_merge),
+    ('ring', bench_ring),
+    ('expiry', bench_expiry),
+    ('render', bench_render),
+    ('ephem', bench_ephem),
+    ('jdates', bench_jdates),
+    ('conflicts', bench_conflicts),
+    ('predict', bench_predict),
+    ('load', bench_load),
+    ('export', bench_export),
+    ]
+
+
+def main(argv=None):
+    names = sys.argv[1:] if argv is None else argv
+    for name, func in BENCHMARKS:
+        if not names or name in names:
+            func()
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,148 @@
+#!/usr/bin/env python
+'''Telescope-aircraft conflict detection on the client side.
+
+The alert flag in the telescope lines is computed by l2pserver; this
+module gives an independent check from the plane positions themselves.
+ConflictCheck takes the current azimuth and elevation of all the
+planes in one go and finds those within given angular radii of the
+telescope pointing (or of any other direction).
+
+Directions are handled as unit vectors, so the separation is the
+great-circle distance, with no special cases at azimuth 0/360 or at
+the zenith. One query is a single vectorised pass over all the planes.
+When the same positions are queried more than once (e.g. for several
+telescopes) and there are many planes, they are binned in a uniform
+grid of cells as large as the largest radius, and further queries only
+look at the planes in the 27 cells around the queried direction.
+
+Binning costs about one and a half single passes (it sorts the planes
+by cell), so the first query after every update is always a single
+pass. L2pRadar makes one query per frame and never uses the grid: with
+one query per set of positions nothing beats a single pass.
+'''
+
+import numpy as np
+
+
+# Default alert and warning radii (degrees)
+RADII = (5., 10.)
+
+
+def unitVectors(az, el):
+    """Unit vectors (rows) of azimuths and elevations (radians)"""
+    cel = np.cos(el)
+    return np.column_stack((cel * np.cos(az), cel * np.sin(az), np.sin(el)))
+
+
+def separation(az1, el1, az2, el2):
+    """Great-circle separation (radians) between directions given by
+    azimuth and elevation (radians; numbers or arrays).
+
+    Haversine formula, accurate also for small separations."""
+    h = (np.sin((el2 - el1) / 2)**2 +
+         np.cos(el1) * np.cos(el2) * np.sin((az2 - az1) / 2)**2)
+    return 2 * np.arcsin(np.sqrt(np.clip(h, 0, 1)))
+
+
+def configRadii(config):
+    """Alert and warning radii (degrees) from the optional alert_radius
+    and warning_radius options of the [Telescope] section"""
+    radii = list(RADII)
+    for i, key in enumerate(('alert_radius', 'warning_radius')):
+        if config.has_option('Telescope', key):
+            radii[i] = config.getfloat('Telescope', key)
+    return tuple(radii)
+
+
+class ConflictCheck(object):
+    """Planes close to a direction in the sky.
+
+    Parameters
+    ----------
+    radii: angular radii (degrees), smallest first, e.g. alert and
+           warning distances
+    grid_min: number of planes from which they are binned in a grid
+              (from the second query after every update; queries with a
+              radius larger than the largest of radii never use it)
+    """
+    def __init__(self, radii=RADII, grid_min=2000):
+        self.radii = sorted(radii)
+        self.grid_min = grid_min
+        # Chord lengths of the radii
+        self._chords = 2 * np.sin(np.radians(self.radii) / 2)
+        self._cell = self._chords[-1]
+        self._ncells = int(np.ceil(2 / self._cell)) + 3
+        self.update([], [])
+
+    def update(self, az, el):
+        """Sets the current positions (radians) of the planes"""
+        self.v = unitVectors(np.asarray(az, dtype=float),
+                             np.asarray(el, dtype=float))
+        self._order = None
+        self._queries = 0
+
+    def _grid(self):
+        """Bins the planes in the grid (sorts them by cell number)"""
+        keys = self._keys(self.v)
+        self._order = np.argsort(keys, kind='mergesort')
+        self._keys_sorted = keys[self._order]
+
+    def _keys(self, v):
+        """Grid cell numbers of unit vectors"""
+        n = self._ncells
+        k = np.floor(v / self._cell).astype(np.int64) + n // 2
+        return (k[:, 0] * n + k[:, 1]) * n + k[:, 2]
+
+    def _candidates(self, v, wide=False):
+        """Indices of the planes in the cells around unit vector v (of
+        all of them if wide is True, for radii larger than the cells)"""
+        self._queries += 1
+        if wide:
+            return np.arange(len(self.v))
+        if self._order is None:
+            # Binning costs more than a brute force query
+            if self._queries < 2 or len(self.v) < self.grid_min:
+                return np.arange(len(self.v))
+            self._grid()
+        n = self._ncells
+        d = np.arange(-1, 2)
+        centre = self._keys(v[None, :])[0]
+        cells = (centre + (d[:, None, None] * n + d[None, :, None]) * n +
+                 d[None, None, :]).ravel()
+        lo = np.searchsorted(self._keys_sorted, cells, side='left')
+        hi = np.searchsorted(self._keys_sorted, cells, side='right')
+        hit = hi > lo
+        if not hit.any():
+            return np.zeros(0, dtype=int)
+        return np.concatenate([self._order[i:j]
+                               for i, j in zip(lo[hit], hi[hit])])
+
+    def near(self, az, el, radius=None):
+        """Planes within radius (degrees; default the largest of radii)
+        of the direction az, el (radians).
+
+        Returns
+        -------
+        indices: plane numbers (in the order given to update), closest
+                 first
+        sep: their separations (radians)
+        """
+        v = unitVectors(az, el)[0]
+        limit = (self._chords[-1] if radius is None else
+                 2 * np.sin(np.radians(radius) / 2))
+        idx = self._candidates(v, wide=limit > self._chords[-1])
+        chord = np.sqrt(((self.v[idx] - v)**2).sum(axis=1))
+        inside = chord <= limit
+        idx, chord = idx[inside], chord[inside]
+        order = np.argsort(chord)
+        return idx[order], 2 * np.arcsin(np.minimum(chord[order] / 2, 1))
+
+    def level(self, az, el):
+        """Number of the smallest radius with a plane inside it (0 for
+        the first one), or None if no plane is within any of them, and
+        the plane numbers within the largest radius, closest first"""
+        idx, sep = self.near(az, el)
+        if len(idx) == 0:
+            return None, idx
+        level = np.searchsorted(np.radians(self.radii), sep[0])
+        return int(level), idx
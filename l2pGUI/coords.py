@@ -0,0 +1,157 @@
+#!/usr/bin/env python
+'''Functions to rotate from geodetic coordinates to Az/El.
+
+Numpy versions of the functions in coords_math.py: the same
+calculations, but any of the arguments can be an array (coordinates
+of many points and/or many stations), and the results are arrays of
+the broadcast shape.
+
+Station does the same for one fixed observing station, with its
+geocentric position and rotation matrix computed only once.
+'''
+import numpy as np
+
+
+D2R = np.pi / 180
+
+
+def geod2geo(Lat=50.867387222, Lon=0.33612916666, H=75.357):
+    '''Compute geocentric cartesian coordinates from geodetic
+    coordinates in WGS84 ellipsoid.
+
+    From the Explanatory Supplement to the Astronomical Almanac 1992
+
+    Parameters
+    ----------
+    Lat, Lon, H: latitude and longitude (degrees) and height (m)
+
+    Returns
+    -------
+    x, y, z: cartesian geocentric coordinates vector components (m)
+    '''
+    Lat = np.asarray(Lat, dtype=float) * D2R
+    Lon = np.asarray(Lon, dtype=float) * D2R
+    a = 6378137.0
+    f = 1 / 298.257223563
+    b = a * (1 - f)
+    e2 = (a**2 - b**2) / a**2
+    slat, clat = np.sin(Lat), np.cos(Lat)
+    N = a / np.sqrt(1 - e2 * slat**2)
+
+    x = (N + H) * clat * np.cos(Lon)
+    y = (N + H) * clat * np.sin(Lon)
+    z = (N * (1 - e2) + H) * slat
+    return x, y, z
+
+
+def geo2top(x, y, z, Lat=50.867387222, Lon=0.33612916666):
+    '''Rotate geocentric vector xyz to alt-az frame (see
+    coords_math.geo2top)
+    '''
+    Lat = np.asarray(Lat, dtype=float) * D2R
+    Lon = np.asarray(Lon, dtype=float) * D2R
+
+    clon = np.cos(Lon)
+    slon = np.sin(Lon)
+    clat = np.cos(Lat)
+    slat = np.sin(Lat)
+
+    v1 = slat*clon*x + slat*slon*y -clat*z
+    v2 = -slon*x +clon*y
+    v3 = clat*clon*x + clat*slon*y + slat*z
+    return -v1, v2, v3
+
+
+def top2azel(x, y, z):
+    '''Topocentric rectangular coordinates to azimuth and elevation
+    '''
+    h = np.sqrt(x**2 + y**2)
+    r = np.sqrt(x**2 + y**2 + z**2)
+    e = np.arctan2(z, h)
+    a = np.mod(np.arctan2(y, x), 2 * np.pi)
+    return a, e, r
+
+
+def geo2azel(x, y, z, Lat=50.867387222, Lon=0.33612916666, H=75.357):
+    '''Geocentric body-fixed (m) to azimuth and elevation
+    '''
+    X, Y, Z = geod2geo(Lat, Lon, H)
+    # Translate to topocentric origin
+    x = x - X
+    y = y - Y
+    z = z - Z
+    # Rotate to topocentric frame
+    x, y, z = geo2top(x, y, z, Lat, Lon)
+    a, e, r = top2azel(x, y, z)
+    return a, e, r
+
+
+class Station(object):
+    """Observing station, with its geocentric position and the rotation
+    to its topocentric frame computed once.
+
+    Parameters
+    ----------
+    lat, lon, height: geodetic latitude and longitude (degrees) and
+                      height (m) in WGS84
+    name: label for the station
+    """
+    def __init__(self, lat, lon, height, name=''):
+        self.lat, self.lon, self.height = lat, lon, height
+        self.name = name
+        self.origin = np.array(geod2geo(lat, lon, height), dtype=float)
+        # Rows are the geocentric X, Y, Z axes as seen in the
+        # topocentric frame (see geo2top)
+        clon, slon = np.cos(lon * D2R), np.sin(lon * D2R)
+        clat, slat = np.cos(lat * D2R), np.sin(lat * D2R)
+        self.rotation = np.array([[-slat * clon, -slat * slon, clat],
+                                  [-slon, clon, 0.],
+                                  [clat * clon, clat * slon, slat]])
+
+    @classmethod
+    def fromConfig(cls, config, section='Station'):
+        """Station from the lat, lon and height options of a
+        ConfigParser section"""
+        return cls(config.getfloat(section, 'lat'),
+                   config.getfloat(section, 'lon'),
+                   config.getfloat(section, 'height'),
+                   name=section[len('Station '):] or 'main')
+
+    def __repr__(self):
+        return 'Station({!r}, {}, {}, {})'.format(self.name, self.lat,
+                                                  self.lon, self.height)
+
+    def geo2top(self, x, y, z):
+        """Geocentric body-fixed coordinates (m) to topocentric ones
+        (m; X to the North, Y to the East, Z to the zenith)"""
+        R = self.rotation
+        x = np.asarray(x, dtype=float) - self.origin[0]
+        y = np.asarray(y, dtype=float) - self.origin[1]
+        z = np.asarray(z, dtype=float) - self.origin[2]
+        return (R[0, 0] * x + R[0, 1] * y + R[0, 2] * z,
+                R[1, 0] * x + R[1, 1] * y,
+                R[2, 0] * x + R[2, 1] * y + R[2, 2] * z)
+
+    def geo2azel(self, x, y, z):
+        """Geocentric body-fixed coordinates (m) to azimuth and 
+        elevation (radians) and range (m)"""
+        return top2azel(*self.geo2top(x, y, z))
+
+    def geod2top(self, lat, lon, height):
+        """Geodetic latitude and longitude (degrees) and height (m) to
+        topocentric coordinates (m)"""
+        return self.geo2top(*geod2geo(lat, lon, height))
+
+    def geod2azel(self, lat, lon, height):
+        """Geodetic latitude and longitude (degrees) and height (m) to
+        azimuth and elevation (radians) and range (m)"""
+        return self.geo2azel(*geod2geo(lat, lon, height))
+
+
+def stationList(config):
+    """Stations listed in a l2pGUI configuration: the [Station] section
+    first, then any sections named [Station <name>]"""
+    sections = [s for s in config.sections()
+                if s == 'Station' or s.startswith('Station ')]
+    sections.sort(key=lambda s: s != 'Station')
+    return [Station.fromConfig(config, s) for s in sections]
@@ -0,0 +1,365 @@
+#!/usr/bin/env python
+'''Writing and reading --dump2file files.
+
+DumpWriter takes the data lines as they are received and writes them
+from a background thread, so that a slow or stalled disk never holds up
+the receiver. Lines are collected for flush_every seconds and written
+in one go. Between the receiver and the thread there is a bounded
+queue: if the disk falls behind by more than that, new lines are
+dropped (and counted) rather than blocking the receiver or using
+unbounded memory.
+
+Dumps can be rotated: with rotate='hour' or 'day' the lines go to a new
+file every hour or day (UTC), named after the start of the period,
+
+    dump.txt  ->  dump-20130415-10.txt, dump-20130415-11.txt, ...
+                  (or dump-20130415.txt, dump-20130416.txt, ... daily)
+
+and with compress=True (or a file name ending in .gz) they are gzipped.
+Every write is appended as a complete gzip member, so the files can be
+read at any time, even while they are being written. gzipMembers finds
+where the members start, so that a reader can go straight to the one
+holding a given position instead of decompressing everything before it.
+
+On the reading side, dumpParts finds the files that make up a dump
+given the name it was written under, and openDump opens plain, gzip or
+bzip2 files alike, so replays and conversions read rotated and
+compressed dumps as if they were a single text file. dumpStreams does
+the same for all the dumps in a directory or matching a glob pattern
+(e.g. one per receiver), grouping the rotated files of each.
+'''
+
+import os
+import re
+import glob
+import bz2
+import gzip
+import time
+import zlib
+import Queue
+import threading
+
+import numpy as np
+
+
+# strftime formats of the rotation periods
+ROTATIONS = {'hour': '%Y%m%d-%H', 'day': '%Y%m%d'}
+GZIP_MAGIC = '\x1f\x8b'
+BZIP2_MAGIC = 'BZh'
+# Dump file names: root, rotation period (see partName) and extension,
+# and possibly a compression extension
+_PART = re.compile(r'(.*?)(?:-(\d{8})(?:-(\d{2}))?)?(\.[^.]*)?'
+                   r'(?:\.gz|\.bz2)?$')
+
+
+def _split(fname):
+    """Root and extension of a dump name, without any .gz extension"""
+    if fname.endswith('.gz'):
+        fname = fname[:-3]
+    return os.path.splitext(fname)
+
+
+def partName(fname, t, rotate=None, compress=False):
+    """Name of the file the lines of time t (Unix seconds) go to.
+
+    Parameters
+    ----------
+    fname: name of the dump, as given to --dump2file
+    t: time the lines were received
+    rotate: None, 'hour' or 'day' (see ROTATIONS)
+    compress: True for gzipped files
+    """
+    root, ext = _split(fname)
+    if rotate is not None:
+        root += '-' + time.strftime(ROTATIONS[rotate], time.gmtime(t))
+    return root + ext + ('.gz' if compress else '')
+
+
+def dumpParts(fname):
+    """Files making up the dump fname, in time order: fname itself if
+    it exists, otherwise its compressed and rotated versions (see
+    partName), or [fname] if there are none"""
+    if os.path.exists(fname):
+        return [fname]
+    root, ext = _split(fname)
+    folder, base = os.path.split(root)
+    pattern = re.compile(re.escape(base) + r'(?:-(\d{8})(?:-(\d{2}))?)?' +
+                         re.escape(ext) + r'(?:\.gz|\.bz2)?$')
+    parts = []
+    for name in os.listdir(folder or os.curdir):
+        m = pattern.match(name)
+        if m:
+            # Daily files before the hourly ones of the same day
+            parts.append((m.group(1) or '', m.group(2) or '',
+                          os.path.join(folder, name)))
+    return [p[-1] for p in sorted(parts)] or [fname]
+
+
+def dumpStreams(spec):
+    """Dumps named by spec, each as the list of its files in time order.
+
+    spec can be a dump name (see dumpParts), a directory (all the dumps
+    in it) or a glob pattern. Files named as rotated parts of the same
+    dump (see partName) are one dump, compressed or not; other files
+    are separate dumps. Replay indices (.idx) are left out."""
+    if os.path.isdir(spec):
+        names = [os.path.join(spec, name) for name in os.listdir(spec)
+                 if not name.startswith('.')]
+    elif glob.has_magic(spec):
+        names = glob.glob(spec)
+    else:
+        return [dumpParts(spec)]
+    streams = {}
+    for name in names:
+        if name.endswith('.idx') or not os.path.isfile(name):
+            continue
+        folder, base = os.path.split(name)
+        root, day, hour, ext = _PART.match(base).groups()
+        key = os.path.join(folder, root + (ext or ''))
+        streams.setdefault(key, []).append((day or '', hour or '', name))
+    return [[p[-1] for p in sorted(parts)]
+            for _, parts in sorted(streams.items())]
+
+
+def compression(fname):
+    """'gzip' or 'bzip2' for compressed files (by their contents),
+    otherwise None"""
+    with open(fname, 'rb') as f:
+        magic = f.read(3)
+    if magic.startswith(GZIP_MAGIC):
+        return 'gzip'
+    if magic == BZIP2_MAGIC:
+        return 'bzip2'
+    return None
+
+
+def gzipMembers(fname, chunk=2**20):
+    """Where the gzip members of a file start.
+
+    Returns two arrays: the decompressed offset and the offset in the
+    file of the start of every member. An incomplete last member (one
+    being written) is left as it is.
+    """
+    starts, raw = [0], [0]
+    size = pos = 0
+    d = zlib.decompressobj(16 + zlib.MAX_WBITS)
+    with open(fname, 'rb') as f:
+        data = f.read(chunk)
+        while data:
+            try:
+                size += len(d.decompress(data))
+            except zlib.error:
+                # Not a gzip member (e.g. trailing garbage)
+                if len(starts) > 1 and starts[-1] == size:
+                    del starts[-1], raw[-1]
+                break
+            if d.unused_data:
+                # The member ended within data; the rest starts the next
+                pos += len(data) - len(d.unused_data)
+                data = d.unused_data
+                starts.append(size)
+                raw.append(pos)
+                d = zlib.decompressobj(16 + zlib.MAX_WBITS)
+            else:
+                pos += len(data)
+                data = f.read(chunk)
+    return np.array(starts, dtype=np.int64), np.array(raw, dtype=np.int64)
+
+
+class _GzipMember(object):
+    """Reader of a gzip file from the start of one of its members.
+
+    tell and seek use decompressed offsets from the start of the file,
+    as for a gzip.GzipFile; seeks can only go forward.
+
+    Parameters
+    ----------
+    fname: gzip file name
+    start: decompressed offset of the member
+    raw: offset of the member in the file
+    """
+    def __init__(self, fname, start, raw):
+        self._raw = open(fname, 'rb')
+        self._raw.seek(raw)
+        self._gz = gzip.GzipFile(fileobj=self._raw, mode='rb')
+        self._start = start
+
+    def read(self, size=-1):
+        return self._gz.read(size)
+
+    def readline(self, size=-1):
+        return self._gz.readline(size)
+
+    def tell(self):
+        return self._start + self._gz.tell()
+
+    def seek(self, offset):
+        self._gz.seek(offset - self._start)
+
+    def close(self):
+        self._gz.close()
+        self._raw.close()
+
+
+def openDump(fname, offset=0, members=None):
+    """Opens a dump for reading, decompressing gzip and bzip2 files.
+
+    Parameters
+    ----------
+    fname: dump file name
+    offset: (decompressed) byte offset to start reading from
+    members: for gzip files, their member starts (see gzipMembers);
+             reading then starts at the member holding offset, instead
+             of decompressing the file from the beginning. Seeking in
+             bzip2 files always decompresses them from the beginning.
+    """
+    kind = compression(fname)
+    if kind == 'gzip' and members is not None and offset:
+        starts, raw = members
+        k = np.searchsorted(starts, offset, side='right') - 1
+        f = _GzipMember(fname, int(starts[k]), int(raw[k]))
+    elif kind == 'gzip':
+        f = gzip.GzipFile(fname, 'rb')
+    elif kind == 'bzip2':
+        f = bz2.BZ2File(fname, 'rb')
+    else:
+        f = open(fname, 'rb')
+    if offset:
+        f.seek(offset)
+    return f
+
+
+def readBlock(f, blocksize, piece=2**14):
+    """About blocksize bytes of whole lines from a file opened with
+    openDump ('' at the end). An incomplete compressed file (one being
+    written) ends at the last whole line that can be decompressed, so
+    it is read piece bytes at a time."""
+    data, size = [], 0
+    try:
+        while size < blocksize:
+            chunk = f.read(min(piece, blocksize - size))
+            if not chunk:
+                break
+            data.append(chunk)
+            size += len(chunk)
+        data.append(f.readline())
+    except (IOError, EOFError, zlib.error):
+        block = ''.join(data)
+        return block[:block.rfind('\n') + 1]
+    return ''.join(data)
+
+
+def readBlocks(parts, blocksize):
+    """Blocks of whole lines (see readBlock) of the files parts, one
+    after the other"""
+    for part in parts:
+        f = openDump(part)
+        try:
+            while True:
+                block = readBlock(f, blocksize)
+                if not block:
+                    break
+                yield block
+        finally:
+            f.close()
+
+
+class DumpWriter(object):
+    """Writes data lines to dump files from a background thread.
+
+    Parameters
+    ----------
+    fname: name of the dump (see partName for rotated files)
+    rotate: None (a single file), 'hour' or 'day'
+    compress: gzip the files (also if fname ends in .gz)
+    max_batches: calls to write waiting to be written before lines are
+                 dropped
+    flush_every: seconds between writes to disk
+    """
+    def __init__(self, fname, rotate=None, compress=False, max_batches=600,
+                 flush_every=5.):
+        if rotate is not None and rotate not in ROTATIONS:
+            raise ValueError('rotate must be None or one of {}'.format(
+                             sorted(ROTATIONS)))
+        self.fname = fname
+        self.rotate = rotate
+        self.compress = compress or fname.endswith('.gz')
+        self.flush_every = flush_every
+        self.queued = 0
+        self.lines = 0
+        self.dropped = 0
+        self.failed = 0
+        self._queue = Queue.Queue(max_batches)
+        self._thread = threading.Thread(target=self._run, name='DumpWriter')
+        self._thread.daemon = True
+        self._thread.start()
+
+    def write(self, lines, t=None):
+        """Queues data lines (without line ends) received at time t
+        (Unix seconds, default now) to be written. Never waits: if the
+        queue is full the lines are dropped."""
+        if not lines:
+            return
+        try:
+            self._queue.put_nowait((time.time() if t is None else t, lines))
+            self.queued += len(lines)
+        except Queue.Full:
+            self.dropped += len(lines)
+
+    def _run(self):
+        pending, name = [], None
+        due = time.time() + self.flush_every
+        while True:
+            try:
+                item = self._queue.get(timeout=max(due - time.time(), 0))
+            except Queue.Empty:
+                item = ()
+            if item:
+                t, lines = item
+                part = partName(self.fname, t, self.rotate, self.compress)
+                if part != name and pending:
+                    self._flush(name, pending)
+                    pending = []
+                name = part
+                pending.extend(lines)
+            if item is None or time.time() >= due:
+                if pending:
+                    self._flush(name, pending)
+                    pending = []
+                due = time.time() + self.flush_every
+            if item is None:
+                return
+
+    def _flush(self, name, lines):
+        """Appends lines to file name"""
+        data = ''.join(line + ' \n' for line in lines)
+        try:
+            with open(name, 'ab') as f:
+                if self.compress:
+                    gz = gzip.GzipFile(fileobj=f, mode='wb')
+                    gz.write(data)
+                    gz.close()
+                else:
+                    f.write(data)
+            self.lines += len(lines)
+        except (IOError, OSError) as e:
+            self.failed += len(lines)
+            print('\nCould not write to {}: {}\n'.format(name, e))
+
+    def close(self, timeout=10.):
+        """Writes out the lines still queued and stops the thread,
+        waiting at most timeout seconds for a slow or stalled disk.
+        Returns the number of queued lines that were not written (the
+        thread is a daemon and is left behind if it does not finish)."""
+        end = time.time() + timeout
+        try:
+            self._queue.put(None, timeout=timeout)
+        except Queue.Full:
+            pass
+        self._thread.join(max(end - time.time(), 0))
+        unwritten = self.queued - self.lines - self.failed
+        if self.dropped or self.failed or unwritten:
+            print('{}: {} lines written, {} dropped, {} failed, {} not '
+                  'written'.format(self.fname, self.lines, self.dropped,
+                                   self.failed, unwritten))
+        return unwritten
@@ -0,0 +1,131 @@
+#!/usr/bin/env python
+'''Cached Sun and Moon ephemeris for one observing station.
+
+sunmoon computes positions from scratch on every call, including the
+geocentric position of the station. Ephemeris instead computes them
+once per window of time (a day by default) at regularly spaced nodes
+(one minute apart), with the Numpy versions of the sunmoon functions,
+and answers queries by cubic (4-point Lagrange) interpolation between
+the nodes. The direction is interpolated as a unit vector in the
+topocentric frame, so there are no problems at azimuth 0/360 or near
+the zenith.
+
+With one minute nodes the interpolated positions agree with sunmoon
+to better than ACCURACY radians (see test_accuracy); the algorithms
+themselves are only good to about 0.01 degrees for the Sun and a few
+arc minutes for the Moon.
+
+The most recently used windows are kept (least recently used first
+out), so replays jumping back and forth in time only compute each day
+once.
+'''
+
+import math
+import collections
+
+import numpy as np
+
+import sunmoon
+from jdates import unix2jd
+
+
+# Guaranteed agreement with sunmoon with the default node step (radians)
+ACCURACY = 1e-6
+
+
+class _Window(object):
+    """Nodes of one window of time: direction cosines and range of the
+    Sun and the Moon, in rows of an array each"""
+    __slots__ = ('t0', 'sun', 'moon')
+
+    def __init__(self, t0, span, step, station):
+        # One node before and two after the window, for the
+        # interpolation near its ends
+        self.t0 = t0 - step
+        t = self.t0 + step * np.arange(int(round(span / step)) + 4)
+        JD = unix2jd(t)
+        self.sun = self._nodes(sunmoon.sunazel_vec(JD, *station))
+        self.moon = self._nodes(sunmoon.moonazel_vec(JD, *station))
+
+    @staticmethod
+    def _nodes(azel):
+        az, el, r = azel
+        cel = np.cos(el)
+        return np.column_stack((cel * np.cos(az), cel * np.sin(az),
+                                np.sin(el), r))
+
+
+def _lagrange(u):
+    """Cubic Lagrange weights of the nodes -1, 0, 1, 2 at 0 <= u < 1"""
+    return ((-u * (u - 1) * (u - 2) / 6, (u + 1) * (u - 1) * (u - 2) / 2,
+             -(u + 1) * u * (u - 2) / 2, (u + 1) * u * (u - 1) / 6))
+
+
+class Ephemeris(object):
+    """Sun and Moon positions for one station, interpolated from cached
+    nodes.
+
+    Parameters
+    ----------
+    lat, lon, height: station coordinates (degrees, degrees, m)
+    span: seconds of time covered by each cached window
+    step: seconds between nodes
+    max_windows: number of windows kept
+    """
+    def __init__(self, lat, lon, height, span=86400., step=60.,
+                 max_windows=8):
+        self.station = (lat, lon, height)
+        self.span = span
+        self.step = step
+        self.max_windows = max_windows
+        self._windows = collections.OrderedDict()
+        self._last = (None, None)
+
+    def _window(self, k):
+        """Window number k (covering k * span to (k + 1) * span)"""
+        if self._last[0] == k:
+            return self._last[1]
+        try:
+            w = self._windows.pop(k)
+        except KeyError:
+            w = _Window(k * self.span, self.span, self.step, self.station)
+            if len(self._windows) >= self.max_windows:
+                self._windows.popitem(last=False)
+        self._windows[k] = w
+        self._last = (k, w)
+        return w
+
+    def _interpolate(self, t, body):
+        if np.ndim(t) == 0:
+            # Single instant: plain floats are much faster than arrays
+            t = float(t)
+            w = self._window(int(math.floor(t / self.span)))
+            i, u = divmod((t - w.t0) / self.step, 1.)
+            i = int(i)
+            x, y, z, r = np.dot(_lagrange(u), getattr(w, body)[i - 1:i + 3])
+            return (math.atan2(y, x) % (2 * math.pi),
+                    math.atan2(z, math.hypot(x, y)), r)
+        t = np.asarray(t, dtype=float)
+        k = np.floor(t / self.span).astype(int)
+        v = np.empty(t.shape + (4,))
+        for kw in np.unique(k):
+            sel = k == kw
+            w = self._window(kw)
+            i, u = np.divmod((t[sel] - w.t0) / self.step, 1.)
+            i = i.astype(int)
+            nodes = getattr(w, body)
+            v[sel] = sum(wj[:, None] * nodes[i + j]
+                         for j, wj in zip((-1, 0, 1, 2), _lagrange(u)))
+        x, y, z, r = np.rollaxis(v, -1)
+        return (np.mod(np.arctan2(y, x), 2 * np.pi),
+                np.arctan2(z, np.hypot(x, y)), r)
+
+    def sunazel(self, t):
+        """Sun's azimuth and elevation (radians) and distance (m) at
+        Unix time t (seconds; a number or an array)"""
+        return self._interpolate(t, 'sun')
+
+    def moonazel(self, t):
+        """Moon's azimuth and elevation (radians) and distance (m) at
+        Unix time t (seconds; a number or an array)"""
+        return self._interpolate(t, 'moon')
@@ -0,0 +1,261 @@
+#!/usr/bin/env python
+'''Headless export of replays to PNG frames or video.
+
+Rendering uses the Agg backend directly, without Tk or a window, so it
+runs on machines with no display. The polar grid, labels and everything
+else that does not change between frames are drawn once; every frame
+then only restores that background and draws the moving artists on top
+of it (the same blitting L2pRadar relies on).
+
+The replay time range is split into segments which are rendered by a
+pool of worker processes. Every worker sets up its figure and draws the
+background once, and reuses it for all the segments it renders. Each
+segment starts by reading a few minutes of data before its first frame
+so that tracks are complete from the start. PNG frames are numbered
+globally; for videos every segment is encoded by ffmpeg and the parts
+are joined at the end.
+'''
+
+import os
+import time
+import shutil
+import tempfile
+import subprocess
+import multiprocessing
+
+import numpy as np
+from matplotlib.figure import Figure
+from matplotlib.backends.backend_agg import FigureCanvasAgg
+import matplotlib.image
+
+import ephem
+from trails import TrackArtists
+import replay as rp
+from tracks import addPlanes
+
+
+# Seconds of data read before a segment to build up the tracks
+WARMUP = 300.
+VIDEO_EXTS = ('.mp4', '.mkv', '.avi', '.mov')
+
+
+class RadarFrame(object):
+    """Off-screen polar plot with the same look as L2pRadar.
+
+    Parameters
+    ----------
+    lat, lon, height: station coordinates (for the Sun and Moon)
+    size: figure size in inches
+    dpi: resolution
+    """
+    def __init__(self, lat, lon, height, size=6, dpi=100):
+        self.ephem = ephem.Ephemeris(lat, lon, height)
+        self.fig = Figure(facecolor='black', figsize=(size, size), dpi=dpi)
+        self.canvas = FigureCanvasAgg(self.fig)
+        self.ax = self.fig.add_subplot(111, projection='polar')
+        self.fig.subplots_adjust(bottom=0.03, top=0.97, left=0.03, right=0.97)
+        ax = self.ax
+        ax.patch.set_facecolor('black')
+        ax.spines['polar'].set_color('white')
+        ax.grid(color='white', lw=2)
+        ax.set_theta_direction(-1)
+        ax.set_theta_offset(np.pi)
+        ax.set_yticks(range(0, 90, 10))
+        ax.set_yticklabels([''] + map(str, range(80, 0, -10)))
+        for label in ax.get_xticklabels() + ax.get_yticklabels():
+            label.set_color('white')
+        ax.set_ylim(0, 90)
+        self.tracks = TrackArtists(ax)
+        self.tel_line = ax.plot([], [], 'o', color='#00ff00', ms=10)
+        self.sun_line = ax.plot([], [], 'o', color='gold', ms=25, alpha=0.8)
+        self.sunav_line = ax.plot([], [], color='gold', lw=2, alpha=0.6)
+        self.moon_line = ax.plot([], [], 'o', ms=22, color='white', alpha=0.6)
+        self.alert_line = ax.plot([], [], 'ro', ms=50, alpha=0.4)
+        self.time_text = self.fig.text(0.02, 0.97, '', color='white',
+                                       fontsize=12, verticalalignment='top')
+        self.artists = (self.sunav_line + self.sun_line + self.moon_line +
+                        self.tracks.artists + self.alert_line +
+                        self.tel_line)
+        for artist in self.artists + [self.time_text]:
+            artist.set_animated(True)
+        # Static background, drawn only once
+        self.canvas.draw()
+        self.background = self.canvas.copy_from_bbox(self.fig.bbox)
+
+    def update(self, t, P, telLine):
+        """Sets the moving artists for time t (Unix seconds), the planes
+        dictionary P and the latest telescope line"""
+        self.tracks.update(P.values())
+
+        telPos = telLine.split()
+        telAz = float(telPos[3]) * np.pi / 180
+        telEl = float(telPos[4][:4])
+        self.tel_line[0].set_data(telAz, 90 - telEl)
+        if telPos[5][:1] != '1':
+            self.alert_line[0].set_data(telAz, 90 - telEl)
+        else:
+            self.alert_line[0].set_data([], [])
+
+        sunAz, sunEl, _ = self.ephem.sunazel(t)
+        mAz, mEl, _ = self.ephem.moonazel(t)
+        sunEl = sunEl * 180 / np.pi
+        self.sun_line[0].set_data(sunAz, 90 - sunEl)
+        self.moon_line[0].set_data(mAz, 90 - mEl * 180 / np.pi)
+        if sunEl > -20:
+            theta = np.linspace(0, 2 * np.pi, 40)
+            B = sunEl + 15 * np.sin(theta)
+            A = sunAz + (15 * np.cos(theta) * np.pi / 180 /
+                         np.cos(B * np.pi / 180))
+            self.sunav_line[0].set_data(A, 90 - B)
+        else:
+            self.sunav_line[0].set_data([], [])
+        self.time_text.set_text(rp.formatTime(t))
+
+    def render(self):
+        """Draws the current frame; returns it as an RGB array"""
+        self.canvas.restore_region(self.background)
+        for artist in self.artists:
+            self.ax.draw_artist(artist)
+        self.fig.draw_artist(self.time_text)
+        w, h = self.canvas.get_width_height()
+        return np.fromstring(self.canvas.tostring_rgb(),
+                             dtype=np.uint8).reshape(h, w, 3)
+
+
+def frameTimes(t0, t1, step):
+    """Times of the frames between t0 and t1, one every step seconds"""
+    return t0 + step * np.arange(int(np.ceil((t1 - t0) / step)))
+
+
+# RadarFrame of each worker process, set up by _initWorker
+_frame = None
+
+
+def _initWorker(station, size, dpi):
+    """Sets up the figure of a worker process, once for all the
+    segments it renders"""
+    global _frame
+    _frame = RadarFrame(*station, size=size, dpi=dpi)
+
+
+def _segment(job):
+    """Renders the frames of one segment (run by the worker pool).
+
+    job is a tuple (fname, times, first, out, fps); first is the number
+    of the first frame. Returns the file written (video) or the number
+    of frames written (PNG)."""
+    fname, times, first, out, fps = job
+    frame = _frame
+    frame.tracks.clear()
+    source = rp.openReplay(fname)
+    source.seek(times[0] - WARMUP)
+    precs, tlines = source.readUntil(times[0])
+    P = addPlanes(precs, {}, minel=0, time_alive=15)
+    telLine = tlines[-1] if tlines else '0 0 0 00.00 00.00 1'
+    video = os.path.splitext(out)[1].lower() in VIDEO_EXTS
+    if video:
+        w, h = frame.canvas.get_width_height()
+        part = '{}.part{:06d}{}'.format(out, first, os.path.splitext(out)[1])
+        encoder = subprocess.Popen(['ffmpeg', '-y', '-loglevel', 'error',
+                                    '-f', 'rawvideo', '-pix_fmt', 'rgb24',
+                                    '-s', '{}x{}'.format(w, h),
+                                    '-r', str(fps), '-i', '-',
+                                    '-pix_fmt', 'yuv420p', part],
+                                   stdin=subprocess.PIPE)
+    for k, t in enumerate(times):
+        precs, tlines = source.readUntil(t)
+        P = addPlanes(precs, P, minel=0, time_alive=15)
+        if tlines:
+            telLine = tlines[-1]
+        frame.update(t, P, telLine)
+        image = frame.render()
+        if video:
+            encoder.stdin.write(image.tostring())
+        else:
+            matplotlib.image.imsave(out % (first + k), image)
+    if video:
+        encoder.stdin.close()
+        if encoder.wait() != 0:
+            raise IOError('ffmpeg failed encoding {}'.format(part))
+        return part
+    return len(times)
+
+
+def exportReplay(fname, out, station, start=None, end=None, speed=60.,
+                 fps=10, workers=None, size=6, dpi=100):
+    """Renders a replay to PNG frames or a video file.
+
+    Parameters
+    ----------
+    fname: text dump or archive to replay, or several (see
+           replay.openReplay)
+    out: video file name (.mp4, .mkv, .avi or .mov; needs ffmpeg), or
+         PNG file name pattern with a frame number format such as
+         'frames/%06d.png'; a directory name stands for
+         'directory/%06d.png'
+    station: (lat, lon, height) of the observing station
+    start, end: time range, as accepted by replay.parseTime (default:
+                the whole file)
+    speed: simulated seconds per second of video
+    fps: frames per second of video
+    workers: number of worker processes (default: one per CPU)
+    size, dpi: figure size (inches) and resolution
+
+    Returns
+    -------
+    number of frames rendered
+    """
+    index = rp.openReplay(fname).index
+    t0 = rp.parseTime(start, index.start) if start else index.start
+    t1 = rp.parseTime(end, index.start) if end else index.end + index.step
+    times = frameTimes(t0, t1, float(speed) / fps)
+    if len(times) == 0:
+        print('Nothing to export between {} and {}'.format(
+              rp.formatTime(t0), rp.formatTime(t1)))
+        return 0
+    video = os.path.splitext(out)[1].lower() in VIDEO_EXTS
+    if not video and '%' not in out:
+        if not os.path.isdir(out):
+            os.makedirs(out)
+        out = os.path.join(out, '%06d.png')
+    workers = workers or multiprocessing.cpu_count()
+    # Several segments per worker, so that busy and quiet periods even out
+    nseg = min(len(times), 4 * workers)
+    bounds = np.linspace(0, len(times), nseg + 1).astype(int)
+    jobs = [(fname, times[i:j], i, out, fps)
+            for i, j in zip(bounds[:-1], bounds[1:]) if j > i]
+
+    print('Exporting {} frames ({} to {}) with {} workers'.format(
+          len(times), rp.formatTime(t0), rp.formatTime(t1), workers))
+    tstart = time.time()
+    pool = multiprocessing.Pool(workers, _initWorker, (station, size, dpi))
+    try:
+        results = pool.map(_segment, jobs, chunksize=1)
+    finally:
+        pool.close()
+        pool.join()
+    if video:
+        _joinParts(results, out)
+    wall = time.time() - tstart
+    print('{} frames written to {} in {:.1f} s ({:.1f} frames/s)'.format(
+          len(times), out, wall, len(times) / wall))
+    return len(times)
+
+
+def _joinParts(parts, out):
+    """Concatenates the video segments into out, deleting them"""
+    tmpdir = tempfile.mkdtemp()
+    try:
+        listfile = os.path.join(tmpdir, 'parts.txt')
+        with open(listfile, 'w') as f:
+            for part in parts:
+                f.write("file '{}'\n".format(os.path.abspath(part)))
+        if subprocess.call(['ffmpeg', '-y', '-loglevel', 'error', '-f',
+                            'concat', '-safe', '0', '-i', listfile,
+                            '-c', 'copy', out]) != 0:
+            raise IOError('ffmpeg failed joining the parts of {}'.format(out))
+    finally:
+        shutil.rmtree(tmpdir)
+        for part in parts:
+            if os.path.exists(part):
+                os.remove(part)
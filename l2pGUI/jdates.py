@@ -1,9 +1,20 @@
 #!/usr/bin/env python
-'''Various functions to deal with Julian Dates'''
+'''Various functions to deal with Julian Dates
+
+gcal2jd, jd2gcal_vec (the array version of jd2gcal) and the MJD and
+Unix time conversions (mjd2jd, jd2mjd, unix2jd, jd2unix) also take
+Numpy arrays, for converting many dates at once.
+'''
 
 import numpy as np
 import datetime as dt
 
+
+# JD of MJD 0 and of the Unix epoch
+MJD_JD = 2400000.5
+UNIX_JD = 2440587.5
+
+
 def s2hms(epoch):
     h, m = divmod(epoch, 3600)
     m, s = divmod(m, 60)
@@ -24,12 +35,14 @@ def hms2s(h, m=0, s=0):
 
 def gcal2jd(Y=1978, M=7, D=27):
     '''From Explanatory Supplement 12.92
+
+    Y and M must be integers (or integer arrays); D can have a fraction
     '''
     A = -((14 - M) // 12)
     JD = (1461 * (Y + 4800 + A)) // 4
-    JD += (367 * (M - 2 - 12 * A)) // 12
-    JD -= 3 * ((Y + 4900 + A) // 100) // 4
-    JD += D - 32075.5       # subtract 0.5 to start at 00:00
+    JD = JD + (367 * (M - 2 - 12 * A)) // 12
+    JD = JD - 3 * ((Y + 4900 + A) // 100) // 4
+    JD = JD + D - 32075.5       # subtract 0.5 to start at 00:00
     return JD
 
          
@@ -61,6 +74,50 @@ def jd2gcal(JD=2443716):
     return int(Y), int(M), int(D), fD
     
 
+def jd2gcal_vec(JD):
+    '''jd2gcal for an array of Julian dates.
+
+    Returns
+    -------
+    Y, M, D: integer arrays of years, months and days
+    fD: fraction of the day
+    '''
+    F, Z = np.modf(np.asarray(JD, dtype=float) + 0.5)
+    alpha = (Z - 1867216.25) // 36524.25
+    A = np.where(Z >= 2299161, Z + 1 + alpha - alpha // 4, Z)
+    B = A + 1524
+    C = (B - 122.1) // 365.25
+    D = np.modf(365.25 * C)[1]
+    E = (B - D) // 30.6001
+    D = B - D - np.modf(30.6001 * E)[1] + F
+    fD, D = np.modf(D)
+    M = np.where(E < 14, E - 1, E - 13)
+    Y = np.where(M > 2, C - 4716, C - 4715)
+    return Y.astype(int), M.astype(int), D.astype(int), fD
+
+
+def mjd2jd(mjd, epc=0.):
+    '''JD from MJD and seconds of day (e.g. the first two fields of 
+    l2planes lines); numbers or arrays'''
+    return (mjd + MJD_JD) + epc / 86400.
+
+
+def jd2mjd(JD):
+    '''MJD (integer) and seconds of day of Julian dates'''
+    day, fd = np.divmod(np.asarray(JD, dtype=float) - MJD_JD, 1.)
+    return day.astype(int), fd * 86400.
+
+
+def unix2jd(t):
+    '''JD from Unix time (seconds); a number or an array'''
+    return t / 86400. + UNIX_JD
+
+
+def jd2unix(JD):
+    '''Unix time (seconds) from JD; a number or an array'''
+    return (JD - UNIX_JD) * 86400.
+
+
 def jdToday():
     """Returns JD for current date
     """
@@ -114,4 +171,4 @@ def jd2jcal(JD=2443716):
     I = J // 11
     M = J + 2 - 12 * I
     Y = 4 * K + N + I - 4716
-    return Y, M, D
\ No newline at end of file
+    return Y, M, D
@@ -13,25 +13,38 @@ Sun/Moon positions. These can be set in the configuration file l2pGUI.cfg.
 
 import sys, os
 import Tkinter as Tk
-import socket
 import multiprocessing
 import signal
 import argparse
 import ConfigParser
 import time
+import Queue
 
 import numpy as np
 import matplotlib
 matplotlib.use('TkAgg')
 import matplotlib.pyplot as plt
-import matplotlib.animation as animation
-from matplotlib import cm
 from matplotlib.figure import Figure
+from matplotlib.collections import LineCollection
 from matplotlib.backends.backend_tkagg import FigureCanvasTkAgg
 
 import datetime as dt
-import jdates as jd
-import sunmoon
+import ephem
+import coords
+import conflicts
+import predict
+import termview
+import beacons
+import archive
+import dumpfile
+import loader
+import replay as rp
+import receiver
+import merge
+import export
+import shmring
+from trails import TrackArtists
+from tracks import addPlanes, Retention, TrackSpill
 # The following modules are highly specific to NSGF,
 # of no use to anyone else and hence not included here
 #import funplot as fp
@@ -42,68 +55,56 @@ __author__ = "Jose Rodriguez"
 __license__ = "GPLv2"
 __email__ = "josrod@nerc.ac.uk"
 
-
-def dataFakeRead(f, init_pos=None, N_lines=140, print_lines=False):
-    """Reads lines from file from specified position to end.
-    
-    Let f be a saved l2planes output; calling this function at 
-    regular intervals will simulate real time data.
-    
-    At the moment this function has no concept of time, it simply reads
-    a number of lines specified by parameter N_lines. This means that
-    the display speed will only be similar to reality if the data packets 
-    were detected at similar rates. Thus, one can speed up the replayed 
-    animation by increasing this number, at the cost of increased choppiness.
-    
-    This function is a generator which behaves similarly to Unix tail,
-    but the caller is responsible for keeping track of file position
-    and passing it as an argument.
-    """
-    if init_pos is None:
-        f.seek(0, 2)
-        init_pos = f.tell()
-    f.seek(init_pos)
-    plines, tlines = [], []
-    i = 0
-    while True:
-        line = f.readline()
-        if print_lines:
-            print('{}\n'.format(line))
-        if not line:
-            print 'EOF ' + '%d lines read' % i
-            pos = f.tell()
-            yield plines, tlines, pos
-        l = line.split()
-        if len(l) == 13:
-            plines.append(line)
-        elif len(l) == 6:
-            tlines.append(line)
-        i += 1
-        if i > N_lines:
-            break
-    pos = f.tell()
-    yield plines, tlines, pos
+# Seconds the receiver is given to write out what is left to dump
+DUMP_TIMEOUT = 10.
 
 
-def loadPlanesFile(fname, minel=-5):
+def loadPlanesFile(fname, minel=-5, blocksize=2**24, workers=1):
     """Loads planes data from file. Useful for offline analysis.
     
     Parameters
     ----------
-    fname: l2planes dump file
+    fname: l2planes dump file or binary archive (see archive.py); a
+           dump written rotated or compressed can be given by the name
+           it was written under, and several dumps as a directory or a
+           glob pattern, which are merged in time order (see
+           dumpfile.dumpStreams)
     minel: elevation cutoff
+    blocksize: approximate number of bytes read and parsed at a time
+    workers: number of processes parsing text dumps in parallel (see
+             loader.py); None for one per CPU
     
     Returns
     -------
     P: dictionary containing Plane instances
     """
     t0 = time.time()
-    with open(fname, 'r') as f:
+    streams = dumpfile.dumpStreams(fname)
+    if workers != 1 and not (len(streams) == 1 and len(streams[0]) == 1 and
+                             archive.isArchive(streams[0][0])):
+        return loader.loadParallel(fname, minel, workers, blocksize)
+    if len(streams) > 1:
+        P = {}
+        source = rp.openReplay(fname, blocksize)
+        for precs, _ in source.blocks():
+            P = addPlanes(precs, P, minel=minel)
+        t = time.time() - t0
+        print('{} planes loaded in {:<4.2f} seconds'.format(len(P), t))
+        return P
+    parts = streams[0]
+    if len(parts) == 1 and archive.isArchive(parts[0]):
+        arc = archive.Archive(parts[0])
         P = {}
-        for line in f:
-            if len(line.split()) < 13:
-                continue
-            P = addPlanes((line,), P, minel=-5)
+        nrows = blocksize // 64
+        for start in xrange(0, len(arc), nrows):
+            P = addPlanes(arc.planeRecords(start, start + nrows), P,
+                          minel=minel)
+        t = time.time() - t0
+        print('{} planes loaded in {:<4.2f} seconds'.format(len(P), t))
+        return P
+    P = {}
+    for block in dumpfile.readBlocks(parts, blocksize):
+        P = addPlanes(beacons.parse_lines(block)[0], P, minel=minel)
     t = time.time() - t0
     print('{} planes loaded in {:<4.2f} seconds'.format(len(P), t))
     return P
@@ -134,94 +135,6 @@ def colourMaplimits(value_limits=(0, 80), colourmap_limits=(0.05, 0.85)):
     a = vhigh * clow / (clow - chigh)
     b = -a / clow
     return a, b
-    
-        
-class Plane():
-    """Makes planes.
-    
-    This class takes plane lines from l2planes and stores the relevant
-    information for later use
-    """
-    def __init__(self, line, minel=10):
-        l = line.split()
-        self.minel = minel
-        self.mjd = []
-        self.id = l[2]
-        self.code = l[3]
-        self.epc = []
-        self.last_epoch = float(l[1])
-        self.lat = []
-        self.lon = []
-        self.alt = []
-        self.ran = []
-        self.az = []
-        self.el = []
-        self.maxel = -10    # maximum observed plane elevation (starting value)
-        self.gaps = 0       # times the same plane id has been observed - 1
-        self.addLine(l)
-
-    # 56395 40400.326   4ca626 RYR8JT   50.97158 -0.61729 29525 68.6683
-    # 280.17873692 7.16197030   -474.0 191.0 1088   0.00 0.00
-
-    def addLine(self, l):
-        """Adds one line of data"""
-        # l is an already splitted line (list of line contents)
-        if len(l) == 13:
-            if float(l[9]) < self.minel:
-                return
-            self.epc.append(float(l[1]))
-            if self.epc[-1] < self.last_epoch:
-                self.epc[-1] += 86000
-            # I should reconsider the following line and its usefulness...
-            if self.epc[-1] - self.last_epoch > 600000:
-                self.gaps = 1
-                del(self.epc[-1])
-                return
-            self.mjd.append(float(l[0]))
-            self.last_epoch = self.epc[-1]
-            self.lat.append(float(l[4]))
-            self.lon.append(float(l[5]))
-            self.alt.append(float(l[6]) * 0.3048)
-            self.ran.append(float(l[7]))
-            self.az.append(np.pi / 180 * float(l[8]))
-            self.el.append(float(l[9]))
-            self.maxel = self.el[-1] if self.el[-1] > self.maxel else self.maxel
-
-
-def addPlanes(planeLines, planes_dict, minel=-5, time_alive=-1):
-    """Processes plane data lines and updates planes dictionary accordingly.
-    
-    Parameters
-    ----------
-    planeLines: list of plane lines from l2planes
-    planes_dict: dictionary storing planes
-                 keys: plane id; values: Plane instances
-    minel: elevation cutoff
-    time_alive: seconds to wait before discarding planes for which
-                no beacons have been received. No limit if set to negative
-    """
-    P = planes_dict
-    for line in planeLines:
-        l = line.split()
-        plane_id = l[2]
-        el = float(l[9])
-        if el > minel:
-            if not P.has_key(plane_id):
-                P[plane_id] = Plane(line, minel)
-            else:
-                P[plane_id].addLine(l)
-
-    if len(P) == 0 or len(planeLines) == 0:
-        return P
-    # Remove planes for which no beacons have been 
-    # received for more than given time
-    if time_alive > 0:
-        last_epoch = float(l[1])
-        keys = [k for k,v in P.iteritems() if 
-                abs(last_epoch - v.last_epoch) > time_alive]
-        for key in keys:
-            del P[key]
-    return P
 
 
 class L2pRadar(Tk.Tk):
@@ -231,24 +144,50 @@ class L2pRadar(Tk.Tk):
     ----------
     replay: if specified, listen2planes data previously written 
             to this file will be displayed
-    dump2file: if True, collected data will be written to a file
+    dump2file: if specified, collected data will be written to this file
+    rotate: start a new dump file every 'hour' or 'day' (see dumpfile.py)
+    compress: gzip the dump files
     print_lines: print to screen raw data lines as they are received
     Tstep: time interval between animation steps. Default=1000 ms
+    start, end: when replaying, time to start at and time to stop at,
+                as accepted by replay.parseTime
+    speed: replay speed (simulated seconds per second)
+    keep, keep_seconds: points and seconds of each plane track kept
+                        in memory (no limit if None)
+    spill: file to append the points no longer kept to (none if None)
+    stations: coords.Station instances the sky can be shown from; the
+              first one is the station of the receiver (default: the 
+              stations in the configuration file)
+    radii: alert and warning distances (degrees) between the telescope
+           and planes (default: from the configuration file)
+    sort: order of the planes table in the terminal (see termview.SORTS)
     """
     def __init__(self, replay=None, dump2file=None, print_lines=None, 
-                 Tstep=1000, **kwargs):
+                 Tstep=1000, start=None, end=None, speed=1, keep=1000,
+                 keep_seconds=None, spill=None, stations=None, radii=None,
+                 sort='el', rotate=None, compress=False, **kwargs):
         Tk.Tk.__init__(self)
         self.replay = replay
         self.dump2file = dump2file
         self.print_lines = print_lines
         self.Tstep = Tstep
+        self.jump_step = 300    # seconds skipped by the replay << >> buttons
+        self.retention = Retention(keep, keep_seconds,
+                                   TrackSpill(spill) if spill else None)
         
-        self.MaxPlanes = 25
         self.tmpath = os.path.expanduser('~/.plotsched_tmp')
         self.visHEO = False
         self.P = {}
-        self.last_mjd = 0
+        self.stations = stations or STATIONS
+        self.ephems = [ephem.Ephemeris(s.lat, s.lon, s.height)
+                       for s in self.stations]
+        self.istation = 0
+        self.ephem_stale = False
         self.telLines = '0 0 0 00.00 00.00 1'
+        self.tel_known = False
+        self.conflicts = conflicts.ConflictCheck(radii or CONFLICT_RADII)
+        self.predictor = predict.Predictor(self.stations[0])
+        self.table = termview.TableView(sort=sort)
         
         self.root = Tk.Tk._root(self)
         self.root.configure(background='black')
@@ -268,7 +207,21 @@ class L2pRadar(Tk.Tk):
         self.buttonLimitUp.pack(side='top', fill=Tk.X, pady=2)
         self.buttonLimitDown.pack(side='top', fill=Tk.X, pady=2)
         self.buttonRotate.pack(side='top', fill=Tk.X, pady=2)
+        if len(self.stations) > 1:
+            self.buttonStation = Tk.Button(self.frameCtrls, text='Stn',
+                                           command=self.switchStation,
+                                           bg='grey')
+            self.buttonStation.pack(side='top', fill=Tk.X, pady=2)
         #self.buttonHEO.pack(side='top', fill=Tk.X, pady=2)
+        if self.replay:
+            self.buttonBack = Tk.Button(self.frameCtrls, text='<<',
+                          command=lambda: self.replayJump(-self.jump_step),
+                          bg='grey')
+            self.buttonForward = Tk.Button(self.frameCtrls, text='>>',
+                          command=lambda: self.replayJump(self.jump_step),
+                          bg='grey')
+            self.buttonBack.pack(side='top', fill=Tk.X, pady=2)
+            self.buttonForward.pack(side='top', fill=Tk.X, pady=2)
         self.buttonQuit.pack(side='top', fill=Tk.X, pady=2)
         self.protocol("WM_DELETE_WINDOW", self.close)
         self.framePlot = Tk.Frame(self.root)
@@ -276,17 +229,23 @@ class L2pRadar(Tk.Tk):
         
         # Read data from file if requested...
         if self.replay:
-            self.datafile = open(self.replay, 'r')
-            self.pos = self.datafile.tell()
+            self.source = rp.openReplay(self.replay)
+            first = self.source.start
+            self.end = rp.parseTime(end, first) if end else None
+            t0 = rp.parseTime(start, first) if start else first
+            if start:
+                self.source.seek(t0)
+            self.clock = rp.ReplayClock(t0, speed=speed, 
+                                        interval=self.Tstep / 1000.)
             self.setFig()
             self.run(newcon=False)
         # otherwise proceed normally
         else:
+            # Received lines are dumped by the receiver process itself
+            self.dump = (dump2file, rotate, compress) if dump2file else None
             self.setFig()
             self.fig1.canvas.mpl_connect('pick_event', self.onpick)
             self.run(newcon=True)
-            if self.dump2file:
-                self.outFile = open(self.dump2file, 'w')
 
     def setFig(self):
         """Sets figure up"""
@@ -305,10 +264,8 @@ class L2pRadar(Tk.Tk):
         self.ax.set_yticklabels([''] +  map(str, range(80, 0, -10)))
         for label in self.ax.get_xticklabels() + self.ax.get_yticklabels():
             label.set_color('white')
-        self.lines = sum((self.ax.plot([], [], lw=4, markeredgewidth=0)
-                          for n in range(self.MaxPlanes)), [])
-        self.points = self.ax.plot([], [], 'o', markeredgewidth=0, 
-                                                   ms=6, color='w')
+        # Trails and positions of all the planes (two artists in total)
+        self.tracks = TrackArtists(self.ax)
         self.tel_line = self.ax.plot([], [], 'o', color='#00ff00', ms=10)
         self.sun_line = self.ax.plot([], [], 'o', color='gold',
                                      ms=25, alpha=0.8)
@@ -316,6 +273,14 @@ class L2pRadar(Tk.Tk):
         self.moon_line = self.ax.plot([], [], 'o', ms=22, color='white', 
                                       alpha=0.6)
         self.alert_line = self.ax.plot([], [], 'ro', ms=50, alpha=0.4)
+        self.warn_line = self.ax.plot([], [], 'o', color='orange', ms=50,
+                                      alpha=0.4)
+        # Predicted paths of planes heading close to the telescope
+        self.predict_lines = LineCollection([], colors='orange',
+                                            linestyles='--', linewidths=2)
+        self.ax.add_collection(self.predict_lines, autolim=False)
+        self.predict_point = self.ax.plot([], [], 'x', color='orange',
+                                          ms=12, mew=3)
         self.heos_line = self.ax.plot([], [], 'ro', ms=8, picker=5)
         self.txt_line = self.ax.text(0, 0, '', color='r', fontsize=16,
                                      weight='bold',
@@ -324,38 +289,115 @@ class L2pRadar(Tk.Tk):
         self.yhigh = 90
         self.ax.set_ylim(0, self.yhigh)
         self.time = time.time()
+        # Everything that moves is drawn by the render loop on top of a
+        # cached background (grid, labels...), which is only redrawn
+        # when the view changes
+        self.artists = (tuple(self.tracks.artists + self.tel_line +
+                        self.sun_line + self.sunav_line + self.moon_line +
+                        self.alert_line + self.warn_line + 
+                        [self.predict_lines] + self.predict_point +
+                        self.heos_line) +
+                        (self.txt_line,))
+        for artist in self.artists:
+            artist.set_animated(True)
+        self.background = None
+        self.animating = False
+        self.frame = 0
+        self._after = None
+        self.canvas.mpl_connect('draw_event', self.onDraw)
+        self.canvas.mpl_connect('scroll_event', self.onScroll)
 
     def anim_init(self):
         """Initial plot state"""
-        for line in self.lines:
-            line.set_data([], [])
+        self.tracks.clear()
         for line in [self.tel_line, self.sun_line, self.sunav_line, 
-                     self.points, self.alert_line, self.moon_line,
-                     self.heos_line]:
+                     self.alert_line, self.warn_line, self.predict_point,
+                     self.moon_line, self.heos_line]:
             line[0].set_data([], [])
+        self.predict_lines.set_segments([])
         self.txt_line.set_text('')
-        return (tuple(self.lines + self.points + self.tel_line +
-                self.sun_line + self.sunav_line + self.moon_line +
-                self.alert_line + self.moon_line + self.heos_line) +
-                (self.txt_line,))
+        return self.artists
+    
+    def startAnimation(self):
+        """Starts the render loop from the initial plot state (stopping 
+        it first if it was running)"""
+        self.stopAnimation()
+        self.anim_init()
+        self.frame = 0
+        self.animating = True
+        self._after = self.after(0, self.renderFrame)
+    
+    def stopAnimation(self):
+        """Stops the render loop; the last frame stays on screen"""
+        self.animating = False
+        if self._after is not None:
+            self.after_cancel(self._after)
+            self._after = None
+    
+    def renderFrame(self):
+        """One step of the render loop, which then schedules the next 
+        one Tstep ms after this one started"""
+        t0 = time.time()
+        self._after = None
+        try:
+            self.animate(self.frame)
+            self.frame += 1
+            self.blitArtists()
+        finally:
+            # An error in one frame must not stop the animation
+            if self.animating:
+                delay = self.Tstep - 1000 * (time.time() - t0)
+                self._after = self.after(max(int(delay), 1),
+                                         self.renderFrame)
+    
+    def blitArtists(self):
+        """Draws the moving artists over the cached background"""
+        if self.background is None:
+            # A full redraw, merged with any already requested by
+            # viewChanged; onDraw caches the new background
+            self.canvas.draw_idle()
+            return
+        self.canvas.restore_region(self.background)
+        for artist in self.artists:
+            self.ax.draw_artist(artist)
+        self.canvas.blit(self.fig1.bbox)
+    
+    def onDraw(self, event):
+        """Caches the background after every full redraw of the figure
+        (first frame, change of view, window resized) and draws the 
+        moving artists on it"""
+        self.background = self.canvas.copy_from_bbox(self.fig1.bbox)
+        # Trails are kept in display coordinates, which may have changed
+        self.tracks.update(self.P.values(), self.view())
+        for artist in self.artists:
+            self.ax.draw_artist(artist)
+    
+    def viewChanged(self):
+        """Invalidates the cached background; the figure is redrawn 
+        when Tk is next idle, however many changes come before that"""
+        self.background = None
+        self.canvas.draw_idle()
+    
+    def setElevationLimit(self, yhigh):
+        """Shows zenith distances from 0 to yhigh degrees (10 to 90)"""
+        self.yhigh = int(min(max(yhigh, 10), 90))
+        self.ax.set_yticks(range(0, self.yhigh, 10))
+        self.ax.set_ylim(0, self.yhigh)
+        self.viewChanged()
     
     def plotLimitUp(self):
         """Decrease plot elevation range"""
-        self.yhigh = self.yhigh - 10
-        self.ax.set_yticks(range(0, self.yhigh, 10))
-        self.ax.set_ylim(0, self.yhigh)
-        # Since the animation is blitted we need to restart it or
-        # the changes above will only last one animation cycle
-        self.anim._stop()
-        self.run(newcon=False)
+        self.setElevationLimit(self.yhigh - 10)
         
     def plotLimitDown(self):
         """Increse plot elevation range"""
-        self.yhigh = self.yhigh + 10
-        self.ax.set_yticks(range(0, self.yhigh, 10))
-        self.ax.set_ylim(0, self.yhigh)
-        self.anim._stop()
-        self.run(newcon=False)
+        self.setElevationLimit(self.yhigh + 10)
+        
+    def onScroll(self, event):
+        """Mouse wheel over the plot zooms in (up) and out (down)"""
+        if event.inaxes is self.ax:
+            self.setElevationLimit(self.yhigh +
+                                   (-10 if event.button == 'up' else 10))
         
     def plotRotate(self):
         """Rotate plot"""
@@ -363,8 +405,36 @@ class L2pRadar(Tk.Tk):
         self.ax.set_theta_offset(self.theta_offset * np.pi / 2)
         dirs = {0:'RIGHT', 1:'TOP', 2:'LEFT', 3:'BOTTOM'}
         print('\nNORTH set to {}\n'.format(dirs[self.theta_offset]))
-        self.anim._stop()
-        self.run(newcon=False)
+        self.viewChanged()
+        
+    def switchStation(self):
+        """Show the sky from the next station in the list"""
+        self.istation = (self.istation + 1) % len(self.stations)
+        station = self.stations[self.istation]
+        print('\nShowing the sky from station {}\n'.format(station.name))
+        self.root.title('l2pGUI' if self.istation == 0 else
+                        'l2pGUI - {}'.format(station.name))
+        self.ephem_stale = True
+        self.tracks.update(self.P.values(), self.view())
+        self.blitArtists()
+        
+    def view(self):
+        """Station the planes are shown from, None for the receiver's
+        (whose az/el come with the data)"""
+        return self.stations[self.istation] if self.istation else None
+        
+    def replayJump(self, seconds):
+        """Jump back (negative seconds) or forward in the replay"""
+        t = max(self.clock.time + seconds, self.source.start)
+        self.source.seek(t)
+        self.clock.reset(t)
+        # Tracks from before the jump would be joined to the new ones
+        self.P = {}
+        self.predictor.clear()
+        print('\nReplay moved to {}\n'.format(rp.formatTime(t)))
+        if not self.animating:
+            # Replay had finished; start it again
+            self.startAnimation()
         
     def displayHEO(self):
         """Toggle HEO visibility variable"""
@@ -424,71 +494,84 @@ class L2pRadar(Tk.Tk):
         return 90 - x
     
     def formattedOutput(self):
-        """Prints planes present in the queue"""
-        # hex      id       Az   El     Lon      Lat       Alt   Dist
-        #-------------------------------------------------------------        
-        #a2b728  UPS203    291 15.4    -0.199   50.994    11278  41.7
-        #aa7974  SOO275    343  5.1    -0.101   51.754    10058 103.8
-        os.system('cls' if os.name == 'nt' else 'clear')
-        print('\n hex      id       Az  El      Lon     Lat        Alt   Dist')
-        print '-' * 62
-        for plane in self.P.values():
-            strf = '{:8s}{:8s} {:4.0f}{:5.1f} {:>9.3f}{:>9.3f} {:>8.0f}{:>6.1f}' 
-            print(strf.format(plane.id, plane.code, 
-                              plane.az[-1] * 180 / np.pi, plane.el[-1],
-                              plane.lon[-1], plane.lat[-1],
-                              plane.alt[-1], plane.ran[-1]))
-        sys.stdout.flush()
+        """Prints planes present in the queue (as a table redrawn in
+        place, see termview.TableView)"""
+        # hex      id       Az   El     Lon      Lat       Alt   Dist   Tel
+        #-------------------------------------------------------------------
+        #a2b728  UPS203    291 15.4    -0.199   50.994    11278  41.7  12.3
+        #aa7974  SOO275    343  5.1    -0.101   51.754    10058 103.8  40.2
+        tel = None
+        if self.tel_known:
+            telPos = self.telLines.split()[3:5]
+            tel = (float(telPos[0]) * np.pi / 180,
+                   float(telPos[1][:4]) * np.pi / 180)
+        self.table.show(self.P.values(), tel)
             
-    def process_lines(self, data_lines, print_lines=False, dump2file=False):
+    def process_lines(self, data_lines, plane_recs=None, print_lines=False):
         """Processes data lines according to length
         
         Parameters
         ----------
         data_lines: list of data lines
+        plane_recs: plane records already parsed by the receiver
         print_lines: boolean flag to request printed output
-        dump2file: boolean flag to request written output
         
         Returns
         -------
-        plines, tlines: lists containing plane and telescope lines
+        precs: record array with plane data (see beacons.parse_lines)
+        tlines: list containing telescope lines
         """
-        tlines, plines = [], []
-        for line in data_lines:
-            if print_lines is True:
+        if print_lines is True:
+            if plane_recs is not None:
+                data_lines = beacons.formatRecords(plane_recs) + data_lines
+            for line in data_lines:
                 print('{}\n'.format(line))
-            if dump2file:
-                self.outFile.write(line + ' \n')
-            L = len(line.split())
-            if L == 13:
-                plines.append(line)
-            elif L == 6:
-                tlines.append(line)
-            elif L == 2:
-                time.sleep(2)
-                self.reconnect()
-        return plines, tlines
+        precs, tlines, _ = beacons.parse_lines(data_lines)
+        if plane_recs is not None and len(precs) == 0:
+            precs = plane_recs
+        elif plane_recs is not None:
+            precs = np.concatenate((plane_recs, precs))
+        return precs, tlines
     
     def updateData(self):
         """Update planes dictionary with data from queue or from dump file"""
         # Grab data via TCP/IP normally...
         if not self.replay:
+            if not self.procWorker.is_alive():
+                self.reconnect()
             data_lines = dump_queue(self.planeQueue)
             planeLines, telLines = self.process_lines(data_lines, 
-                                                  print_lines=self.print_lines,
-                                                  dump2file=self.dump2file)
-            self.P = addPlanes(planeLines, self.P, minel=0, time_alive=15)
+                                                  self.planeRing.drain(),
+                                                  print_lines=self.print_lines)
+            if self.planeRing.dropped > self.dropped:
+                print('\n{} beacons dropped (display too slow)\n'.format(
+                      self.planeRing.dropped - self.dropped))
+                self.dropped = self.planeRing.dropped
+            self.P = addPlanes(planeLines, self.P, minel=0, time_alive=15,
+                               retention=self.retention)
+            self.predictor.update(planeLines)
         # or read it from dump file if so requested
         elif self.replay:
-            planeLines, telLines, self.pos = (
-                             dataFakeRead(self.datafile, self.pos,
-                                          print_lines=self.print_lines).next())
-            self.P = addPlanes(planeLines, self.P, minel=0, time_alive=15)
-            if not planeLines:
-                self.anim._stop()
+            # Exactly the beacons received since the previous frame
+            # (in simulated time)
+            t = self.clock.tick()
+            if self.end is not None:
+                t = min(t, self.end)
+            planeLines, telLines = self.source.readUntil(t)
+            if self.print_lines:
+                print('{}\n'.format(planeLines))
+            self.P = addPlanes(planeLines, self.P, minel=0, time_alive=15,
+                               retention=self.retention)
+            self.predictor.update(planeLines)
+            if self.source.finished or t == self.end:
+                print('\nEnd of replay: {}\n'.format(self.clock.summary()))
+                self.stopAnimation()
         
+        if self.retention.spill is not None:
+            self.retention.spill.flush()
         if len(telLines) > 0:
             self.telLines = telLines[-1]
+            self.tel_known = True
         
     def animate(self, i):
         """Matplotlib animation function
@@ -498,33 +581,12 @@ class L2pRadar(Tk.Tk):
         self.updateData()
         if not self.print_lines:
             #If print_lines is True don't add more garbage to the screen
-            if i % 2 == 0:
-                # Print planes to screen every two cycles
-                self.formattedOutput()
+            # (the table limits its own refresh rate)
+            self.formattedOutput()
 
-        # Az/El from planes present in the dictionary, grabbing
-        # the last 80 positions available in steps of 5
-        Azs = [p.az[-80::5] for p in self.P.values()]
-        Els = [p.el[-80::5] for p in self.P.values()]
-        
-        colors = ((p.el[-1] + 5)/100 for p in self.P.values() if len(p.el) > 0)
-        Nplanes = len(Azs)
-        if Nplanes > 0:
-            # Update plot lines with Az/El data
-            for j, line in enumerate(self.lines):
-                line.set_data(Azs[j], map(self.el2zdist, (Els[j])))
-                line.set_color(cm.jet(colors.next()))
-                if j == Nplanes - 1:
-                    # Reset plot lines from previous planes
-                    for line in self.lines[Nplanes:]:
-                        line.set_data([], [])
-                    break
-        else:
-            self.lines[0].set_data([], [])
-        
-        x = [n[-1] for n in Azs]
-        y = [n[-1] for n in Els]
-        self.points[0].set_data(x, map(self.el2zdist, y))
+        # Trails from the last 80 positions of every plane in the 
+        # dictionary, in steps of 5, and their current positions
+        self.tracks.update(self.P.values(), self.view())
 
         # Display HEO satellites?
         #if (self.visHEO is True) and (i % 30 == 0):
@@ -538,33 +600,49 @@ class L2pRadar(Tk.Tk):
         telPos = self.telLines.split()[3:5]
         telAz = float(telPos[0]) * np.pi / 180
         telEl = float(telPos[1][:4])
-        self.tel_line[0].set_data(telAz, 90 - telEl)
-        # Draw a red circle if too close to a plane
-        if self.telLines.split()[5][:1] != '1':
+        # Our own check of the planes around the telescope: 0 if any is
+        # within the alert radius, 1 within the warning radius
+        level = None
+        if self.tel_known:
+            planes = self.P.values()
+            self.conflicts.update([p.az[-1] for p in planes],
+                                  [p.el[-1] * np.pi / 180 for p in planes])
+            level, _ = self.conflicts.level(telAz, telEl * np.pi / 180)
+        # Draw a red circle if too close to a plane (according to the 
+        # server or to ourselves), an orange one if getting close
+        alert = self.telLines.split()[5][:1] != '1' or level == 0
+        if self.istation:
+            # The telescope is at the receiver's station
+            self.tel_line[0].set_data([], [])
+            alert, level = False, None
+        else:
+            self.tel_line[0].set_data(telAz, 90 - telEl)
+        if alert:
             self.alert_line[0].set_data(telAz, 90 - telEl)
         else:
             self.alert_line[0].set_data([], [])
+        if level == 1 and not alert:
+            self.warn_line[0].set_data(telAz, 90 - telEl)
+        else:
+            self.warn_line[0].set_data([], [])
+        if self.tel_known and not self.istation:
+            self.plotForecast(telAz, telEl * np.pi / 180)
+        else:
+            self.predict_lines.set_segments([])
+            self.predict_point[0].set_data([], [])
         
         # Sun/Moon positions updated every 20 animation steps
-        if i % 20 == 0:
+        if i % 20 == 0 or self.ephem_stale:
+            self.ephem_stale = False
             ## Print FPS
             #newtime = time.time()
             #print('\nFPS: {:4.1f}\n'.format(20 / (newtime - self.time)))
             #self.time = newtime
-            if not self.replay:
-                JD = jd.jdNow()
-                sunAz, sunEl,_ = sunmoon.sunazel(JD, LAT, LON, HEIGHT)
-                mAz, mEl, mR = sunmoon.moonazel(JD, LAT, LON, HEIGHT)
-            else:
-                # Read MJD from data so that the Sun is in the right place
-                if len(self.P) > 0:
-                    # Update last date if planes found
-                    self.last_mjd = (self.P.values()[0].mjd[-1] + 
-                                 self.P.values()[0].epc[-1] / 86400)
-                sunAz, sunEl,_ = sunmoon.sunazel(2400000.5 + self.last_mjd,
-                                               LAT, LON, HEIGHT)
-                mAz, mEl,_ = sunmoon.moonazel(2400000.5 + self.last_mjd,
-                                                LAT, LON, HEIGHT)
+            # Replays use the time of the data so that the Sun is 
+            # in the right place
+            t = self.clock.time if self.replay else time.time()
+            sunAz, sunEl, _ = self.ephems[self.istation].sunazel(t)
+            mAz, mEl, _ = self.ephems[self.istation].moonazel(t)
             sunEl = sunEl * 180 / np.pi
             self.sun_line[0].set_data(sunAz, 90 - sunEl)
             self.moon_line[0].set_data(mAz, 90 - mEl * 180 / np.pi)            
@@ -582,21 +660,37 @@ class L2pRadar(Tk.Tk):
             else:
                 self.sunav_line[0].set_data(0, 0)
                 
-        return (tuple(self.lines + self.points + self.tel_line +
-                self.sun_line + self.sunav_line + self.moon_line +
-                self.alert_line + self.moon_line + self.heos_line) +
-                (self.txt_line,))
-    
+        return self.artists
+    
+    def plotForecast(self, telAz, telEl):
+        """Shows the predicted paths of the planes that will come within
+        the warning radius of the telescope (az, el in radians), up to 
+        their closest approach, which is marked with a cross"""
+        ids, tca, sep, P = self.predictor.closestApproach(telAz, telEl)
+        warn = np.radians(self.conflicts.radii[-1])
+        paths = []
+        for i in np.flatnonzero(sep <= warn):
+            if ids[i] in self.P:
+                # Positions are predicted every second
+                a, e, _ = coords.top2azel(*P[i, :int(tca[i]) + 1].T)
+                paths.append(np.column_stack((np.unwrap(a),
+                                              90 - np.degrees(e))))
+        self.predict_lines.set_segments(paths)
+        self.predict_point[0].set_data([p[-1, 0] for p in paths],
+                                       [p[-1, 1] for p in paths])
+        
     def run(self, newcon=False):
-        """Start subprocesses and Matplotlib animation loop"""
+        """Start subprocesses and the render loop"""
         if newcon is True:
             self.planeQueue = multiprocessing.Queue()
+            self.planeRing = shmring.BeaconRing()
+            self.dropped = 0
             self.procWorker = multiprocessing.Process(target=receive_proc,
-                                         args=[self.planeQueue, L2P_HOST])
+                args=[self.planeQueue, L2P_SERVERS, self.planeRing, 
+                      L2P_OPTIONS, self.dump])
             self.procWorker.start()
             
-        self.anim = animation.FuncAnimation(self.fig1, self.animate,
-               init_func=self.anim_init, blit=True, interval=self.Tstep)
+        self.startAnimation()
         
         signal.signal(signal.SIGINT, self.signal_handler)
 
@@ -607,65 +701,106 @@ class L2pRadar(Tk.Tk):
         self.close()
         
     def reconnect(self):
-        """Try to re-establish connections"""
-        print('\nAttempting to reconnect to l2p server...\n')
+        """Restart the receiver process if it died (lost connections are
+        re-established by the receiver itself)"""
+        print('\nRestarting receiver process...\n')
         self.planeQueue.close()
         self.planeQueue = multiprocessing.Queue()
         self.procWorker.terminate()
+        self.procWorker.join(DUMP_TIMEOUT)
         self.procWorker = multiprocessing.Process(target=receive_proc,
-                                        args=[self.planeQueue, L2P_HOST])
+            args=[self.planeQueue, L2P_SERVERS, self.planeRing, L2P_OPTIONS,
+                  self.dump])
         self.procWorker.start()
         
     def close(self):
         """Closes application and worker subprocess as appropriate"""
+        self.stopAnimation()
         if not self.replay:
+            # The receiver writes out what it has left to dump first
             self.procWorker.terminate()
+            self.procWorker.join(DUMP_TIMEOUT + 1)
             self.planeQueue.close()
-        if self.dump2file:
-            self.outFile.close()
+        if self.retention.spill is not None:
+            for plane in self.P.values():
+                plane.retire()
+            self.retention.spill.close()
         self.root.destroy()
         print '\nExiting...\n'
         sys.exit()
 
 
-def receive_proc(planeQueue, L2P_HOST):
-    """Requests data lines from l2planes and sends it to the queue"""
-    connSocket = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+def receive_proc(planeQueue, servers, planeRing=None, options={}, dump=None):
+    """Requests data lines from the l2planes servers and sends them to 
+    the queue.
+    
+    All servers are handled by one receiver.MultiClient, which also 
+    takes care of reconnecting to them. Each queue message is a list 
+    with all the complete lines received in one go. If planeRing 
+    (shmring.BeaconRing) is given, plane lines are parsed here and sent 
+    through it instead, and only the other lines go to the queue. With 
+    more than one server, they first go through a merge.Merger, which 
+    puts them in time order and drops the beacons received twice 
+    (without a ring, lines from all servers go to the queue as they 
+    arrive). Plane lines with fields that are not numbers are dropped.
+    
+    If dump is given, all the lines are also written, exactly as 
+    received, to a dumpfile.DumpWriter. SIGTERM stops the process after 
+    writing out what is left to dump.
+    
+    Parameters
+    ----------
+    planeQueue: multiprocessing.Queue
+    servers: list of (name, (host, port)) (see receiver.serverList)
+    planeRing: optional shmring.BeaconRing
+    options: keyword arguments for receiver.MultiClient
+    dump: optional (fname, rotate, compress) arguments for DumpWriter
+    """
+    writer = dumpfile.DumpWriter(*dump) if dump else None
+    signal.signal(signal.SIGTERM, lambda signum, frame: sys.exit())
     try:
-        connSocket.connect(L2P_HOST)
-    except socket.error, msg:
-        print('Error connecting: {}'.format(msg))
-
+        _receive(planeQueue, servers, planeRing, options, writer)
+    finally:
+        if writer is not None:
+            writer.close(DUMP_TIMEOUT)
+
+
+def _receive(planeQueue, servers, planeRing, options, writer):
+    """Main loop of receive_proc"""
+    client = receiver.MultiClient(servers, **options)
+    merger = None
+    if len(servers) > 1 and planeRing is not None:
+        merger = merge.Merger()
+    next_stats = time.time() + receiver.STATS_INTERVAL
     while True:
-        # Send string expected by listen2planes from clients
-        try:
-            connSocket.send('reader\0')
-        except socket.error, msg:
-            print('Failed to send to server: '.format(msg))
-            time.sleep(1.5)
-            # We will look for the following error string
-            # and attempt to reconnect if found
-            planeQueue.put('CONN ERROR')
-            break
-            
-        try:
-            data = connSocket.recv(256)
-        except socket.error, msg:
-            print('Failed to receive from server: {}'.format(msg))
-            time.sleep(1.5)
-            planeQueue.put('CONN ERROR')
-            break
-        else:
-            planeQueue.put(data)
-    return
+        if time.time() > next_stats:
+            print(client.stats())
+            if merger is not None:
+                print(merger.stats())
+            next_stats += receiver.STATS_INTERVAL
+        for name, lines in client.step():
+            if writer is not None:
+                writer.write(lines)
+            if planeRing is not None:
+                precs, tlines, clines = beacons.parse_lines(lines)
+                if merger is None:
+                    planeRing.put(precs)
+                else:
+                    merger.push(name, precs)
+                lines = tlines + clines
+            if lines:
+                planeQueue.put(lines)
+        if merger is not None:
+            planeRing.put(merger.pop())
 
 
 def dump_queue(planeQueue):
-    """Retrieves all the data lines from the queue"""
+    """Retrieves all the data lines from the queue, without waiting"""
     data_lines = []
     while True:
-        data_lines.append(planeQueue.get())
-        if planeQueue.qsize() == 0:
+        try:
+            data_lines.extend(planeQueue.get_nowait())
+        except Queue.Empty:
             break
     return data_lines
 
@@ -674,13 +809,69 @@ def main(argv=None):
     """Deal with command line arguments and launch the program"""
     parser = argparse.ArgumentParser(description='listen2planes display client')
     group = parser.add_mutually_exclusive_group()
-    group.add_argument('-r', '--replay', help='Replay plane data from file')
+    group.add_argument('-r', '--replay',
+                       help='Replay plane data from file, or from all the '
+                       'files in a directory or matching a glob pattern')
     group.add_argument('-d', '--dump2file', help='Write plane data to file')
+    parser.add_argument('--rotate', choices=sorted(dumpfile.ROTATIONS),
+                        help='Start a new --dump2file file every hour or day '
+                        '(the date is added to the name)')
+    parser.add_argument('--gzip', action='store_true',
+                        help='Compress --dump2file files with gzip')
     parser.add_argument('-pl', '--print-lines', action='store_true',
                         help='Print data lines')
     parser.add_argument('-t', '--time-step', type=int, default=1000,
                         help='Time in milliseconds between animation steps')
+    parser.add_argument('-s', '--start', 
+                        help='Replay from this time (HH:MM[:SS] or '
+                        '"YYYY-MM-DD HH:MM[:SS]")')
+    parser.add_argument('-e', '--end', help='Replay up to this time')
+    parser.add_argument('-x', '--speed', type=float,
+                        help='Replay speed, e.g. 60 for one minute of data '
+                        'per second (default: 1, or 60 with --export)')
+    parser.add_argument('--export', metavar='OUT',
+                        help='Render the replay to a video file (.mp4, '
+                        'needs ffmpeg) or to PNG frames in directory OUT, '
+                        'without opening a window')
+    parser.add_argument('--fps', type=float, default=10,
+                        help='Frames per second of exported videos')
+    parser.add_argument('--workers', type=int,
+                        help='Processes used by --export (default: one per '
+                        'CPU)')
+    parser.add_argument('-k', '--keep', type=int, default=1000,
+                        help='Points of each plane track kept in memory')
+    parser.add_argument('--keep-seconds', type=float,
+                        help='Seconds of each plane track kept in memory')
+    parser.add_argument('--sort', choices=sorted(termview.SORTS),
+                        default='el',
+                        help='Order of the planes table: by elevation, '
+                        'range or distance to the telescope')
+    parser.add_argument('--spill', 
+                        help='Append track points no longer kept in memory '
+                        'to this file')
+    group.add_argument('-c', '--convert', nargs=2, metavar=('DUMP', 'ARCHIVE'),
+                       help='Convert dump file to a binary archive and exit')
     args = parser.parse_args()
+    # Tracks must keep at least their last point
+    if args.keep < 1:
+        parser.error('--keep must be at least 1')
+    if args.keep_seconds is not None and args.keep_seconds < 1:
+        parser.error('--keep-seconds must be at least 1')
+    # Times are resolved against the replay once it is open, but whether
+    # they can be read at all does not depend on it
+    for option, value in (('--start', args.start), ('--end', args.end)):
+        if value:
+            try:
+                rp.parseTime(value)
+            except ValueError:
+                parser.error('{} must be HH:MM[:SS] or "YYYY-MM-DD '
+                             'HH:MM[:SS]", not {!r}'.format(option, value))
+    
+    if args.convert:
+        nplanes, ntel = archive.convertDump(*args.convert)
+        print('{}: {} plane and {} telescope lines'.format(args.convert[1],
+                                                           nplanes, ntel))
+        return
     
     config = ConfigParser.RawConfigParser()
     locs = [os.curdir, os.path.expanduser('~'), './', '/usr/l2pGUI', 
@@ -694,14 +885,25 @@ def main(argv=None):
         except IOError:
             pass
 
-    global L2P_HOST, LON, LAT, HEIGHT
-    HOST = config.get('Server', 'l2p_host')
-    PORT = config.getint('Server', 'l2p_port')
-    L2P_HOST = (HOST, PORT)
+    global L2P_SERVERS, L2P_OPTIONS, STATIONS, CONFLICT_RADII
+    global LON, LAT, HEIGHT
+    L2P_SERVERS = receiver.serverList(config)
+    L2P_OPTIONS = receiver.clientOptions(config)
+    STATIONS = coords.stationList(config)
+    CONFLICT_RADII = conflicts.configRadii(config)
     LON = config.getfloat('Station', 'lon')
     LAT = config.getfloat('Station', 'lat')
     HEIGHT = config.getfloat('Station', 'height')    
     
+    if args.export:
+        if not args.replay:
+            parser.error('--export needs a file to --replay')
+        export.exportReplay(args.replay, args.export, (LAT, LON, HEIGHT),
+                            start=args.start, end=args.end,
+                            speed=60 if args.speed is None else args.speed,
+                            fps=args.fps, workers=args.workers)
+        return
+    
     # Some house keeping with a hammer to clean processes from previous 
     # runs in Linux systems, using system tools to kill processes by name.
     # Not needed anymore since we're properly terminating child processes.
@@ -719,7 +921,16 @@ def main(argv=None):
     app = L2pRadar(replay=args.replay, 
                    dump2file=args.dump2file, 
                    print_lines=args.print_lines,
-                   Tstep=args.time_step)
+                   Tstep=args.time_step,
+                   start=args.start,
+                   end=args.end,
+                   speed=1 if args.speed is None else args.speed,
+                   keep=args.keep,
+                   keep_seconds=args.keep_seconds,
+                   spill=args.spill,
+                   sort=args.sort,
+                   rotate=args.rotate,
+                   compress=args.gzip)
     app.mainloop()
     
 
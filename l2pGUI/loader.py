@@ -0,0 +1,143 @@
+#!/usr/bin/env python
+'''Parallel loading of text dumps for offline analysis.
+
+loadParallel gives the same dictionary of Plane instances as
+l2pGUI.loadPlanesFile, but parses the data in a pool of worker
+processes:
+
+    - plain text files are split into byte ranges of about blocksize
+      bytes, each starting and ending at a line end, so that every line
+      is parsed by exactly one worker; compressed files cannot be split
+      and are parsed whole, one per worker; binary archives (see
+      archive.py) are split into ranges of rows
+    - every worker parses its range, drops the beacons below the
+      elevation cutoff and sorts the rest by plane id, returning one
+      partial track per aircraft
+    - the partial tracks of each aircraft are joined in file order, or,
+      for several dumps replayed together (see dumpfile.dumpStreams),
+      in the time order in which replay.MergedSource would read them,
+      and every plane is built from its whole track at once
+
+The parsing, which is most of the work, scales with the number of
+workers; joining the tracks is done by the parent and is cheap.
+'''
+
+import os
+import time
+import collections
+import multiprocessing
+
+import numpy as np
+
+import beacons
+import archive
+import dumpfile
+from tracks import Plane
+
+
+def byteRanges(fname, size):
+    """(start, stop) byte ranges of about size bytes covering a plain
+    text file, all of them starting at the beginning of a line"""
+    total = os.path.getsize(fname)
+    bounds = [0]
+    with open(fname, 'rb') as f:
+        while bounds[-1] < total:
+            f.seek(bounds[-1] + size)
+            f.readline()
+            bounds.append(min(f.tell(), total))
+    return zip(bounds[:-1], bounds[1:])
+
+
+def _parseRange(job):
+    """Parses part of a dump (run by the worker pool).
+
+    job is a tuple (fname, start, stop, minel, blocksize); start and
+    stop are rows for archives, otherwise bytes, and stop is None for
+    the whole file (compressed files). Returns the plane records
+    above minel sorted by plane id, their release times (running
+    maximum of the beacon times within the range, as in
+    replay.ReplaySource), the ids and the first record of each, and the
+    latest beacon time in the range."""
+    fname, start, stop, minel, blocksize = job
+    if archive.isArchive(fname):
+        precs = archive.Archive(fname).planeRecords(start, stop)
+    else:
+        if stop is None:
+            blocks = dumpfile.readBlocks([fname], blocksize)
+        else:
+            with open(fname, 'rb') as f:
+                f.seek(start)
+                blocks = [f.read(stop - start)]
+        precs = [beacons.parse_lines(block)[0] for block in blocks]
+        precs = np.concatenate(precs) if precs else beacons.planeRecords([])
+    t = beacons.unixTime(precs['mjd'], precs['epc'])
+    release = np.maximum.accumulate(t) if len(t) else t
+    keep = precs['el'] > minel
+    precs, release = precs[keep], release[keep]
+    order = np.argsort(precs['id'], kind='mergesort')
+    precs, release = precs[order], release[order]
+    ids = precs['id']
+    starts = np.r_[0, np.flatnonzero(ids[1:] != ids[:-1]) + 1]
+    return (precs, release, ids[starts].tolist(), starts,
+            t.max() if len(t) else -np.inf)
+
+
+def loadParallel(fname, minel=-5, workers=None, blocksize=2**24):
+    """Loads planes data from text dumps with a pool of processes.
+
+    Parameters
+    ----------
+    fname: dump file name, directory or glob pattern (see
+           dumpfile.dumpStreams)
+    minel: elevation cutoff
+    workers: number of worker processes (default: one per CPU)
+    blocksize: approximate number of bytes parsed by a worker at a time
+
+    Returns
+    -------
+    P: dictionary containing Plane instances, the same as
+       l2pGUI.loadPlanesFile returns
+    """
+    t0 = time.time()
+    streams = dumpfile.dumpStreams(fname)
+    jobs, owner = [], []
+    for k, parts in enumerate(streams):
+        for part in parts:
+            if archive.isArchive(part):
+                nrows, step = len(archive.Archive(part)), blocksize // 64
+                ranges = [(i, i + step) for i in xrange(0, nrows, step)]
+            elif dumpfile.compression(part) is None:
+                ranges = byteRanges(part, blocksize)
+            else:
+                ranges = [(0, None)]
+            for start, stop in ranges:
+                jobs.append((part, start, stop, minel, blocksize))
+                owner.append(k)
+    pool = multiprocessing.Pool(workers or multiprocessing.cpu_count())
+    try:
+        results = pool.map(_parseRange, jobs, chunksize=1)
+    finally:
+        pool.close()
+        pool.join()
+
+    # Partial tracks of every plane, in file order
+    tracks = collections.defaultdict(list)
+    tmax = [-np.inf] * len(streams)
+    for k, (precs, release, ids, starts, latest) in zip(owner, results):
+        # Release times carry on from the ranges before in the stream
+        release = np.maximum(release, tmax[k])
+        tmax[k] = max(tmax[k], latest)
+        stops = np.r_[starts[1:], len(precs)]
+        for pid, i, j in zip(ids, starts, stops):
+            tracks[pid].append((precs[i:j], release[i:j]))
+    P = {}
+    for pid, pieces in tracks.iteritems():
+        precs = np.concatenate([p for p, _ in pieces])
+        if len(streams) > 1:
+            order = np.argsort(np.concatenate([r for _, r in pieces]),
+                               kind='mergesort')
+            precs = precs[order]
+        P[pid] = Plane(precs, minel)
+    t = time.time() - t0
+    print('{} planes loaded in {:<4.2f} seconds'.format(len(P), t))
+    return P
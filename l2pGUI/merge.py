@@ -0,0 +1,138 @@
+#!/usr/bin/env python
+'''Fan-in of beacons from several receivers.
+
+When several l2planes servers listen to the same sky, every aircraft
+arrives once from each of them, with slightly different timestamps and
+in whatever order the connections deliver them. Merger combines their
+plane records into a single stream that is
+
+    - in time order: records are held back for 'window' seconds of data
+      time and released sorted; records arriving later than that are
+      dropped and counted as late
+    - free of duplicates: a beacon is dropped if the same plane (ICAO
+      id) has already been released with an epoch in the same or the
+      previous 'resolution' seconds
+
+and counts what each source contributes.
+'''
+
+import time
+import collections
+
+import numpy as np
+
+import beacons
+
+
+class _SourceCounts(object):
+    """Per-source counters"""
+    __slots__ = ('received', 'released', 'duplicates', 'late', '_mark')
+
+    def __init__(self):
+        self.received = self.released = self.duplicates = self.late = 0
+        self._mark = (time.time(), 0)
+
+
+class Merger(object):
+    """Time-ordered, de-duplicated merge of plane records.
+
+    Parameters
+    ----------
+    window: seconds of data time records are held back for reordering
+    resolution: beacons of the same plane closer than this (seconds) are
+                considered the same beacon
+    """
+    def __init__(self, window=2., resolution=0.1):
+        self.window = window
+        self.resolution = resolution
+        self.sources = collections.OrderedDict()
+        self._counts = []
+        self.tmax = -np.inf
+        self.released_until = -np.inf
+        self._pending = []
+        self._seen = set()
+        self._seen_order = collections.deque()
+
+    def push(self, source, precs):
+        """Adds the plane records received from one source"""
+        if source not in self.sources:
+            self.sources[source] = _SourceCounts()
+            self._counts.append(self.sources[source])
+        counts = self.sources[source]
+        isrc = self._counts.index(counts)
+        counts.received += len(precs)
+        if len(precs) == 0:
+            return
+        t = beacons.unixTime(precs['mjd'], precs['epc'])
+        ok = t > self.released_until
+        if not ok.all():
+            counts.late += len(ok) - np.count_nonzero(ok)
+            precs, t = precs[ok], t[ok]
+        if len(t):
+            self.tmax = max(self.tmax, t.max())
+            self._pending.append((precs, t, np.repeat(isrc, len(t))))
+
+    def pop(self):
+        """Records older than the reorder window, in time order and
+        without duplicates"""
+        return self._release(self.tmax - self.window)
+
+    def flush(self):
+        """All pending records, in time order and without duplicates"""
+        return self._release(self.tmax)
+
+    def _release(self, until):
+        if not self._pending or until <= self.released_until:
+            return beacons.planeRecords([])
+        precs = np.concatenate([p for p, _, _ in self._pending])
+        t = np.concatenate([t for _, t, _ in self._pending])
+        src = np.concatenate([s for _, _, s in self._pending])
+        order = np.argsort(t, kind='mergesort')
+        n = np.searchsorted(t[order], until, side='right')
+        out, keep = order[:n], order[n:]
+        self._pending = []
+        if len(keep):
+            self._pending.append((precs[keep], t[keep], src[keep]))
+        self.released_until = until
+        precs, src = precs[out], src[out]
+        new = self._dedupe(precs, t[out], until)
+        nsrc = len(self._counts)
+        released = np.bincount(src[new], minlength=nsrc)
+        duplicates = np.bincount(src[~new], minlength=nsrc)
+        for counts, r, d in zip(self._counts, released, duplicates):
+            counts.released += int(r)
+            counts.duplicates += int(d)
+        return precs[new]
+
+    def _dedupe(self, precs, t, until):
+        """Mask of the beacons not released before, which are
+        remembered from now on"""
+        seen, order = self._seen, self._seen_order
+        buckets = np.floor(t / self.resolution).astype(np.int64).tolist()
+        new = np.zeros(len(precs), dtype=bool)
+        for i, (pid, b) in enumerate(zip(precs['id'].tolist(), buckets)):
+            if (pid, b) in seen or (pid, b - 1) in seen:
+                continue
+            seen.add((pid, b))
+            order.append((b, pid))
+            new[i] = True
+        # Forget beacons that can no longer have duplicates to come
+        oldest = np.floor(until / self.resolution) - 2
+        while order and order[0][0] < oldest:
+            b, pid = order.popleft()
+            seen.discard((pid, b))
+        return new
+
+    def stats(self):
+        """One line per source: records received and released per second
+        since the previous call, and total duplicates and late records"""
+        now = time.time()
+        out = []
+        for name, c in self.sources.items():
+            t, released = c._mark
+            c._mark = (now, c.released)
+            out.append('{!s:10s} {:7.0f} unique/s  {:10d} received  '
+                       '{:10d} duplicates  {:6d} late'.format(
+                       name, (c.released - released) / max(now - t, 1e-9),
+                       c.received, c.duplicates, c.late))
+        return '\n'.join(out)
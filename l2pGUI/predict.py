@@ -0,0 +1,167 @@
+#!/usr/bin/env python
+'''Short term prediction of plane positions.
+
+Every plane gets an alpha-beta filter (a constant velocity model) on
+its position in the topocentric frame of the receiving station, which
+is updated with every beacon at constant cost. Planes fly in nearly
+straight lines over a couple of minutes, so extrapolating the filtered
+position and velocity tells where they are heading.
+
+Predictor.closestApproach uses this to find, for all the planes in one
+batch, when they will come closest to a direction in the sky (the
+telescope pointing) during the next 'horizon' seconds, and how close.
+'''
+
+import numpy as np
+
+import beacons
+
+
+# Seconds ahead that planes are followed by default
+HORIZON = 120.
+
+
+class AlphaBeta(object):
+    """Alpha-beta filter of a position in 3D (m).
+
+    Parameters
+    ----------
+    t: time of the first position (s)
+    x: first position (3 numbers)
+    """
+    __slots__ = ('t', 'x', 'v', 'n')
+
+    def __init__(self, t, x):
+        self.t = t
+        self.x = list(x)
+        self.v = [0., 0., 0.]
+        self.n = 1
+
+    def update(self, t, z, alpha, beta, max_gap):
+        """Adds the position z measured at time t"""
+        dt = t - self.t
+        if dt <= 0:
+            return
+        x, v = self.x, self.v
+        if dt > max_gap:
+            # Too long since the last position to trust the velocity
+            self.__init__(t, z)
+            return
+        if self.n == 1:
+            # Velocity from the first two positions
+            for k in xrange(3):
+                v[k] = (z[k] - x[k]) / dt
+                x[k] = z[k]
+        else:
+            for k in xrange(3):
+                pred = x[k] + v[k] * dt
+                r = z[k] - pred
+                x[k] = pred + alpha * r
+                v[k] += beta / dt * r
+        self.t = t
+        self.n += 1
+
+
+class Predictor(object):
+    """Motion models of all the planes seen from one station.
+
+    Parameters
+    ----------
+    station: coords.Station the az/el are computed for
+    alpha, beta: filter gains for position and velocity
+    max_gap: seconds without beacons after which a plane's model starts
+             again
+    max_age: seconds without beacons after which a plane is forgotten
+    min_points: number of beacons before a plane is predicted
+    """
+    def __init__(self, station, alpha=0.5, beta=0.15, max_gap=30.,
+                 max_age=60., min_points=3):
+        self.station = station
+        self.alpha = alpha
+        self.beta = beta
+        self.max_gap = max_gap
+        self.max_age = max_age
+        self.min_points = min_points
+        self.filters = {}
+        self.now = -np.inf
+        self._pruned = -np.inf
+
+    def clear(self):
+        """Forgets all the planes (e.g. when time jumps)"""
+        self.filters = {}
+        self.now = self._pruned = -np.inf
+
+    def update(self, precs):
+        """Adds plane records (beacons.PLANE_DTYPE), in time order"""
+        if len(precs) == 0:
+            return
+        t = beacons.unixTime(precs['mjd'], precs['epc'])
+        x, y, z = self.station.geod2top(precs['lat'], precs['lon'],
+                                        precs['alt'] * 0.3048)
+        filters = self.filters
+        alpha, beta, max_gap = self.alpha, self.beta, self.max_gap
+        for pid, ti, pos in zip(precs['id'].tolist(), t.tolist(),
+                                zip(x.tolist(), y.tolist(), z.tolist())):
+            f = filters.get(pid)
+            if f is None:
+                filters[pid] = AlphaBeta(ti, pos)
+            else:
+                f.update(ti, pos, alpha, beta, max_gap)
+        self.now = max(self.now, t.max())
+        if self.now - self._pruned > self.max_age:
+            for pid in [k for k, flt in filters.iteritems()
+                        if self.now - flt.t > self.max_age]:
+                del filters[pid]
+            self._pruned = self.now
+
+    def state(self):
+        """Plane ids, times of the last update (s), and filtered
+        positions and velocities (rows, m and m/s) of the planes that
+        can be predicted"""
+        ready = [(pid, f) for pid, f in self.filters.iteritems()
+                 if f.n >= self.min_points]
+        if not ready:
+            return [], np.zeros(0), np.zeros((0, 3)), np.zeros((0, 3))
+        ids, filters = zip(*ready)
+        return (list(ids), np.array([f.t for f in filters]),
+                np.array([f.x for f in filters]),
+                np.array([f.v for f in filters]))
+
+    def positions(self, times):
+        """Predicted topocentric positions of the planes at the given
+        times (s).
+
+        Returns
+        -------
+        ids: plane ids
+        P: array of shape (planes, times, 3) of positions (m)
+        """
+        ids, T, X, V = self.state()
+        dt = np.asarray(times, dtype=float)[None, :, None] - T[:, None, None]
+        return ids, X[:, None, :] + V[:, None, :] * dt
+
+    def closestApproach(self, az, el, horizon=HORIZON, step=1.):
+        """Closest approach of every plane to the direction az, el
+        (radians) within the next 'horizon' seconds (from the time of
+        the latest beacon), checked every 'step' seconds. Times below
+        the horizon do not count.
+
+        Returns
+        -------
+        ids: plane ids
+        tca: seconds from now to the closest approach
+        sep: separation then (radians; inf if the plane stays below
+             the horizon)
+        P: predicted positions (planes, times, 3) every step seconds
+        """
+        taus = np.arange(0, horizon + step / 2., step)
+        ids, P = self.positions(self.now + taus)
+        u = np.array([np.cos(el) * np.cos(az), np.cos(el) * np.sin(az),
+                      np.sin(el)])
+        dot = P.dot(u)
+        cross = np.sqrt(np.maximum((P * P).sum(axis=2) - dot**2, 0))
+        ang = np.arctan2(cross, dot)
+        ang[P[:, :, 2] < 0] = np.inf
+        k = np.argmin(ang, axis=1) if len(ids) else np.zeros(0, dtype=int)
+        i = np.arange(len(ids))
+        return ids, taus[k], ang[i, k], P
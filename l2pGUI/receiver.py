@@ -0,0 +1,289 @@
+#!/usr/bin/env python
+'''Reception of l2planes data over TCP/IP.
+
+l2planes sends its output as a byte stream, so a single recv() can end
+in the middle of a line and the rest of it arrive with the next one.
+LineFramer reassembles complete lines from such a stream, keeping
+partial lines until they are completed.
+
+MultiClient keeps connections to any number of l2planes servers in a
+single select() loop, so that listening to several receivers does not
+take one process each. Every connection asks its server for new data
+at most once per poll interval, reconnects by itself with exponential
+backoff when it fails, and counts what it receives.
+'''
+
+import time
+import errno
+import socket
+import select
+
+# Bytes requested from the socket at a time, and receive buffer size
+RECV_SIZE = 2**16
+RCVBUF_SIZE = 2**20
+
+# String expected by listen2planes from clients
+REQUEST = 'reader\0'
+
+# Seconds between data requests, reconnection delays and the time
+# without an answer after which a connection is considered dead
+POLL = 0.
+BACKOFF_MIN = 1.5
+BACKOFF_MAX = 60.
+TIMEOUT = 30.
+
+# Seconds between connection statistics printed by the receiver
+STATS_INTERVAL = 600.
+
+
+class LineFramer(object):
+    """Splits a byte stream into complete lines.
+
+    Lines may be terminated by '\\n' or '\\0'. Terminators, carriage
+    returns and empty lines are discarded.
+    """
+    def __init__(self):
+        self._tail = ''
+
+    def feed(self, data):
+        """Adds received data; returns the lines completed by it"""
+        lines = (self._tail + data).replace('\0', '\n').split('\n')
+        self._tail = lines.pop()
+        return [line.rstrip('\r') for line in lines if line.strip()]
+
+    def flush(self):
+        """Returns the pending partial line, if any, and clears it"""
+        tail, self._tail = self._tail, ''
+        return [tail] if tail.strip() else []
+
+    @property
+    def pending(self):
+        """Number of bytes of the incomplete line kept so far"""
+        return len(self._tail)
+
+
+def serverList(config):
+    """Servers listed in a l2pGUI configuration.
+
+    The [Server] section gives the main server; further servers can be
+    added as sections named [Server <name>], with the same l2p_host and
+    l2p_port options.
+
+    Parameters
+    ----------
+    config: ConfigParser instance
+
+    Returns
+    -------
+    list of (name, (host, port)) tuples
+    """
+    servers = []
+    for section in config.sections():
+        if section == 'Server' or section.startswith('Server '):
+            name = section[len('Server '):] or 'main'
+            servers.append((name, (config.get(section, 'l2p_host'),
+                                   config.getint(section, 'l2p_port'))))
+    return servers
+
+
+def clientOptions(config):
+    """Poll interval and backoff limits from the [Server] section,
+    as keyword arguments for MultiClient"""
+    options = {}
+    for key in ('poll', 'backoff_min', 'backoff_max', 'timeout'):
+        if config.has_option('Server', key):
+            options[key] = config.getfloat('Server', key)
+    return options
+
+
+class Connection(object):
+    """State and counters of the connection to one l2planes server.
+
+    Parameters
+    ----------
+    name: label used in messages and statistics
+    address: (host, port) tuple
+    """
+    def __init__(self, name, address):
+        self.name = name
+        self.address = address
+        self.sock = None
+        self.state = 'closed'
+        self.framer = LineFramer()
+        self.delay = 0.
+        self.retry_at = 0.
+        self.requested = None
+        self.answered = True
+        self.waiting_since = 0.
+        # Counters
+        self.bytes = 0
+        self.lines = 0
+        self.connects = 0
+        self.failures = 0
+        self._mark = (time.time(), 0, 0)
+
+    def fileno(self):
+        return self.sock.fileno()
+
+    def rates(self):
+        """Bytes and lines per second since the previous call"""
+        now = time.time()
+        t, nbytes, nlines = self._mark
+        self._mark = (now, self.bytes, self.lines)
+        dt = max(now - t, 1e-9)
+        return (self.bytes - nbytes) / dt, (self.lines - nlines) / dt
+
+
+class MultiClient(object):
+    """Receives data lines from several l2planes servers in one loop.
+
+    Parameters
+    ----------
+    servers: list of (name, (host, port)) tuples (see serverList)
+    poll: minimum number of seconds between requests to a server
+    backoff_min, backoff_max: first and longest delay (seconds) before
+                              reconnecting to a failed server
+    timeout: seconds without an answer before reconnecting
+    """
+    def __init__(self, servers, poll=POLL, backoff_min=BACKOFF_MIN,
+                 backoff_max=BACKOFF_MAX, timeout=TIMEOUT):
+        self.connections = [Connection(name, address)
+                            for name, address in servers]
+        self.poll = poll
+        self.backoff_min = backoff_min
+        self.backoff_max = backoff_max
+        self.timeout = timeout
+
+    def _open(self, conn, now):
+        """Starts a non-blocking connection attempt"""
+        conn.sock = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+        conn.sock.setsockopt(socket.SOL_SOCKET, socket.SO_RCVBUF,
+                             RCVBUF_SIZE)
+        conn.sock.setblocking(0)
+        conn.answered = False
+        conn.framer = LineFramer()
+        conn.waiting_since = now
+        try:
+            # Resolving the host name can fail too (socket.gaierror)
+            err = conn.sock.connect_ex(conn.address)
+        except socket.error as msg:
+            self._fail(conn, now, 'Error connecting: {}'.format(msg))
+            return
+        if err in (0, errno.EISCONN):
+            self._connected(conn, now)
+        elif err in (errno.EINPROGRESS, errno.EWOULDBLOCK, errno.EALREADY):
+            conn.state = 'connecting'
+        else:
+            self._fail(conn, now, 'Error connecting: {}'.format(
+                       errno.errorcode.get(err, err)))
+
+    def _connected(self, conn, now):
+        conn.state = 'connected'
+        conn.requested = None
+        conn.answered = True
+        conn.connects += 1
+        print('Connected to {} {}:{}'.format(conn.name, *conn.address))
+
+    def _fail(self, conn, now, msg):
+        """Closes a connection and schedules the next attempt. A
+        partial line received before is incomplete by definition (e.g.
+        a plane line cut short, which would look like a telescope
+        line) and is dropped."""
+        conn.failures += 1
+        if conn.sock is not None:
+            conn.sock.close()
+            conn.sock = None
+        conn.delay = min(max(2 * conn.delay, self.backoff_min),
+                         self.backoff_max)
+        conn.retry_at = now + conn.delay
+        conn.state = 'closed'
+        if conn.framer.flush():
+            msg += ' (partial line dropped)'
+        print('{} ({}:{}): {}, retrying in {:.1f} s'.format(
+              conn.name, conn.address[0], conn.address[1], msg, conn.delay))
+
+    def step(self, wait=0.1):
+        """Runs the event loop once, waiting at most 'wait' seconds.
+
+        Returns
+        -------
+        list of (name, lines) for the connections that completed lines
+        """
+        now = time.time()
+        readers, writers = [], []
+        for conn in self.connections:
+            if conn.state == 'closed' and now >= conn.retry_at:
+                self._open(conn, now)
+            if (conn.state != 'closed' and not conn.answered and
+                now - conn.waiting_since > self.timeout):
+                self._fail(conn, now, 'No answer')
+            if conn.state == 'connecting':
+                writers.append(conn)
+            elif conn.state == 'connected':
+                if conn.answered and (conn.requested is None or
+                                      now - conn.requested >= self.poll):
+                    try:
+                        conn.sock.send(REQUEST)
+                        conn.requested = conn.waiting_since = now
+                        conn.answered = False
+                    except socket.error as msg:
+                        self._fail(conn, now, 'Failed to send: {}'.format(msg))
+                        continue
+                readers.append(conn)
+
+        # Wake up in time for the next retry or request
+        for conn in self.connections:
+            if conn.state == 'closed':
+                wait = min(wait, conn.retry_at - now)
+            elif conn.state == 'connected' and conn.answered:
+                wait = min(wait, conn.requested + self.poll - now)
+        wait = max(wait, 0)
+        if not readers and not writers:
+            time.sleep(wait)
+            return []
+        readable, writable, _ = select.select(readers, writers, [], wait)
+
+        now = time.time()
+        received = []
+        for conn in writable:
+            err = conn.sock.getsockopt(socket.SOL_SOCKET, socket.SO_ERROR)
+            if err:
+                self._fail(conn, now, 'Error connecting: {}'.format(
+                           errno.errorcode.get(err, err)))
+            else:
+                self._connected(conn, now)
+        for conn in readable:
+            try:
+                data = conn.sock.recv(RECV_SIZE)
+            except socket.error as msg:
+                self._fail(conn, now, 'Failed to receive: {}'.format(msg))
+                continue
+            if not data:
+                self._fail(conn, now, 'Connection closed')
+                continue
+            conn.answered = True
+            conn.delay = 0.
+            conn.bytes += len(data)
+            lines = conn.framer.feed(data)
+            if lines:
+                conn.lines += len(lines)
+                received.append((conn.name, lines))
+        return received
+
+    def close(self):
+        for conn in self.connections:
+            if conn.sock is not None:
+                conn.sock.close()
+                conn.sock = None
+            conn.state = 'closed'
+
+    def stats(self):
+        """One line per connection: state, totals and current rates"""
+        out = []
+        for conn in self.connections:
+            bps, lps = conn.rates()
+            out.append('{:10s} {:10s} {:8.1f} kB/s {:7.0f} lines/s  '
+                       '{:10d} lines  {} connects {} failures'.format(
+                       conn.name, conn.state, bps / 1e3, lps, conn.lines,
+                       conn.connects, conn.failures))
+        return '\n'.join(out)
@@ -0,0 +1,578 @@
+#!/usr/bin/env python
+'''Time handling for replays of l2planes data.
+
+A replay file (text dump or binary archive) is indexed by beacon time:
+TimeIndex keeps, every 'step' seconds of data, the position (byte offset
+in a text dump, row in an archive) of the first line reaching that time.
+Going to a given time is then one binary search in the index plus one
+seek in the file, landing at most 'step' seconds early.
+
+Indices are built on first use and saved next to the data file, with
+the extension .idx. They are rebuilt if the data file changes.
+
+Text dumps can be compressed and rotated (see dumpfile.py). The index
+of a compressed file is by decompressed byte offsets, and a rotated
+dump gets one index per file; ReplaySource combines them and reads the
+files one after the other as a single dump. The index of a gzip file
+also keeps where each of its gzip members starts (--dump2file writes
+one every few seconds), so the seek goes to the member holding the
+position and decompresses only from there. bzip2 files have no such
+points and are decompressed from the beginning on every seek.
+
+Several dumps (e.g. one per receiver), given as a directory or a glob
+pattern, are replayed together by MergedSource: a k-way merge by
+beacon time of one ReplaySource per dump, which reads and decompresses
+each of them as it goes, so a replay starts straight away however much
+data there is. openReplay picks ReplaySource or MergedSource.
+
+ReplaySource reads a replay file in time order and hands out exactly
+the beacons up to a given time; ReplayClock turns wall-clock time into
+simulated (data) time at a chosen speed, so that replays run at a rate
+independent of how busy the sky was.
+'''
+
+import os
+import time
+import heapq
+import calendar
+import datetime as dt
+
+import numpy as np
+
+import beacons
+import archive
+import dumpfile
+import jdates as jd
+
+
+INDEX_EXT = '.idx'
+# Positions in the combined index of a rotated dump are offsets within
+# file number position >> PART_SHIFT
+PART_SHIFT = 40
+
+
+class TimeIndex(object):
+    """Sparse index from beacon time (Unix seconds) to file position.
+
+    Parameters
+    ----------
+    times: beacon time at each indexed position (non-decreasing)
+    positions: byte offsets (text dumps) or rows (archives)
+    step: seconds of data between index entries
+    members: for gzip files, where their members start (see
+             dumpfile.gzipMembers)
+    """
+    def __init__(self, times, positions, step, members=None):
+        self.times = np.asarray(times, dtype=float)
+        self.positions = np.asarray(positions, dtype=np.int64)
+        self.step = step
+        self.members = members
+
+    def __len__(self):
+        return len(self.times)
+
+    @property
+    def start(self):
+        """Time of the first beacon"""
+        return self.times[0] if len(self.times) else 0.
+
+    @property
+    def end(self):
+        """Time of the first beacon of the last indexed step"""
+        return self.times[-1] if len(self.times) else 0.
+
+    def lookup(self, t):
+        """Position to read from to see beacons from time t onwards"""
+        i = np.searchsorted(self.times, t, side='right') - 1
+        return int(self.positions[max(i, 0)]) if len(self.positions) else 0
+
+
+class _Sparsifier(object):
+    """Keeps the first position of each 'step' seconds of data,
+    fed one block of (times, positions) after another"""
+    def __init__(self, step):
+        self.step = step
+        self.tmax = -np.inf
+        self.bucket = -np.inf
+        self.times, self.positions = [], []
+
+    def add(self, times, positions):
+        if len(times) == 0:
+            return
+        # Running maximum, so that the index only ever moves forward
+        tmax = np.maximum.accumulate(np.r_[self.tmax, times])[1:]
+        bucket = np.floor(tmax / self.step)
+        new = bucket > np.r_[self.bucket, bucket[:-1]]
+        self.times.append(tmax[new])
+        self.positions.append(positions[new])
+        self.tmax, self.bucket = tmax[-1], bucket[-1]
+
+    def index(self):
+        if not self.times:
+            return TimeIndex([], [], self.step)
+        return TimeIndex(np.concatenate(self.times),
+                         np.concatenate(self.positions), self.step)
+
+
+def _blockTimes(block):
+    """Beacon times and line offsets (within block) of the plane and
+    telescope lines of a text block"""
+    fstarts, fstops, counts = beacons.fieldBounds(block)
+    b = np.frombuffer(block, dtype=np.uint8)
+    starts = np.r_[0, np.flatnonzero(b == 10) + 1]
+    timed = np.flatnonzero((counts == beacons.PLANE_FIELDS) |
+                           (counts == beacons.TEL_FIELDS))
+    first = (np.cumsum(counts) - counts)[timed]
+    mjd = [block[i:j] for i, j in zip(fstarts[first], fstops[first])]
+    epc = [block[i:j] for i, j in zip(fstarts[first + 1], fstops[first + 1])]
+    try:
+        mjd, epc = np.array(mjd, dtype=float), np.array(epc, dtype=float)
+    except ValueError:
+        # Lines with times that are not numbers are skipped, as
+        # beacons.parse_lines drops them
+        good = [k for k, f in enumerate(zip(mjd, epc)) if _isTime(f)]
+        timed = timed[good]
+        mjd = np.array([mjd[k] for k in good], dtype=float)
+        epc = np.array([epc[k] for k in good], dtype=float)
+    return beacons.unixTime(mjd, epc), starts[timed]
+
+
+def _isTime(fields):
+    """True if the (mjd, epoch) fields of a line are numbers"""
+    try:
+        [float(f) for f in fields]
+    except ValueError:
+        return False
+    return True
+
+
+def buildIndex(source, step=10, blocksize=2**24):
+    """Indexes a replay file by beacon time.
+
+    Parameters
+    ----------
+    source: text dump file name (possibly compressed) or archive.Archive
+            instance
+    step: seconds of data between index entries
+    blocksize: approximate number of bytes (or 64 byte rows) scanned
+               at a time
+
+    Returns
+    -------
+    TimeIndex instance
+    """
+    sparse = _Sparsifier(step)
+    if isinstance(source, archive.Archive):
+        nrows = blocksize // 64
+        for start in xrange(0, len(source), nrows):
+            stop = start + nrows
+            sparse.add(beacons.unixTime(source.mjd[start:stop],
+                                        source.epc[start:stop]),
+                       np.arange(start, min(stop, len(source))))
+        return sparse.index()
+    f = dumpfile.openDump(source)
+    try:
+        while True:
+            offset = f.tell()
+            block = dumpfile.readBlock(f, blocksize)
+            if not block:
+                break
+            times, starts = _blockTimes(block)
+            sparse.add(times, starts + offset)
+    finally:
+        f.close()
+    return sparse.index()
+
+
+def openIndex(fname, source=None, step=10):
+    """Time index of a replay file, built and cached if needed.
+
+    Parameters
+    ----------
+    fname: text dump or archive file name
+    source: already opened archive.Archive of fname, if any
+    step: seconds of data between index entries (if built)
+
+    Returns
+    -------
+    TimeIndex instance
+    """
+    st = os.stat(fname)
+    idxname = fname + INDEX_EXT
+    gz = dumpfile.compression(fname) == 'gzip'
+    try:
+        with open(idxname, 'rb') as f:
+            saved = np.load(f)
+            if (saved['size'] == st.st_size and
+                saved['mtime'] == st.st_mtime):
+                members = (saved['starts'], saved['raw']) if gz else None
+                return TimeIndex(saved['times'], saved['positions'],
+                                 float(saved['step']), members)
+    except (IOError, OSError, KeyError, ValueError):
+        pass
+    t0 = time.time()
+    index = buildIndex(fname if source is None else source, step)
+    extra = {}
+    if gz:
+        index.members = dumpfile.gzipMembers(fname)
+        extra = dict(zip(('starts', 'raw'), index.members))
+    print('{} indexed in {:<4.2f} seconds'.format(fname, time.time() - t0))
+    try:
+        with open(idxname, 'wb') as f:
+            np.savez(f, times=index.times, positions=index.positions,
+                     step=step, size=st.st_size, mtime=st.st_mtime,
+                     **extra)
+    except (IOError, OSError):
+        # Read-only location; the index is simply not cached
+        pass
+    return index
+
+
+class ReplaySource(object):
+    """Time-ordered reader of a replay file (text dump or archive).
+
+    Parameters
+    ----------
+    fname: text dump or archive file name; a dump written rotated or
+           compressed can be given by the name it was written under
+           (see dumpfile.dumpParts)
+    blocksize: approximate number of bytes read at a time
+    parts: files making up the dump, in time order (default: found
+           from fname)
+    """
+    def __init__(self, fname, blocksize=2**18, parts=None):
+        self.fname = fname
+        self.blocksize = blocksize
+        self.parts = parts or dumpfile.dumpParts(fname)
+        self._file = None
+        self._index = None
+        self._members = [None] * len(self.parts)
+        if len(self.parts) == 1 and archive.isArchive(self.parts[0]):
+            self.archive = archive.Archive(self.parts[0])
+        else:
+            self.archive = None
+        self._reset(0)
+        # The first beacons tell when the data start, without indexing.
+        # Telescope lines count, as in the index, and a dump may open
+        # with blocks holding no plane lines at all
+        self.start = None
+        while self.start is None and not self.eof:
+            checked = len(self._tlines)
+            self._fill()
+            tel = next((line for line in self._tlines[checked:]
+                        if _isTime(_timeFields(line))), None)
+            times = np.r_[self._times[:1], _lineTimes([tel] if tel else [])]
+            if len(times):
+                self.start = times.min()
+        if self.start is None:
+            self.start = self.index.start
+
+    @property
+    def index(self):
+        """TimeIndex of the file, opened (or built) when first needed"""
+        if self._index is None:
+            if self.archive is not None:
+                self._index = openIndex(self.parts[0], self.archive)
+            else:
+                self._index = self._combinedIndex()
+        return self._index
+
+    def _combinedIndex(self):
+        """Index of all the parts of a text dump"""
+        indices = [openIndex(part) for part in self.parts]
+        self._members = [index.members for index in indices]
+        if len(indices) == 1:
+            return indices[0]
+        times = np.concatenate([index.times for index in indices])
+        positions = np.concatenate([index.positions +
+                                    (np.int64(i) << PART_SHIFT)
+                                    for i, index in enumerate(indices)])
+        return TimeIndex(np.maximum.accumulate(times), positions,
+                         indices[0].step)
+
+    def _open(self, part, offset=0):
+        """Continue reading from byte offset of file number part"""
+        if self._file is not None:
+            self._file.close()
+        self._part = part
+        self._file = dumpfile.openDump(self.parts[part], offset,
+                                       self._members[part])
+
+    def _reset(self, pos):
+        """Forget pending data and continue reading from pos"""
+        self.pos = pos
+        if self.archive is None:
+            self._open(pos >> PART_SHIFT, pos & ((1 << PART_SHIFT) - 1))
+        self.eof = False
+        self._tmax = -np.inf
+        self._precs = beacons.planeRecords([])
+        self._times = np.zeros(0)
+        self._tlines = []
+        self._trows = np.zeros(0, dtype=int)
+
+    def _readChunk(self):
+        """Reads the next block of the file.
+
+        Returns plane records, their release times, telescope lines and
+        the number of plane records preceding each of these
+        """
+        if self.archive is not None:
+            precs, tlines, trows, self.pos = self.archive.read(
+                self.pos, self.blocksize // 64, rows=True)
+            self.eof = self.pos >= len(self.archive)
+        else:
+            block = dumpfile.readBlock(self._file, self.blocksize)
+            while not block and self._part + 1 < len(self.parts):
+                self._open(self._part + 1)
+                block = dumpfile.readBlock(self._file, self.blocksize)
+            # A block may hold no beacons at all (e.g. only control
+            # lines); only the end of the last file ends the replay
+            self.eof = not block
+            precs, tlines, _, trows = beacons.parse_lines(block, rows=True)
+            self.pos = (self._part << PART_SHIFT) + self._file.tell()
+        # Release times only move forward (running maximum)
+        t = beacons.unixTime(precs['mjd'], precs['epc'])
+        t = np.maximum.accumulate(np.r_[self._tmax, t])[1:]
+        if len(t):
+            self._tmax = t[-1]
+        return precs, t, tlines, trows
+
+    def _fill(self, t=None):
+        """Reads blocks until the release times pass t (one block if t
+        is None), and adds them to the pending data"""
+        parts = [(self._precs, self._times, self._tlines, self._trows)]
+        nrows = len(self._precs)
+        while not self.eof:
+            precs, times, tlines, trows = self._readChunk()
+            parts.append((precs, times, tlines, trows + nrows))
+            nrows += len(precs)
+            if t is None or self._tmax >= t:
+                break
+        precs, times, tlines, trows = zip(*parts)
+        self._precs = np.concatenate(precs)
+        self._times = np.concatenate(times)
+        self._tlines = sum(tlines, [])
+        self._trows = np.concatenate(trows)
+
+    @property
+    def frontier(self):
+        """Release time up to which the data have been read (inf at the
+        end)"""
+        return np.inf if self.eof else self._tmax
+
+    def readUntil(self, t):
+        """Plane records and telescope lines from the current position
+        up to (not including) time t (Unix seconds)"""
+        precs, times, tlines = self._take(t)
+        return precs, tlines
+
+    def _take(self, t):
+        """readUntil, also returning the release times of the records"""
+        if not self.eof and self._tmax < t:
+            self._fill(t)
+        n = np.searchsorted(self._times, t)
+        if self.eof and n == len(self._precs):
+            k = len(self._tlines)
+        else:
+            k = np.searchsorted(self._trows, n, side='right')
+        precs, self._precs = self._precs[:n], self._precs[n:]
+        times, self._times = self._times[:n], self._times[n:]
+        tlines, self._tlines = self._tlines[:k], self._tlines[k:]
+        self._trows = self._trows[k:] - n
+        return precs, times, tlines
+
+    def seek(self, t):
+        """Continue reading from time t (Unix seconds)"""
+        self._reset(self.index.lookup(t))
+        self.readUntil(t)
+
+    @property
+    def finished(self):
+        """True once everything has been read"""
+        return self.eof and len(self._precs) == 0 and not self._tlines
+
+
+def _timeFields(line):
+    """(mjd, epoch) fields of a line, split as beacons.fieldBounds does"""
+    starts, stops, _ = beacons.fieldBounds(line)
+    return [line[i:j] for i, j in zip(starts[:2], stops[:2])]
+
+
+def _lineTimes(lines):
+    """Beacon times (Unix seconds) of telescope lines, whose times must
+    be numbers"""
+    if not lines:
+        return np.zeros(0)
+    mjd, epc = np.array([_timeFields(line) for line in lines],
+                        dtype=float).T
+    return beacons.unixTime(mjd, epc)
+
+
+class MergedSource(object):
+    """Time-ordered reader of several replay files at once, with the
+    same interface as ReplaySource.
+
+    Parameters
+    ----------
+    sources: ReplaySource instances, one per dump
+    """
+    def __init__(self, sources):
+        self.sources = sources
+        self.fname = ', '.join(s.fname for s in sources)
+        # Dumps without any beacons do not hold the replay back
+        self.start = min([s.start for s in sources if not s.finished] or
+                         [0.])
+        self._index = None
+
+    @property
+    def index(self):
+        """TimeIndex of all the beacon times indexed in the sources.
+        Its positions are meaningless: seek goes through the index of
+        each source."""
+        if self._index is None:
+            times = np.sort(np.concatenate([s.index.times
+                                            for s in self.sources]))
+            self._index = TimeIndex(times, np.zeros(len(times)),
+                                    max(s.index.step for s in self.sources))
+        return self._index
+
+    def readUntil(self, t):
+        """Plane records and telescope lines of all the sources from the
+        current position up to (not including) time t (Unix seconds),
+        in time order"""
+        parts = [s._take(t) for s in self.sources]
+        precs, times, tlines = zip(*parts)
+        precs = np.concatenate(precs)
+        order = np.argsort(np.concatenate(times), kind='mergesort')
+        # Lines with times that are not numbers cannot be put in order;
+        # they are left out
+        tlines = [line for line in sum(tlines, [])
+                  if _isTime(_timeFields(line))]
+        torder = np.argsort(_lineTimes(tlines), kind='mergesort')
+        return precs[order], [tlines[i] for i in torder]
+
+    def blocks(self):
+        """Plane records and telescope lines of all the sources, in time
+        order, one block at a time: a heap keeps the sources ordered by
+        how far they have been read, the one furthest behind is read
+        next, and everything before the least advanced one is released.
+        """
+        heap = [(s.frontier, k) for k, s in enumerate(self.sources)]
+        heapq.heapify(heap)
+        while heap[0][0] < np.inf:
+            frontier, k = heapq.heappop(heap)
+            self.sources[k]._fill()
+            heapq.heappush(heap, (self.sources[k].frontier, k))
+            precs, tlines = self.readUntil(heap[0][0])
+            if len(precs) or tlines:
+                yield precs, tlines
+        precs, tlines = self.readUntil(np.inf)
+        if len(precs) or tlines:
+            yield precs, tlines
+
+    def seek(self, t):
+        """Continue reading from time t (Unix seconds)"""
+        for s in self.sources:
+            s.seek(t)
+
+    @property
+    def finished(self):
+        """True once everything has been read"""
+        return all(s.finished for s in self.sources)
+
+
+def openReplay(spec, blocksize=2**18):
+    """Reader of the dumps named by spec: a ReplaySource for a single
+    dump, a MergedSource for several (see dumpfile.dumpStreams)"""
+    streams = dumpfile.dumpStreams(spec)
+    if not streams:
+        raise IOError('No dumps found in {}'.format(spec))
+    if len(streams) == 1:
+        return ReplaySource(spec, blocksize, streams[0])
+    return MergedSource([ReplaySource(parts[0], blocksize, parts)
+                         for parts in streams])
+
+
+class ReplayClock(object):
+    """Simulated time of a replay, driven by the wall clock.
+
+    Every tick moves simulated time forward by the wall time elapsed
+    since the previous one, times the speed. A slow frame therefore
+    covers more simulated time instead of slowing the replay down;
+    the frames that did not make it are counted as dropped.
+
+    Parameters
+    ----------
+    t0: simulated time to start at (Unix seconds)
+    speed: simulated seconds per wall second
+    interval: nominal time between ticks (seconds)
+    """
+    def __init__(self, t0, speed=1., interval=1.):
+        self.speed = speed
+        self.interval = interval
+        self.frames = 0
+        self.dropped = 0
+        self.sim_elapsed = 0.
+        self.wall_elapsed = 0.
+        self.reset(t0)
+
+    def reset(self, t0):
+        """Jump to simulated time t0"""
+        self.time = t0
+        self._wall = None
+
+    def tick(self):
+        """Advance to the current wall time; returns the simulated time"""
+        now = time.time()
+        if self._wall is None:
+            dt = self.interval
+        else:
+            dt = now - self._wall
+            self.wall_elapsed += dt
+            self.sim_elapsed += dt * self.speed
+            self.dropped += max(int(dt / self.interval + 0.5) - 1, 0)
+        self._wall = now
+        self.frames += 1
+        self.time += dt * self.speed
+        return self.time
+
+    @property
+    def rate(self):
+        """Measured simulated seconds per wall second"""
+        if not self.wall_elapsed:
+            return 0.
+        return self.sim_elapsed / self.wall_elapsed
+
+    def summary(self):
+        return ('{} frames ({} dropped), {:.1f} simulated s per wall s '
+                '(speed {:g}x)'.format(self.frames, self.dropped, self.rate,
+                                       self.speed))
+
+
+def parseTime(s, ref=None):
+    """Converts a date/time string to Unix seconds.
+
+    Accepted formats are 'YYYY-MM-DD HH:MM[:SS]' (or with a 'T' instead
+    of the space) and 'HH:MM[:SS]'. The latter refers to the first
+    occurrence of that time of day at or after ref (Unix seconds).
+    Raises ValueError for anything else.
+    """
+    s = s.strip().replace('T', ' ')
+    for fmt in ('%Y-%m-%d %H:%M:%S', '%Y-%m-%d %H:%M', '%Y-%m-%d'):
+        try:
+            return float(calendar.timegm(
+                         dt.datetime.strptime(s, fmt).timetuple()))
+        except ValueError:
+            pass
+    fields = s.split(':')
+    if len(fields) not in (2, 3):
+        raise ValueError('Not a time: {!r}'.format(s))
+    secs = jd.hms2s(*[float(v) for v in fields])
+    ref = 0. if ref is None else ref
+    t = ref // 86400 * 86400 + secs
+    return t if t >= ref else t + 86400
+
+
+def formatTime(t):
+    """Unix seconds to 'YYYY-MM-DD HH:MM:SS'"""
+    return dt.datetime.utcfromtimestamp(t).strftime('%Y-%m-%d %H:%M:%S')
@@ -0,0 +1,124 @@
+#!/usr/bin/env python
+'''Shared memory ring buffer for plane records.
+
+BeaconRing carries parsed plane records (beacons.PLANE_DTYPE) from the
+receiver process to the GUI without pickling them through a queue. It
+is a single-producer/single-consumer ring in a multiprocessing.RawArray:
+the producer only ever writes the head counter and the consumer only
+ever writes the tail counter, so no locks are needed and neither side
+ever waits for the other.
+
+The producer never blocks either: when the consumer falls behind by
+more than the capacity of the ring, the oldest records are overwritten.
+The consumer notices, skips them and counts them in 'dropped'. To tell
+records overwritten while it was copying them, the producer announces
+every write in a second counter (reserve) before touching the slots,
+and publishes it in head only once they are written; the consumer
+checks reserve after its copy.
+
+Stores from one process are assumed to become visible to the other in
+program order (true on x86).
+'''
+
+import ctypes
+import multiprocessing
+
+import numpy as np
+
+import beacons
+
+
+# Producer (head, reserve) and consumer (tail, dropped) counters live
+# in separate cache lines
+_HEAD = 0
+_RESERVE = 8
+_TAIL = 64
+_DROPPED = 72
+_HEADER = 128
+
+
+class BeaconRing(object):
+    """Single-producer/single-consumer ring of plane records.
+
+    Parameters
+    ----------
+    capacity: number of records the ring holds
+    """
+    def __init__(self, capacity=2**16):
+        self.capacity = capacity
+        nbytes = _HEADER + capacity * beacons.PLANE_DTYPE.itemsize
+        self._raw = multiprocessing.RawArray(ctypes.c_char, nbytes)
+        self._views()
+
+    def _views(self):
+        buf = np.frombuffer(self._raw, dtype=np.uint8)
+        self._counters = buf[:_HEADER].view(np.uint64)
+        self._slots = buf[_HEADER:].view(beacons.PLANE_DTYPE)
+
+    def __getstate__(self):
+        # Only needed where child processes are not forked (Windows);
+        # RawArray knows how to share itself with them
+        return self.capacity, self._raw
+
+    def __setstate__(self, state):
+        self.capacity, self._raw = state
+        self._views()
+
+    def _counter(self, offset):
+        return int(self._counters[offset // 8])
+
+    def _set(self, offset, value):
+        self._counters[offset // 8] = value
+
+    def __len__(self):
+        """Records currently waiting to be read (at most capacity)"""
+        return min(self._counter(_HEAD) - self._counter(_TAIL), self.capacity)
+
+    @property
+    def dropped(self):
+        """Records overwritten before the consumer could read them"""
+        return self._counter(_DROPPED)
+
+    def put(self, recs):
+        """Producer side: appends records, overwriting the oldest ones
+        if the ring is full"""
+        n = len(recs)
+        if n == 0:
+            return
+        head = self._counter(_HEAD)
+        if n > self.capacity:
+            recs = recs[-self.capacity:]
+        k = len(recs)
+        start = (head + n - k) % self.capacity
+        first = min(k, self.capacity - start)
+        self._set(_RESERVE, head + n)
+        self._slots[start:start + first] = recs[:first]
+        self._slots[:k - first] = recs[first:]
+        self._set(_HEAD, head + n)
+
+    def drain(self, max_records=None):
+        """Consumer side: returns (a copy of) the waiting records,
+        oldest first, without waiting if there are none"""
+        head = self._counter(_HEAD)
+        tail = self._counter(_TAIL)
+        dropped = 0
+        if head - tail > self.capacity:
+            dropped = head - tail - self.capacity
+            tail = head - self.capacity
+        if max_records is not None:
+            head = min(head, tail + max_records)
+        n = head - tail
+        start = tail % self.capacity
+        first = min(n, self.capacity - start)
+        recs = np.concatenate((self._slots[start:start + first],
+                               self._slots[:n - first]))
+        # Records the producer overwrote, or started to, while they were
+        # being copied
+        lost = self._counter(_RESERVE) - self.capacity - tail
+        if lost > 0:
+            recs = recs[lost:]
+            dropped += min(lost, n)
+        self._set(_TAIL, head)
+        if dropped:
+            self._set(_DROPPED, self.dropped + dropped)
+        return recs
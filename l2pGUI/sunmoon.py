@@ -3,7 +3,9 @@
 import math
 from math import sin
 from math import cos
+import numpy as np
 import coords_math as cds
+import coords
 
 
 D2R = math.pi / 180
@@ -195,9 +197,141 @@ def moonazel(JD=2448908.5, Lat=50.867387222, Lon=0.33612916666, H=75.357):
     return az, el, r
 
 
+# Numpy versions of the functions above, for arrays of Julian dates.
+# Same algorithms and the same order of operations, so they agree with 
+# the scalar versions to rounding.
 
+def moonpos_vec(JD):
+    '''Moon position in geocentric, body-fixed coordinates (see moonpos)
+    for an array of Julian dates'''
+    d = np.asarray(JD, dtype=float) - 2451545.0
+    T = d / 36525.0
+
+    L0 = 218.31617 + 481267.88088 * T - 1.3972 * T
+    l = (134.96292 + 477198.86753 * T) * D2R
+    lp = (357.52543 + 35999.04944 * T) * D2R
+    F = (93.27283 + 483202.01873 * T) * D2R
+    D = (297.85027 + 445267.11135 * T) * D2R
+    L0 = L0 * 3600
+
+    lambda_m = (L0 + 22640 * np.sin(l) + 769 * np.sin(2*l) -
+                4586 * np.sin(l - 2*D) + 2370 * np.sin(2*D) -
+                668 * np.sin(lp) - 412 * np.sin(2*F) - 
+                212 * np.sin(2*l - 2*D) - 206 * np.sin(l + lp - 2*D) +
+                192 * np.sin(l + 2*D) - 165 * np.sin(lp - 2*D) +
+                148 * np.sin(l - lp) - 125 * np.sin(D) -
+                110 * np.sin(l + lp) - 55 * np.sin(2*F - 2*D) )
+
+    lm = np.mod(lambda_m / 3600, 360) * D2R
+    L0 = L0 / 3600 * D2R
+
+    beta_m = (
+        18520 * np.sin(F + lm - L0 + 412*S2R * np.sin(2*F) +
+                       541*S2R * np.sin(lp)) -
+        526 * np.sin(F - 2*D) + 44 * np.sin(l + F - 2*D) -
+        31 * np.sin(-l + F - 2*D) - 25 * np.sin(-2*l + F) -
+        23 * np.sin(lp + F - 2*D) + 21 * np.sin(-l + F) +
+        11 * np.sin(-lp + F - 2 *D) )
+
+    rM = (385000 - 20905 * np.cos(l) - 3699 * np.cos(2*D - l) - 
+        2956 * np.cos(2*D) - 570 * np.cos(2*l) + 246 * np.cos(2*l - 2*D) -
+        205 * np.cos(lp - 2*D) - 171 * np.cos(l + 2*D) -
+        152 * np.cos(l + lp - 2*D)) * 1000
+
+    lm = lm + (1.3972 * T) * D2R
 
+    x = rM * np.cos(lm) * np.cos(beta_m * S2R)
+    y = rM * np.sin(lm) * np.cos(beta_m * S2R)
+    z = rM * np.sin(beta_m * S2R)
+
+    ecl = 23.43929111 * D2R
+    s = sin(-ecl)
+    c = cos(-ecl)
+    y, z = (y * c + z * s, -y * s + z * c)
+
+    theta = np.radians(280.46061837 + 360.98564736629 * d)
+    s = np.sin(theta)
+    c = np.cos(theta)
+    x, y  = (x * c + y * s, -x * s + y * c)
+    return x, y, z
+
+
+def sunpos_lacc_vec(JD):
+    '''Sun position (see sunpos_lacc) for an array of Julian dates'''
+    JD = np.asarray(JD, dtype=float)
+    d = (JD - 2451545.0)
+    T = d / 36525.0
+
+    M = 357.5256 + 35999.049 * T
+    l = (282.94 + M + 6892./3600 * np.sin(M * D2R) +
+         72./3600 * np.sin(2 * M * D2R))
+    r = (149.619 - 2.499 * np.cos(M * D2R) - 0.021 * np.cos(2 * M * D2R)) * 1e6
+    ecl = 23.4392911
+
+    x = r * np.cos(l * D2R)
+    y = r * np.sin(l * D2R) * cos(ecl * D2R)
+    z = r * np.sin(l * D2R) * sin(ecl * D2R)
+
+    theta = (280.46061837 + 360.98564736629 * (JD - 2451545.0) +
+             0.000387933 * T**2 - T**3 / 38710000)
+    sint = np.sin(theta * D2R)
+    cost = np.cos(theta * D2R)
+    x, y = (x*cost + y*sint, y*cost - x*sint)
+    return x, y, z
+
+
+def sunpos_vec(JD):
+    '''Sun position (see sunpos) for an array of Julian dates'''
+    JD = np.asarray(JD, dtype=float)
+    T = (JD - 2451545.0) / 36525
+
+    L0 = 280.46646 + 36000.76983 * T + 0.0003032 * T**2
+    M = 357.52911 + 35999.05029 * T - 0.0001537 * T**2
+    e = 0.016708634 - 0.000042037 * T - 0.0000001267 * T**2
+
+    C = ((1.914602 - 0.004817 * T - 0.000014 * T**2) * np.sin(M * D2R) +
+         (0.019993 - 0.000101 * T) * np.sin(2 * M * D2R) + 
+         0.000289 * np.sin(3 * M * D2R) )
+
+    Theta = L0 + C
+    v = M + C
+    R = 1.000001018 * (1 - e**2) / (1 + e * np.cos(v * D2R)) * 1.49597870e11
+
+    Omg = 125.04 - 1934.136 * T
+    lon = Theta - 0.00569 - 0.00478 * np.sin(Omg * D2R)
+
+    eps = (23 + (26 + (21.448 / 60)) / 60 - 
+           46.8150 / 3600 * T -
+           0.00059 / 3600 * T**2 +
+           0.001813/ 3600 * T**3)
+
+    x = R * np.cos(lon * D2R)
+    y = R * np.sin(lon * D2R) * np.cos(eps * D2R)
+    z = R * np.sin(lon * D2R) * np.sin(eps * D2R)
+
+    the = (280.46061837 + 360.98564736629 * (JD - 2451545.0) +
+           0.000387933 * T**2 - T**3 / 38710000)
+    sint = np.sin(the * D2R)
+    cost = np.cos(the * D2R)
+    x, y = (x*cost + y*sint, y*cost - x*sint)
+    return x, y, z
+
+
+def sunazel_lacc_vec(JD, Lat=50.867387222, Lon=0.33612916666, H=75.357):
+    '''Sun's azimuth, elevation and range for an array of Julian dates.
+    
+    Low-precision algorithm'''
+    x, y, z = sunpos_lacc_vec(JD)
+    return coords.geo2azel(x, y, z, Lat, Lon, H)
 
 
+def sunazel_vec(JD, Lat=50.867387222, Lon=0.33612916666, H=75.357):
+    '''Sun's azimuth, elevation and range for an array of Julian dates'''
+    x, y, z = sunpos_vec(JD)
+    return coords.geo2azel(x, y, z, Lat, Lon, H)
 
 
+def moonazel_vec(JD, Lat=50.867387222, Lon=0.33612916666, H=75.357):
+    '''Moon's azimuth, elevation and range for an array of Julian dates'''
+    x, y, z = moonpos_vec(JD)
+    return coords.geo2azel(x, y, z, Lat, Lon, H)
@@ -0,0 +1,132 @@
+#!/usr/bin/env python
+'''Table of the current planes in the terminal.
+
+TableView redraws the table in place with ANSI escape sequences
+instead of clearing the screen: the cursor is moved to the rows that
+changed since the previous frame and only those are rewritten, all in
+a single write. It never runs any other program, and it redraws at
+most max_rate times per second however often it is called. Other 
+output to the terminal can shift the table, so once in a while it is
+redrawn completely.
+
+     hex      id       Az  El      Lon     Lat        Alt   Dist   Tel
+    --------------------------------------------------------------------
+     a2b728  UPS203    291 15.4    -0.199   50.994    11278  41.7  12.3
+'''
+
+import os
+import sys
+import time
+
+import numpy as np
+
+from conflicts import separation
+
+
+# ANSI control sequences
+CLEAR = '\x1b[2J'
+CLEAR_LINE = '\x1b[2K'
+CLEAR_BELOW = '\x1b[J'
+GOTO = '\x1b[{};1H'
+
+HEADER = (' hex      id       Az  El      Lon     Lat        Alt   Dist   Tel',
+          '-' * 68)
+ROW = '{:8s}{:8s} {:4.0f}{:5.1f} {:>9.3f}{:>9.3f} {:>8.0f}{:>6.1f}{:>6s}'
+
+# Sort orders
+SORTS = {'el': 'elevation (highest first)',
+         'range': 'range (closest first)',
+         'tel': 'distance to the telescope (closest first)'}
+
+
+def terminalRows(default=40):
+    """Number of rows of the terminal, or default if unknown"""
+    try:
+        import fcntl
+        import struct
+        import termios
+        rows, cols = struct.unpack('hh', fcntl.ioctl(sys.stdout.fileno(),
+                                                     termios.TIOCGWINSZ,
+                                                     '1234'))
+        return rows or default
+    except Exception:
+        return int(os.environ.get('LINES', default))
+
+
+class TableView(object):
+    """Plane table redrawn in place.
+
+    Parameters
+    ----------
+    stream: file the table is written to (a terminal)
+    sort: 'el', 'range' or 'tel' (see SORTS)
+    max_rate: maximum redraws per second
+    max_rows: rows of planes shown (default: as many as fit)
+    full_every: seconds between complete redraws
+    """
+    def __init__(self, stream=sys.stdout, sort='el', max_rate=2.,
+                 max_rows=None, full_every=10.):
+        if sort not in SORTS:
+            raise ValueError('sort must be one of {}'.format(sorted(SORTS)))
+        self.stream = stream
+        self.sort = sort
+        self.max_rate = max_rate
+        self.max_rows = max_rows
+        self.full_every = full_every
+        self._lines = None
+        self._last = self._last_full = -np.inf
+
+    def rows(self, planes, tel=None):
+        """Lines of the table for the Plane instances, sorted; tel is
+        the telescope (az, el) in radians, if known"""
+        planes = list(planes)
+        if not planes:
+            return []
+        az = np.array([p.az[-1] for p in planes])
+        el = np.array([p.el[-1] for p in planes])
+        ran = np.array([p.ran[-1] for p in planes])
+        if tel is not None:
+            sep = np.degrees(separation(tel[0], tel[1], az, np.radians(el)))
+        if self.sort == 'tel' and tel is not None:
+            order = np.argsort(sep, kind='mergesort')
+        elif self.sort == 'range':
+            order = np.argsort(ran, kind='mergesort')
+        else:
+            order = np.argsort(-el, kind='mergesort')
+        return [ROW.format(planes[i].id, planes[i].code, az[i] * 180 / np.pi,
+                           el[i], planes[i].lon[-1], planes[i].lat[-1],
+                           planes[i].alt[-1], ran[i],
+                           '{:.1f}'.format(sep[i]) if tel is not None
+                           else '') for i in order]
+
+    def show(self, planes, tel=None, force=False):
+        """Redraws the table, unless it was redrawn less than
+        1 / max_rate seconds ago (and force is False)"""
+        now = time.time()
+        if not force and now - self._last < 1. / self.max_rate:
+            return
+        self._last = now
+        max_rows = self.max_rows or max(terminalRows() - len(HEADER) - 1, 1)
+        lines = list(HEADER) + self.rows(planes, tel)[:max_rows]
+        out = []
+        if self._lines is None or now - self._last_full > self.full_every:
+            out.append(CLEAR)
+            old = []
+            self._last_full = now
+        else:
+            old = self._lines
+        for k, line in enumerate(lines):
+            if k >= len(old) or old[k] != line:
+                out.append(GOTO.format(k + 1) + CLEAR_LINE + line)
+        if len(lines) < len(old):
+            out.append(GOTO.format(len(lines) + 1) + CLEAR_BELOW)
+        # Leave the cursor below the table
+        out.append(GOTO.format(len(lines) + 1))
+        self._lines = lines
+        self.stream.write(''.join(out))
+        self.stream.flush()
+
+    def reset(self):
+        """Forgets what is on the screen (e.g. after other output), so
+        that the next show() redraws everything"""
+        self._lines = None
@@ -0,0 +1,421 @@
+#!/usr/bin/env python
+'''Compact columnar storage for plane tracks.
+
+Each Plane keeps its track in a single TrackBuffer: a 2-D float64 array
+with one row per quantity (mjd, epoch, lat, lon, ...) and one column per
+received beacon. The buffer grows by doubling, so appending is amortised
+O(1), and every quantity can be read back as a contiguous Numpy view
+without copying anything.
+
+A Retention policy bounds how much of each track is kept (the last N
+points and/or T seconds): older points are discarded from the front of
+the buffer, which is compacted from time to time, so memory stays flat
+however long planes are followed. Discarded points can be spilled to a
+file (TrackSpill) rather than lost.
+
+PlaneDict is the planes dictionary used by addPlanes when planes are to
+be forgotten after some time without beacons. It keeps a heap of the
+times planes were last seen, so removing stale planes only touches
+those that have actually expired instead of every plane.
+'''
+
+import heapq
+
+import numpy as np
+
+import beacons
+import dumpfile
+
+
+# Row order inside TrackBuffer
+COLUMNS = ('mjd', 'epc', 'lat', 'lon', 'alt', 'ran', 'az', 'el')
+MJD, EPC, LAT, LON, ALT, RAN, AZ, EL = range(len(COLUMNS))
+
+
+class TrackBuffer(object):
+    """Growable float64 buffer holding a fixed number of quantities.
+
+    Points are stored in columns _start:n of the array; discard() drops
+    the oldest ones by moving _start forward.
+
+    Parameters
+    ----------
+    ncols: number of quantities (rows of the underlying array)
+    capacity: initial number of points that fit without reallocation
+    """
+    __slots__ = ('_buf', '_start', 'n')
+
+    def __init__(self, ncols=len(COLUMNS), capacity=8):
+        self._buf = np.empty((ncols, capacity))
+        self._start = 0
+        self.n = 0
+
+    def __len__(self):
+        return self.n - self._start
+
+    def _reserve(self, k):
+        """Makes room for k more points.
+
+        Discarded space is reclaimed by moving the stored points to the
+        front, but only while that leaves the buffer at most half full,
+        so that every point is moved O(1) times on average. Otherwise
+        the capacity is doubled.
+        """
+        capacity = self._buf.shape[1]
+        if self.n + k <= capacity:
+            return
+        live = self.n - self._start
+        need = 2 * (live + k) if self._start else live + k
+        if capacity >= need:
+            buf = self._buf
+        else:
+            while capacity < need:
+                capacity *= 2
+            buf = np.empty((self._buf.shape[0], capacity))
+        buf[:, :live] = self._buf[:, self._start:self.n]
+        self._buf, self._start, self.n = buf, 0, live
+
+    def append(self, row):
+        """Adds one point; row holds one value per quantity"""
+        self._reserve(1)
+        self._buf[:, self.n] = row
+        self.n += 1
+
+    def extend(self, block):
+        """Adds several points; block has shape (ncols, npoints)"""
+        k = block.shape[1]
+        self._reserve(k)
+        self._buf[:, self.n:self.n + k] = block
+        self.n += k
+
+    def discard(self, k):
+        """Drops the k oldest points; returns them (a view, only valid
+        until points are added again)"""
+        k = min(k, len(self))
+        block = self._buf[:, self._start:self._start + k]
+        self._start += k
+        return block
+
+    def column(self, i):
+        """View (not a copy) of all the stored values of quantity i"""
+        return self._buf[i, self._start:self.n]
+
+    def recent(self, k):
+        """View of the k most recent points of all the quantities"""
+        return self._buf[:, max(self._start, self.n - k):self.n]
+
+    def last(self, i):
+        """Most recent value of quantity i"""
+        return self._buf[i, self.n - 1]
+
+    @property
+    def nbytes(self):
+        """Memory allocated for the data (bytes)"""
+        return self._buf.nbytes
+
+
+class TrackSpill(object):
+    """Writes track points discarded by a Retention policy to a file.
+
+    Points are written as l2planes plane lines (the fields l2pGUI does
+    not keep are written as 0) by a dumpfile.DumpWriter, so the disk is
+    never written to from the GUI thread. Lines are collected until
+    flush() is called (once per frame) and handed over in one batch.
+
+    Each plane's points are written in time order, but planes are
+    written one after another as their points are discarded, so the
+    file is not in time order as a --dump2file dump is. Sort it by time
+    before replaying it, e.g. with sort -k1,1n -k2,2n.
+
+    Parameters
+    ----------
+    fname: file to append to
+    """
+    def __init__(self, fname):
+        self.fname = fname
+        self._writer = dumpfile.DumpWriter(fname)
+        self._pending = []
+        self.points = 0
+
+    def write(self, plane, block):
+        """Queues the points in block (TrackBuffer layout) of plane"""
+        if block.shape[1] == 0:
+            return
+        recs = np.zeros(block.shape[1], beacons.PLANE_DTYPE)
+        recs['mjd'] = block[MJD]
+        # Undo the unwrapping of epochs past midnight
+        recs['epc'] = block[EPC] % 86400
+        recs['id'] = plane.id
+        recs['code'] = plane.code
+        recs['lat'] = block[LAT]
+        recs['lon'] = block[LON]
+        recs['alt'] = block[ALT] / 0.3048
+        recs['ran'] = block[RAN]
+        recs['az'] = block[AZ] * 180 / np.pi
+        recs['el'] = block[EL]
+        self._pending.extend(beacons.formatRecords(recs))
+        self.points += len(recs)
+
+    def flush(self):
+        """Hands the points queued so far to the writer thread"""
+        if self._pending:
+            self._writer.write(self._pending)
+            self._pending = []
+
+    def close(self):
+        self.flush()
+        self._writer.close()
+
+
+class Retention(object):
+    """How much of each plane track to keep.
+
+    Parameters
+    ----------
+    max_points: keep at most this many points (no limit if None)
+    max_age: keep only the points at most this many seconds older than
+             the latest one (no limit if None)
+    spill: TrackSpill to write discarded points to, if any
+    """
+    def __init__(self, max_points=None, max_age=None, spill=None):
+        self.max_points = max_points
+        self.max_age = max_age
+        self.spill = spill
+
+    def excess(self, plane):
+        """Number of oldest points of plane to discard"""
+        n = 0
+        if self.max_points is not None:
+            n = len(plane) - self.max_points
+        if self.max_age is not None:
+            epc = plane.epc
+            n = max(n, np.searchsorted(epc, epc[-1] - self.max_age))
+        return n
+
+
+def _column(i):
+    return property(lambda self: self._track.column(i),
+                    doc='{} track (read-only view)'.format(COLUMNS[i]))
+
+
+class Plane(object):
+    """Makes planes.
+
+    This class takes plane records (see beacons.PLANE_DTYPE) or lines
+    from l2planes and stores the relevant information for later use.
+    The track quantities (mjd, epc, lat, lon, alt, ran, az, el) are Numpy
+    views into a TrackBuffer, so slicing them is cheap; they should be
+    treated as read-only.
+    """
+    __slots__ = ('minel', 'id', 'code', 'last_epoch', 'last_time', 'maxel',
+                 'gaps', 'retention', 'updates', '_track', '_views')
+
+    mjd = _column(MJD)
+    epc = _column(EPC)
+    lat = _column(LAT)
+    lon = _column(LON)
+    alt = _column(ALT)
+    ran = _column(RAN)
+    az = _column(AZ)
+    el = _column(EL)
+
+    def __init__(self, recs, minel=10, retention=None):
+        if isinstance(recs, basestring):
+            recs = beacons.parse_lines([recs])[0]
+        self.minel = minel
+        self.id = str(recs['id'][0])
+        self.code = str(recs['code'][0])
+        self.last_epoch = float(recs['epc'][0])
+        # Absolute time (Unix seconds) of the last beacon, for expiry
+        self.last_time = float(beacons.unixTime(recs['mjd'][0],
+                                                recs['epc'][0]))
+        self.maxel = -10    # maximum observed plane elevation (starting value)
+        self.gaps = 0       # times the same plane id has been observed - 1
+        self.retention = retention
+        # Times the track changed (points added or discarded)
+        self.updates = 0
+        self._track = TrackBuffer()
+        self._views = {}
+        self.addRecords(recs)
+
+    # 56395 40400.326   4ca626 RYR8JT   50.97158 -0.61729 29525 68.6683
+    # 280.17873692 7.16197030   -474.0 191.0 1088   0.00 0.00
+
+    def __len__(self):
+        return len(self._track)
+
+    def recent(self, npoints):
+        """View of the last npoints points of the track, one row per
+        quantity (in the order of COLUMNS)"""
+        return self._track.recent(npoints)
+
+    def azel(self, station, npoints):
+        """Azimuth (radians) and elevation (degrees) of the last npoints
+        points of the track as seen from another station 
+        (coords.Station), one row each.
+        
+        Points are projected from their lat/lon/alt the first time they
+        are asked for and kept, so every point is only projected once
+        per station.
+        """
+        view = self._views.get(station)
+        if view is None:
+            view = self._views[station] = TrackBuffer(ncols=2)
+        k = len(self._track) - len(view)
+        if k > 0:
+            track = self._track.recent(k)
+            az, el, _ = station.geod2azel(track[LAT], track[LON], track[ALT])
+            view.extend(np.vstack((az, el * (180 / np.pi))))
+        return view.recent(npoints)
+
+    def addRecords(self, recs):
+        """Adds plane records (PLANE_DTYPE) belonging to this plane"""
+        recs = recs[recs['el'] >= self.minel]
+        if len(recs) == 0:
+            return
+        epc = recs['epc']
+        self.last_time = max(self.last_time, float(beacons.unixTime(
+                             recs['mjd'][-1], epc[-1])))
+        if epc[0] < self.last_epoch or np.any(epc[1:] < epc[:-1]):
+            # Epoch goes backwards somewhere, e.g. at midnight
+            epc, keep = self._unwrapEpochs(epc.tolist())
+            recs = recs[keep]
+            if len(recs) == 0:
+                return
+        self.last_epoch = float(epc[-1])
+        self._track.extend(np.vstack((recs['mjd'], epc, recs['lat'],
+                                      recs['lon'], recs['alt'] * 0.3048,
+                                      recs['ran'], np.pi / 180 * recs['az'],
+                                      recs['el'])))
+        self.updates += 1
+        maxel = recs['el'].max()
+        self.maxel = maxel if maxel > self.maxel else self.maxel
+        if self.retention is not None:
+            n = self.retention.excess(self)
+            if n > 0:
+                self._discard(n)
+
+    def _discard(self, n):
+        """Forgets the n oldest points, spilling them if so configured"""
+        block = self._track.discard(n)
+        self.updates += 1
+        # Projected points are the oldest ones of the track
+        for view in self._views.itervalues():
+            view.discard(n)
+        if self.retention is not None and self.retention.spill is not None:
+            self.retention.spill.write(self, block)
+
+    def retire(self):
+        """Forgets the whole track (e.g. when the plane expires),
+        spilling it if so configured"""
+        self._discard(len(self))
+
+    def _unwrapEpochs(self, epcs):
+        """Makes epochs increase monotonically, point by point.
+        
+        Returns the adjusted epochs and a mask of the points to keep
+        """
+        last_epoch = self.last_epoch
+        adjusted, keep = [], []
+        for epc in epcs:
+            if epc < last_epoch:
+                epc += 86400
+            # I should reconsider the following line and its usefulness...
+            if epc - last_epoch > 600000:
+                self.gaps = 1
+                keep.append(False)
+                continue
+            last_epoch = epc
+            adjusted.append(epc)
+            keep.append(True)
+        return np.array(adjusted), np.array(keep, dtype=bool)
+
+
+class PlaneDict(dict):
+    """Planes dictionary (plane id: Plane) with an expiry index.
+
+    Every time a plane is updated, touch() records its last_time in a
+    min-heap. Entries are not removed when a plane is updated again or
+    deleted; they are simply skipped once they reach the top of the heap
+    and no longer match the plane (lazy invalidation).
+    """
+    def __init__(self, *args, **kwargs):
+        dict.__init__(self, *args, **kwargs)
+        self._heap = [(p.last_time, k) for k, p in self.iteritems()]
+        heapq.heapify(self._heap)
+        # Latest beacon time seen (Unix seconds)
+        self.now = max(self._heap)[0] if self._heap else -np.inf
+
+    def touch(self, key):
+        """Records that plane 'key' has been updated"""
+        t = self[key].last_time
+        heapq.heappush(self._heap, (t, key))
+        if t > self.now:
+            self.now = t
+
+    def expire(self, time_alive):
+        """Removes the planes not seen for more than time_alive seconds
+        before 'now'; returns them"""
+        heap, limit = self._heap, self.now - time_alive
+        removed = []
+        while heap and heap[0][0] < limit:
+            t, key = heapq.heappop(heap)
+            plane = self.get(key)
+            if plane is not None and plane.last_time == t:
+                del self[key]
+                removed.append(plane)
+        return removed
+
+
+def addPlanes(planeRecs, planes_dict, minel=-5, time_alive=-1,
+              retention=None):
+    """Processes plane data and updates planes dictionary accordingly.
+    
+    Parameters
+    ----------
+    planeRecs: plane records (PLANE_DTYPE) or list of plane lines
+    planes_dict: dictionary storing planes
+                 keys: plane id; values: Plane instances
+    minel: elevation cutoff
+    time_alive: seconds to wait before discarding planes for which
+                no beacons have been received. No limit if set to negative
+    retention: Retention policy for the tracks of new planes (by default
+               they are kept whole)
+    
+    Returns
+    -------
+    planes dictionary; a PlaneDict (replacing planes_dict if it was a 
+    plain dict) if time_alive is positive
+    """
+    P = planes_dict
+    if time_alive > 0 and not isinstance(P, PlaneDict):
+        P = PlaneDict(P)
+    if not isinstance(planeRecs, np.ndarray):
+        planeRecs = beacons.parse_lines(planeRecs)[0]
+    if len(planeRecs) == 0:
+        return P
+    recs = planeRecs[planeRecs['el'] > minel]
+    # Group records by plane id, keeping their order within each group
+    order = np.argsort(recs['id'], kind='mergesort')
+    ids = recs['id'][order]
+    starts = np.flatnonzero(ids[1:] != ids[:-1]) + 1
+    for group in np.split(order, starts):
+        if len(group) == 0:
+            continue
+        block = recs[group]
+        plane_id = block['id'][0]
+        if plane_id not in P:
+            P[plane_id] = Plane(block, minel, retention)
+        else:
+            P[plane_id].addRecords(block)
+        if time_alive > 0:
+            P.touch(plane_id)
+
+    # Remove planes for which no beacons have been 
+    # received for more than given time
+    if time_alive > 0:
+        P.now = max(P.now, beacons.unixTime(planeRecs['mjd'],
+                                            planeRecs['epc']).max())
+        for plane in P.expire(time_alive):
+            plane.retire()
+    return P
@@ -0,0 +1,142 @@
+#!/usr/bin/env python
+'''Drawing of plane tracks on the polar display.
+
+All the trails are drawn by a single PathCollection and all the current
+positions by a single scatter, so however many planes are in view, a
+frame takes the same two draw calls.
+
+Trails are coloured by the current elevation of each plane. Rather than
+one path per plane, the trails of all the planes falling in the same
+colour bin are joined into one compound path, so that the number of
+Path objects does not grow with the number of planes either. For the
+same reason the trail points are projected to display coordinates all
+at once (left to itself, a collection on polar axes projects each of
+its paths separately).
+
+Work is only done for what changed since the previous frame: the trail
+of a plane is projected again only when the plane has new points (or
+the view changed), and the path of a colour bin is only rebuilt when
+one of its planes changed, came or went.
+'''
+
+import numpy as np
+from matplotlib import cm
+from matplotlib.path import Path
+from matplotlib.collections import PathCollection
+from matplotlib.transforms import IdentityTransform
+
+from tracks import AZ, EL
+
+
+class TrackArtists(object):
+    """Trails and current positions of planes on a polar axes.
+
+    Parameters
+    ----------
+    ax: polar axes (azimuth in radians, zenith distance in degrees)
+    npoints: number of most recent track points making up a trail
+    step: draw one point out of every 'step'
+    ncolours: number of colour bins for the trails
+    """
+    def __init__(self, ax, npoints=80, step=5, ncolours=32):
+        self.ax = ax
+        self.npoints = npoints
+        self.step = step
+        self.ncolours = ncolours
+        self.trails = PathCollection([], facecolors='none', linewidths=4,
+                                     transform=IdentityTransform())
+        ax.add_collection(self.trails, autolim=False)
+        self.points = ax.scatter([0], [0], s=36, c='w', linewidths=0)
+        self.points.set_offsets(np.zeros((0, 2)))
+        self._view = None
+        # Plane id: (Plane, its update count), colour bin, trail in display
+        # coordinates and current position
+        self._planes = {}
+        # Colour bin: (plane ids and stamps, compound path)
+        self._bins = {}
+
+    @property
+    def artists(self):
+        return [self.trails, self.points]
+
+    def _viewKey(self, station):
+        """Everything the display coordinates of the trails depend on"""
+        ax = self.ax
+        return (station, tuple(ax.bbox.bounds), ax.get_ylim(),
+                ax.get_theta_offset(), ax.get_theta_direction())
+
+    def _project(self, planes, station):
+        """Trail, colour bin and current position of each plane, as in
+        self._planes"""
+        if station is None:
+            # AZ and EL are consecutive rows, so this is a view
+            recent = [p.recent(self.npoints)[AZ:EL + 1, ::self.step]
+                      for p in planes]
+        else:
+            recent = [p.azel(station, self.npoints)[:, ::self.step]
+                      for p in planes]
+        lengths = np.array([r.shape[1] for r in recent], dtype=int)
+        az, el = np.concatenate(recent, axis=1)
+        last = np.cumsum(lengths) - 1
+        xy = self.ax.transData.transform(np.column_stack((az, 90 - el)))
+        # Same colours as cm.jet((el + 5) / 100), in ncolours steps
+        level = np.clip((el[last] + 5) / 100., 0, 1)
+        bins = np.minimum((level * self.ncolours).astype(int),
+                          self.ncolours - 1).tolist()
+        pos = np.column_stack((az[last], 90 - el[last]))
+        starts = (last - lengths + 1).tolist()
+        return zip(bins, [xy[i:j] for i, j in zip(starts, last + 1)], pos)
+
+    def update(self, planes, station=None):
+        """Shows the given Plane instances, as seen from station
+        (coords.Station) if given, or else with the az/el received"""
+        view = self._viewKey(station)
+        if view != self._view:
+            self._view, self._planes, self._bins = view, {}, {}
+        shown, stale = {}, []
+        for p in planes:
+            # The Plane itself too, as a plane that expired and came back
+            # is a new instance counting its updates from scratch
+            stamp = (p, p.updates)
+            entry = self._planes.get(p.id)
+            if entry is not None and entry[0] == stamp:
+                shown[p.id] = entry
+            elif len(p):
+                stale.append((p, stamp))
+        if not stale and len(shown) == len(self._planes):
+            # The same planes, none with new points: nothing to redo
+            return
+        if stale:
+            projected = self._project([p for p, _ in stale], station)
+            for (p, stamp), trail in zip(stale, projected):
+                shown[p.id] = (stamp,) + tuple(trail)
+        self._planes = shown
+
+        members = {}
+        for pid, (stamp, b, xy, pos) in shown.iteritems():
+            members.setdefault(b, []).append((pid, stamp))
+        bins = {}
+        for b, key in members.iteritems():
+            old = self._bins.get(b)
+            if old is not None and old[0] == key:
+                bins[b] = old
+                continue
+            trails = [shown[pid][2] for pid, _ in key]
+            n = np.array([len(xy) for xy in trails])
+            codes = np.full(n.sum(), Path.LINETO, dtype=Path.code_type)
+            codes[np.cumsum(n) - n] = Path.MOVETO
+            bins[b] = (key, Path(np.concatenate(trails), codes))
+        self._bins = bins
+
+        used = sorted(bins)
+        self.trails.set_paths([bins[b][1] for b in used])
+        self.trails.set_edgecolors(cm.jet((np.array(used) + 0.5) /
+                                          self.ncolours))
+        if shown:
+            self.points.set_offsets(np.array([e[3] for e in
+                                              shown.itervalues()]))
+        else:
+            self.points.set_offsets(np.zeros((0, 2)))
+
+    def clear(self):
+        self.update([])
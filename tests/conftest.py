@@ -0,0 +1,15 @@
+'''Tests of the l2pGUI modules, run with pytest from the top directory:
+
+    python -m pytest
+
+The modules in l2pGUI/ import each other by their plain names, as when
+l2pGUI.py is run from its directory, so that directory is put on the
+path here (tests/ is deliberately not a package, so that the top
+directory, where l2pGUI is the package, does not come first).
+'''
+
+import os
+import sys
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.dirname(
+                os.path.abspath(__file__))), 'l2pGUI'))
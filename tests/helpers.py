@@ -0,0 +1,71 @@
+'''Fixtures shared by the tests: temporary directories and synthetic
+l2planes data.'''
+
+import bz2
+import gzip
+import shutil
+import tempfile
+import contextlib
+
+import numpy as np
+
+import beacons
+
+
+# Station used throughout (the default of coords and sunmoon)
+STATION = (50.867387222, 0.33612916666, 75.357)
+# 2013-04-15 10:00 UTC, on the hour
+T0 = 1366020000.
+
+
+@contextlib.contextmanager
+def tempdir():
+    """Temporary directory, removed with everything in it on exit"""
+    folder = tempfile.mkdtemp()
+    try:
+        yield folder
+    finally:
+        shutil.rmtree(folder)
+
+
+def planeRecords(t, ids='abcdef', code='TEST', lat=51., lon=0.3,
+                 alt=30000., el=30.):
+    """Plane records (beacons.PLANE_DTYPE) at Unix times t; the other
+    arguments are numbers or arrays of the same length as t"""
+    t = np.asarray(t, dtype=float)
+    recs = np.zeros(len(t), beacons.PLANE_DTYPE)
+    recs['mjd'], recs['epc'] = divmod(t, 86400.)
+    recs['mjd'] += beacons.MJD_UNIX
+    # As written to dumps
+    recs['epc'] = np.round(recs['epc'], 3)
+    recs['id'], recs['code'] = ids, code
+    recs['lat'], recs['lon'], recs['alt'], recs['el'] = lat, lon, alt, el
+    return recs
+
+
+def writeDump(fname, lines, compress=None):
+    """Writes lines as --dump2file does, plain or compressed ('gzip' or
+    'bzip2')"""
+    opener = {None: open, 'gzip': gzip.open, 'bzip2': bz2.BZ2File}[compress]
+    f = opener(fname, 'wb')
+    try:
+        f.write(''.join(line + ' \n' for line in lines))
+    finally:
+        f.close()
+    return fname
+
+
+def samePlanes(P1, P2):
+    """True if two dictionaries of Plane instances hold the same tracks
+    and state"""
+    if sorted(P1) != sorted(P2):
+        return False
+    for pid in P1:
+        a, b = P1[pid], P2[pid]
+        if len(a) != len(b) or not (a.recent(len(a)) ==
+                                    b.recent(len(b))).all():
+            return False
+        for attr in ('code', 'last_epoch', 'last_time', 'maxel', 'gaps'):
+            if getattr(a, attr) != getattr(b, attr):
+                return False
+    return True
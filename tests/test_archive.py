@@ -0,0 +1,45 @@
+import os
+
+import numpy as np
+
+import beacons
+import archive
+from bench import fakeLines
+from helpers import tempdir, writeDump
+
+TEL = '56395 40010.000 telscp 75.00 65.00 1'
+
+
+def _same(precs, expected):
+    """Plane records equal to expected at the precision of the archive
+    columns"""
+    return all((precs[name] == expected[name].astype(dtype)).all()
+               for name, dtype, _ in archive.PLANE_COLUMNS
+               if name not in ('id', 'code')) and \
+        (precs[['id', 'code']] == expected[['id', 'code']]).all()
+
+
+def test_roundtrip():
+    """An archive must read back the plane records, telescope lines and
+    their places of the dump it was converted from, in any chunks"""
+    planes = fakeLines(30, 40)
+    lines = planes[:7] + [TEL] + planes[7:500] + [TEL, TEL] + planes[500:]
+    with tempdir() as folder:
+        src = writeDump(os.path.join(folder, 'dump.txt.gz'), lines, 'gzip')
+        dst = os.path.join(folder, 'dump.l2pa')
+        # Small blocks, so that rows carry on from block to block
+        assert archive.convertDump(src, dst, blocksize=5000) == (1200, 3)
+        assert archive.isArchive(dst) and not archive.isArchive(src)
+        a = archive.Archive(dst)
+        precs, tlines, _, trows = beacons.parse_lines(lines, rows=True)
+        assert len(a) == len(precs)
+        assert _same(a.planeRecords(), precs)
+        assert a.telLines() == tlines
+        assert a.telLines(rows=True)[1].tolist() == trows.tolist() == \
+            [7, 500, 500]
+        pos, read, tread = 0, [], []
+        while pos < len(a):
+            p, t, pos = a.read(pos, 140)
+            read.append(p)
+            tread.extend(t)
+        assert _same(np.concatenate(read), precs) and tread == tlines
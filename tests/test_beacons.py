@@ -0,0 +1,62 @@
+import beacons
+from bench import fakeLines
+
+TEL = '56692 41847.094 telscp 75.00 65.00 1'
+CTRL = 'CONN ERROR'
+
+
+def _same(precs, lines):
+    """Records parsed from lines as float() and str.split() would"""
+    assert len(precs) == len(lines)
+    for rec, line in zip(precs, lines):
+        f = line.split()
+        assert (rec['id'], rec['code']) == (f[2], f[3])
+        nums = [float(x) for i, x in enumerate(f) if i not in (2, 3)]
+        assert list(rec)[:2] + list(rec)[4:10] + list(rec[10]) == nums
+
+
+def test_parse_lines():
+    """Plane, telescope and control lines mixed, with \\r\\n line ends,
+    blank lines and a partial line at the end"""
+    planes = fakeLines(4, 3)
+    lines = (planes[:5] + [TEL, '', CTRL] + planes[5:9] + ['  ', TEL] +
+             planes[9:])
+    block = '\r\n'.join(lines) + '\r\n' + planes[0][:30]
+    precs, tlines, clines, trows = beacons.parse_lines(block, rows=True)
+    _same(precs, planes)
+    assert [l.split() for l in tlines] == [TEL.split()] * 2
+    assert [l.split() for l in clines] == [CTRL.split()]
+    assert list(trows) == [5, 9]
+    # Lists of lines, all plane lines, or none at all
+    _same(beacons.parse_lines(planes)[0], planes)
+    assert beacons.parse_lines(lines)[1:] == ([TEL, TEL], [CTRL])
+    assert len(beacons.parse_lines(' \n\n')[0]) == 0
+    assert len(beacons.parse_lines('')[0]) == 0
+
+
+def test_bad_number():
+    """Plane lines with a field that is not a number are left out"""
+    planes = fakeLines(3, 2)
+    bad = planes[2].replace(' 29525 ', ' 2x525 ')
+    lines = planes[:2] + [TEL, bad] + planes[3:] + [TEL]
+    precs, tlines, _, trows = beacons.parse_lines(lines, rows=True)
+    _same(precs, planes[:2] + planes[3:])
+    assert tlines == [TEL, TEL] and list(trows) == [2, 5]
+
+
+def test_control_bytes():
+    """Any byte up to ' ' separates fields, for tokensPerLine as for
+    parse_lines, so that replay indices and the parser agree"""
+    planes = fakeLines(2, 2)
+    odd = planes[1].replace(' ', '\x1f', 1)
+    tel = TEL.replace(' ', '\x01', 2)
+    block = '\n'.join(planes[:1] + [odd, tel, CTRL] + planes[2:])
+    assert list(beacons.tokensPerLine(block)) == [13, 13, 6, 2, 13, 13]
+    precs, tlines, clines = beacons.parse_lines(block)
+    _same(precs, planes)
+    assert tlines == [tel] and clines == [CTRL]
+    # Also when a field that is not a number makes them go line by line
+    bad = planes[0].replace(' 29525 ', ' 2x525 ')
+    precs, tlines, _ = beacons.parse_lines(block + '\n' + bad)
+    _same(precs, planes)
+    assert tlines == [tel]
@@ -0,0 +1,42 @@
+import numpy as np
+
+from conflicts import ConflictCheck, separation, RADII
+
+
+def test_conflicts(n=5000):
+    """Grid and brute force queries must find the same planes, at the
+    same separations as the haversine formula"""
+    rs = np.random.RandomState(0)
+    az = rs.uniform(0, 2 * np.pi, n)
+    el = np.arcsin(rs.uniform(0, 1, n))
+    brute = ConflictCheck(grid_min=n + 1)
+    grid = ConflictCheck(grid_min=1)
+    brute.update(az, el)
+    grid.update(az, el)
+    for k in xrange(200):
+        taz = rs.uniform(0, 2 * np.pi)
+        tel = rs.uniform(0, np.pi / 2) if k else np.pi / 2
+        i1, s1 = brute.near(taz, tel)
+        i2, s2 = grid.near(taz, tel)
+        assert sorted(i1) == sorted(i2)
+        assert np.allclose(s1, separation(taz, tel, az[i1], el[i1]),
+                           atol=1e-9)
+        exact = separation(taz, tel, az, el) <= np.radians(RADII[-1])
+        assert sorted(np.flatnonzero(exact)) == sorted(i1)
+    assert grid._order is not None and brute._order is None
+
+
+def test_wide(n=5000):
+    """Radii larger than the grid cells must find every plane within
+    them, also once the planes are binned"""
+    rs = np.random.RandomState(1)
+    az = rs.uniform(0, 2 * np.pi, n)
+    el = np.arcsin(rs.uniform(0, 1, n))
+    check = ConflictCheck(grid_min=1)
+    check.update(az, el)
+    check.near(1., 0.5)
+    for radius in (RADII[-1], 3 * RADII[-1], 90.):
+        idx, sep = check.near(1., 0.5, radius)
+        exact = separation(1., 0.5, az, el) <= np.radians(radius)
+        assert sorted(idx) == sorted(np.flatnonzero(exact))
+    assert check._order is not None
@@ -0,0 +1,34 @@
+import numpy as np
+
+import coords
+import coords_math
+from helpers import STATION
+
+
+def test_geo2azel(n=1000):
+    '''Compares with coords_math.geo2azel for random points'''
+    rs = np.random.RandomState(0)
+    lat = rs.uniform(-89, 89, n)
+    lon = rs.uniform(-180, 180, n)
+    h = rs.uniform(0, 4e7, n)
+    x, y, z = coords.geod2geo(lat, lon, h)
+    a, e, r = coords.geo2azel(x, y, z)
+    for i in xrange(n):
+        a1, e1, r1 = coords_math.geo2azel(x[i], y[i], z[i])
+        assert abs(a[i] - a1) < 1e-9 or abs(abs(a[i] - a1) - 2*np.pi) < 1e-9
+        assert abs(e[i] - e1) < 1e-9 and abs(r[i] - r1) < 1e-6 * r1
+
+
+def test_station(n=1000):
+    '''Station transforms against geo2azel'''
+    st = coords.Station(*STATION)
+    rs = np.random.RandomState(1)
+    lat = st.lat + rs.uniform(-2, 2, n)
+    lon = st.lon + rs.uniform(-3, 3, n)
+    h = rs.uniform(0, 12000, n)
+    a, e, r = coords.geo2azel(*coords.geod2geo(lat, lon, h))
+    a1, e1, r1 = st.geod2azel(lat, lon, h)
+    assert np.allclose(e, e1, rtol=0, atol=1e-12)
+    assert np.allclose(r, r1, rtol=1e-12)
+    da = np.abs(a - a1)
+    assert (np.minimum(da, 2 * np.pi - da) < 1e-12).all()
@@ -0,0 +1,40 @@
+import os
+import time
+
+from dumpfile import DumpWriter, dumpParts, partName, readBlocks
+from helpers import T0, tempdir
+
+
+def test_writer():
+    """Rotated, compressed dumps must read back as the lines written"""
+    with tempdir() as folder:
+        fname = os.path.join(folder, 'dump.txt')
+        w = DumpWriter(fname, rotate='hour', compress=True, flush_every=0.01)
+        written = []
+        for k in xrange(100):
+            lines = ['line {} {}'.format(k, i) for i in xrange(50)]
+            w.write(lines, T0 + 60 * k)
+            written.extend(line + ' \n' for line in lines)
+        w.close()
+        parts = dumpParts(fname)
+        assert len(parts) == 2 and all(p.endswith('.gz') for p in parts)
+        assert parts[0] == partName(fname, T0, 'hour', True)
+        read = ''.join(readBlocks(parts, 1000))
+        assert read == ''.join(written)
+        assert w.lines == len(written) and w.dropped == 0
+
+
+def test_stalled_close():
+    """close must give up on a stalled disk and report the lines lost"""
+    with tempdir() as folder:
+        w = DumpWriter(os.path.join(folder, 'dump.txt'), max_batches=2,
+                       flush_every=0.01)
+        w._flush = lambda name, lines: time.sleep(5)
+        for k in xrange(10):
+            w.write(['line {}'.format(k)], T0)
+            time.sleep(0.02)
+        t = time.time()
+        unwritten = w.close(timeout=0.2)
+        assert time.time() - t < 1
+        assert w.dropped > 0 and w.lines == 0
+        assert unwritten == w.queued > 0
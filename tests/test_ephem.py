@@ -0,0 +1,25 @@
+import numpy as np
+
+import sunmoon
+from ephem import Ephemeris, ACCURACY
+from jdates import unix2jd
+from helpers import STATION
+
+
+def test_accuracy(t0=1366000000., n=20000):
+    """Interpolated positions against sunmoon over two days"""
+    e = Ephemeris(*STATION)
+    t = t0 + np.random.RandomState(0).uniform(0, 2 * 86400, n)
+    for vec, interp in [(sunmoon.sunazel_vec, e.sunazel),
+                        (sunmoon.moonazel_vec, e.moonazel)]:
+        a0, e0, r0 = vec(unix2jd(t), *e.station)
+        a1, e1, r1 = interp(t)
+        # Angle between the exact and interpolated directions
+        sep = np.arccos(np.clip(np.sin(e0) * np.sin(e1) + np.cos(e0) *
+                                np.cos(e1) * np.cos(a1 - a0), -1, 1))
+        assert sep.max() < ACCURACY, (interp.__name__, sep.max())
+        assert (abs(r1 - r0) < 1e-6 * r0).all()
+        # Scalar queries give the same answers
+        for k in xrange(0, n, 1000):
+            a, el, r = interp(t[k])
+            assert abs(el - e1[k]) < 1e-12 and abs(r - r1[k]) < 1e-3
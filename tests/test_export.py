@@ -0,0 +1,46 @@
+import os
+
+import numpy as np
+import matplotlib.image
+
+import beacons
+import export
+from helpers import STATION, T0, tempdir, planeRecords, writeDump
+
+TEL = '{} {:.3f} telscp 75.00 65.00 1'
+
+
+def _dump(fname, seconds, n_planes=5):
+    """Planes moving across the sky for the given number of seconds,
+    with a telescope line every minute"""
+    lines = []
+    for k in xrange(seconds):
+        t = T0 + k
+        recs = planeRecords([t] * n_planes, ids=['{:06x}'.format(j) for j
+                                                  in xrange(n_planes)],
+                            el=20 + 10 * np.arange(n_planes))
+        recs['az'] = (k / 10. + 60 * np.arange(n_planes)) % 360
+        lines.extend(beacons.formatRecords(recs))
+        if k % 60 == 0:
+            lines.append(TEL.format(int(recs['mjd'][0]), recs['epc'][0]))
+    return writeDump(fname, lines)
+
+
+def test_frame_times():
+    assert list(export.frameTimes(10., 13., 1.)) == [10., 11., 12.]
+    assert list(export.frameTimes(10., 13.5, 1.5)) == [10., 11.5, 13.]
+
+
+def test_png(seconds=600):
+    """Every frame of the replay is written, numbered in time order,
+    whichever worker rendered it"""
+    with tempdir() as folder:
+        dump = _dump(os.path.join(folder, 'dump.txt'), seconds)
+        out = os.path.join(folder, 'frames')
+        n = export.exportReplay(dump, out, STATION, fps=1, workers=2,
+                                size=2, dpi=50)
+        assert n == seconds // 60
+        assert sorted(os.listdir(out)) == ['{:06d}.png'.format(k)
+                                           for k in xrange(n)]
+        image = matplotlib.image.imread(os.path.join(out, '000005.png'))
+        assert image.shape[:2] == (100, 100)
@@ -0,0 +1,24 @@
+import numpy as np
+
+from jdates import (jd2gcal, jd2gcal_vec, gcal2jd, mjd2jd, jd2mjd,
+                    unix2jd, jd2unix)
+
+
+def test_vec(n=10000):
+    '''Array versions against the scalar ones, and round trips'''
+    rs = np.random.RandomState(0)
+    JD = rs.uniform(2299161, 2488070, n)
+    Y, M, D, fD = jd2gcal_vec(JD)
+    for i in xrange(0, n, 10):
+        y, m, d, fd = jd2gcal(JD[i])
+        assert (y, m, d) == (Y[i], M[i], D[i]) and fd == fD[i], JD[i]
+    # Days are counted from 00:00, so fractions of a day must add up
+    assert np.all(np.abs(gcal2jd(Y, M, D + fD) - JD) < 1e-8)
+    assert np.all(gcal2jd(Y, M, D) == [gcal2jd(*ymd) for ymd in zip(Y, M, D)])
+    mjd = rs.randint(40000, 70000, n)
+    epc = rs.uniform(0, 86400, n)
+    jd = mjd2jd(mjd, epc)
+    assert np.all(jd == [mjd2jd(*me) for me in zip(mjd, epc)])
+    day, sec = jd2mjd(jd)
+    assert np.all(day == mjd) and np.all(np.abs(sec - epc) < 1e-4)
+    assert np.all(np.abs(jd2unix(unix2jd(epc * 1e4)) - epc * 1e4) < 1e-4)
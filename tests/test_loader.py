@@ -0,0 +1,51 @@
+import os
+
+import numpy as np
+
+import archive
+
+from l2pGUI import loadPlanesFile
+from loader import loadParallel
+from helpers import tempdir, writeDump, samePlanes
+
+
+def _lines(n_planes, n_points):
+    """Planes crossing midnight, some below the cutoff, in jumbled order
+    within each second"""
+    rs = np.random.RandomState(0)
+    lines = []
+    for k in xrange(n_points):
+        for j in rs.permutation(n_planes):
+            epc = (86400 - n_points // 2 + k + rs.uniform(0, 1)) % 86400
+            lines.append('{} {:.3f} {:06x} RYR{:04d} 50.97 -0.61 29525 '
+                         '68.66 {:.3f} {:.3f} 0 0 0'.format(
+                         56395 + (epc < 43200), epc, j, j,
+                         rs.uniform(0, 360), rs.uniform(-10, 60)))
+    return lines
+
+
+def test_parallel(n_planes=200, n_points=300):
+    """The parallel loader must give the same planes as loadPlanesFile,
+    for a plain dump split into many ranges and for several compressed
+    dumps replayed together, some of them archives"""
+    lines = _lines(n_planes, n_points)
+    with tempdir() as folder:
+        dump = writeDump(os.path.join(folder, 'dump.txt'), lines)
+        split = os.path.join(folder, 'split')
+        os.mkdir(split)
+        for k in xrange(3):
+            writeDump(os.path.join(split, 'rx{}.txt.gz'.format(k)),
+                      lines[k::3], 'gzip')
+        mixed = os.path.join(folder, 'mixed')
+        os.mkdir(mixed)
+        for k in xrange(3):
+            part = writeDump(os.path.join(mixed, 'rx{}.txt'.format(k)),
+                             lines[k::3])
+            if k:
+                archive.convertDump(part, part[:-4] + '.l2pa')
+                os.remove(part)
+        for name, blocksize in ((dump, 10000), (split, 2**24),
+                                (mixed, 64000)):
+            P1 = loadPlanesFile(name, minel=0, blocksize=blocksize)
+            P2 = loadParallel(name, minel=0, workers=3, blocksize=blocksize)
+            assert samePlanes(P1, P2)
@@ -0,0 +1,37 @@
+import numpy as np
+
+import beacons
+from merge import Merger
+from helpers import T0, planeRecords
+
+
+def _times(precs):
+    return beacons.unixTime(precs['mjd'], precs['epc']) - T0
+
+
+def test_window():
+    """Records must be released in time order once they are older than
+    the window, and records arriving after that dropped as late"""
+    m = Merger(window=2.)
+    m.push('a', planeRecords(T0 + np.array([0., 2., 4.]), ids='a'))
+    m.push('b', planeRecords(T0 + np.array([3., 1.]), ids='b'))
+    assert np.allclose(_times(m.pop()), [0, 1, 2])
+    assert len(m.pop()) == 0
+    m.push('b', planeRecords([T0 + 1.5, T0 + 5.], ids='b'))
+    assert m.sources['b'].late == 1
+    assert np.allclose(_times(m.flush()), [3, 4, 5])
+    assert m.sources['a'].released == 3 and m.sources['b'].released == 3
+
+
+def test_dedupe():
+    """The same beacon from two receivers must be released once, also
+    when their times fall either side of a resolution bucket edge"""
+    m = Merger(window=1., resolution=0.1)
+    m.push('a', planeRecords(T0 + np.array([0.099, 0.5, 1.]), ids='p'))
+    m.push('b', planeRecords(T0 + np.array([0.101, 0.7, 1.]), ids='p'))
+    m.push('b', planeRecords([T0 + 0.101], ids='q'))
+    out = m.flush()
+    assert out['id'].tolist() == ['p', 'q', 'p', 'p', 'p']
+    assert np.allclose(_times(out), [0.099, 0.101, 0.5, 0.7, 1.])
+    assert m.sources['a'].duplicates == 0
+    assert m.sources['b'].duplicates == 2
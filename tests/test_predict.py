@@ -0,0 +1,26 @@
+import numpy as np
+
+import coords
+from predict import Predictor
+from helpers import STATION, planeRecords
+
+
+def test_predict(speed=250., noise=5.):
+    """A plane flying straight over the station must be predicted to
+    pass within a fraction of a degree of the zenith at the right time"""
+    station = coords.Station(*STATION)
+    rng = np.random.RandomState(0)
+    # Due North at 10 km height, 30 km South of the station; one beacon
+    # every second with a few metres of noise
+    t = 1366000000. + np.arange(60.)
+    north = -30000. + speed * (t - t[0]) + rng.normal(0, noise, len(t))
+    recs = planeRecords(t, lat=station.lat + north / 111200.,
+                        lon=station.lon, alt=10000 / 0.3048)
+    p = Predictor(station)
+    for k in xrange(0, len(recs), 7):
+        p.update(recs[k:k + 7])
+    ids, tca, sep, P = p.closestApproach(0., np.pi / 2, horizon=150.)
+    expected = (30000. / speed) - 59
+    assert ids == ['abcdef']
+    assert abs(tca[0] - expected) <= 2, (tca, expected)
+    assert np.degrees(sep[0]) < 0.5, np.degrees(sep)
@@ -0,0 +1,96 @@
+import time
+import socket
+
+from receiver import LineFramer, MultiClient, REQUEST
+
+
+def test_framer():
+    """Lines split across reads, NUL terminators and partial tails"""
+    framer = LineFramer()
+    assert framer.feed('a 1\r') == []
+    assert framer.pending == 4
+    assert framer.feed('\nb 2\0\0c 3\n\nd') == ['a 1', 'b 2', 'c 3']
+    assert framer.pending == 1
+    assert framer.feed(' 4') == []
+    assert framer.flush() == ['d 4']
+    assert framer.pending == 0 and framer.flush() == []
+    assert framer.feed('\0e 5\0') == ['e 5']
+
+
+def _server():
+    """Listening socket on a free local port"""
+    server = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+    server.bind(('127.0.0.1', 0))
+    server.listen(1)
+    server.settimeout(5)
+    return server
+
+
+def _accept(server):
+    peer, _ = server.accept()
+    peer.settimeout(5)
+    return peer
+
+
+def _run(client, until, limit=5.):
+    """Steps the client until until(received lines) is true"""
+    received = []
+    t0 = time.time()
+    while not until(received) and time.time() - t0 < limit:
+        for name, lines in client.step(0.01):
+            received.extend(lines)
+    assert until(received)
+    return received
+
+
+def test_reconnect():
+    """A closed connection drops its partial line and is reopened"""
+    server = _server()
+    client = MultiClient([('rx', server.getsockname())], backoff_min=0.01)
+    conn = client.connections[0]
+    try:
+        _run(client, lambda r: conn.requested is not None)
+        peer = _accept(server)
+        assert peer.recv(100) == REQUEST
+        peer.sendall('a 1\nb 2')
+        assert _run(client, lambda r: r) == ['a 1']
+        peer.close()
+        assert _run(client, lambda r: conn.failures) == []
+        assert conn.framer.pending == 0
+        conn.requested = None
+        _run(client, lambda r: conn.requested is not None)
+        assert conn.connects == 2
+        peer = _accept(server)
+        assert peer.recv(100) == REQUEST
+        peer.close()
+    finally:
+        client.close()
+        server.close()
+    assert conn.state == 'closed' and conn.sock is None
+
+
+def test_timeout():
+    """A server that never answers is dropped after the timeout"""
+    server = _server()
+    client = MultiClient([('rx', server.getsockname())], backoff_min=10,
+                         timeout=0.2)
+    conn = client.connections[0]
+    try:
+        _run(client, lambda r: conn.state == 'connected')
+        peer = _accept(server)
+        _run(client, lambda r: conn.state == 'closed')
+        assert conn.failures == 1 and conn.retry_at > time.time()
+        peer.close()
+    finally:
+        client.close()
+        server.close()
+
+
+def test_bad_host():
+    """Host names that cannot be resolved are retried like any other
+    connection failure"""
+    client = MultiClient([('rx', ('host.invalid', 1))], backoff_min=10)
+    conn = client.connections[0]
+    client.step(0)
+    assert conn.state == 'closed' and conn.failures == 1
+    assert conn.retry_at > time.time() + 5
@@ -0,0 +1,204 @@
+import os
+
+import numpy as np
+
+import beacons
+import archive
+import dumpfile
+import replay
+from replay import (openReplay, MergedSource, ReplaySource, ReplayClock,
+                    TimeIndex)
+from bench import fakeLines
+from helpers import T0, tempdir, planeRecords, writeDump
+
+
+def test_merged(n=3000):
+    """Dumps split per receiver and rotated per hour, gzipped or not,
+    must replay as the time ordered union of their beacons"""
+    rs = np.random.RandomState(0)
+    with tempdir() as folder:
+        everything = []
+        for rx in ('rx1', 'rx2', 'rx3'):
+            t = T0 + np.sort(rs.uniform(0, 3 * 3600, n))
+            recs = planeRecords(t, ids=rx, lat=rs.uniform(50, 52, n))
+            writer = dumpfile.DumpWriter(os.path.join(folder, rx + '.txt'),
+                                         'hour', rx != 'rx2', flush_every=0)
+            lines = beacons.formatRecords(recs)
+            for k in xrange(0, n, 100):
+                writer.write(lines[k:k + 100], t[k])
+            writer.close()
+            everything.append(beacons.parse_lines(lines)[0])
+        everything = np.concatenate(everything)
+        t = beacons.unixTime(everything['mjd'], everything['epc'])
+        expected = everything[np.argsort(t, kind='mergesort')]
+        for spec in (folder, os.path.join(folder, 'rx*')):
+            source = openReplay(spec)
+            assert isinstance(source, MergedSource)
+            assert len(source.sources) == 3
+            assert all(len(s.parts) == 3 for s in source.sources)
+            got = np.concatenate([p for p, _ in source.blocks()])
+            assert (got == expected).all()
+        source = openReplay(folder)
+        source.seek(T0 + 3600)
+        got = []
+        for tt in np.arange(T0 + 3600, T0 + 3 * 3600 + 60, 60):
+            got.append(source.readUntil(tt)[0])
+        got = np.concatenate(got)
+        assert source.finished
+        assert (got == expected[np.sort(t) >= T0 + 3600]).all()
+
+
+def test_lookup():
+    """lookup must give the last indexed position at or before t"""
+    index = TimeIndex([0., 10., 20.], [0, 100, 200], 10)
+    assert [index.lookup(t) for t in (-5, 0, 15, 20, 99)] == \
+        [0, 0, 100, 200, 200]
+    assert TimeIndex([], [], 10).lookup(5) == 0
+
+
+def test_seek():
+    """Seeking a dump or an archive must read exactly the beacons from
+    then on, past blocks without any beacons, up to the end"""
+    planes = fakeLines(5, 600)
+    lines = planes[:1000] + ['CONN ERROR'] * 50 + planes[1000:]
+    expected = beacons.parse_lines(lines)[0]
+    t = beacons.unixTime(expected['mjd'], expected['epc'])
+    with tempdir() as folder:
+        fname = writeDump(os.path.join(folder, 'dump.txt'), lines)
+        aname = os.path.join(folder, 'dump.l2pa')
+        archive.convertDump(fname, aname)
+        for name, blocksize in ((fname, 300), (aname, 64 * 20)):
+            source = ReplaySource(name, blocksize)
+            assert source.start == t[0]
+            got = source.readUntil(np.inf)[0]
+            assert source.finished and len(got) == len(expected)
+            for ts in (t[0], t[0] + 123.5, t[-1], t[-1] + 1):
+                source.seek(ts)
+                got = source.readUntil(np.inf)[0]
+                assert source.finished
+                assert (got['id'] == expected['id'][t >= ts]).all()
+                assert (got['epc'] == expected['epc'][t >= ts]).all()
+
+
+def test_clock(monkeypatch):
+    """Simulated time must follow the wall clock at the given speed,
+    counting the frames that a slow tick skipped"""
+    wall = [100.]
+    monkeypatch.setattr(replay.time, 'time', lambda: wall[0])
+    clock = ReplayClock(T0, speed=60, interval=0.1)
+    assert clock.tick() == T0 + 6
+    for dt in (0.1, 0.3, 0.1):
+        wall[0] += dt
+        clock.tick()
+    assert np.isclose(clock.time, T0 + 36)
+    assert clock.frames == 4 and clock.dropped == 2
+    assert np.isclose(clock.rate, 60)
+    clock.reset(T0 + 3600)
+    wall[0] += 5
+    assert clock.tick() == T0 + 3606
+
+
+def test_bad_lines():
+    """Lines that are not numbers where the times should be must be
+    left out of the index, and the replay must read past them"""
+    planes = fakeLines(5, 100)
+    bad = ' '.join(['x'] * beacons.PLANE_FIELDS)
+    lines = planes[:200] + [bad, 'a b c d e f'] + planes[200:]
+    with tempdir() as folder:
+        fname = writeDump(os.path.join(folder, 'dump.txt'), lines)
+        source = ReplaySource(fname, 1000)
+        t0 = source.start
+        source.seek(t0 + 60)
+        got = source.readUntil(np.inf)[0]
+        expected = beacons.parse_lines(planes)[0]
+        t = beacons.unixTime(expected['mjd'], expected['epc'])
+        assert (got == expected[t >= t0 + 60]).all()
+        assert len(source.index) == 10
+
+
+def test_gzip_seek():
+    """Seeks in a gzip dump must start from the gzip member holding the
+    position and read the same as in the plain dump"""
+    lines = fakeLines(10, 300)
+    with tempdir() as folder:
+        plain = writeDump(os.path.join(folder, 'plain.txt'), lines)
+        gz = os.path.join(folder, 'dump.txt.gz')
+        writer = dumpfile.DumpWriter(gz, flush_every=0)
+        for k in xrange(0, len(lines), 70):
+            writer.write(lines[k:k + 70])
+        writer.close()
+        starts, raw = dumpfile.gzipMembers(gz, chunk=1000)
+        assert len(starts) > 10 and (np.diff(raw) > 0).all()
+        data = open(plain, 'rb').read()
+        for offset in (0, starts[5], starts[5] + 77, len(data) - 3):
+            f = dumpfile.openDump(gz, offset, (starts, raw))
+            assert f.tell() == offset and f.read() == data[offset:]
+            f.close()
+        expected = ReplaySource(plain, 2000)
+        source = ReplaySource(gz, 2000)
+        t0 = source.start
+        for ts in (t0 + 250, t0 + 100.5, t0 + 299):
+            expected.seek(ts)
+            source.seek(ts)
+            assert source.index.members is not None
+            assert isinstance(source._file, dumpfile._GzipMember)
+            assert (source.readUntil(np.inf)[0] ==
+                    expected.readUntil(np.inf)[0]).all()
+        # Also from the saved index
+        cached = ReplaySource(gz).index.members
+        assert (cached[0] == starts).all() and (cached[1] == raw).all()
+
+
+def test_quiet_start():
+    """A dump opening with more than a block of control and telescope
+    lines must start at the first telescope line, alone or merged"""
+    planes = fakeLines(3, 100)
+    tel = ['56395 {:.3f} telscp 75.00 65.00 1'.format(39000. + k)
+           for k in xrange(200)]
+    t0 = beacons.unixTime(56395, 39000.)
+    with tempdir() as folder:
+        quiet = writeDump(os.path.join(folder, 'rx1.txt'),
+                          ['CONN ERROR'] * 50 + tel + planes)
+        writeDump(os.path.join(folder, 'rx2.txt'), planes)
+        source = ReplaySource(quiet, 1000)
+        assert source.start == t0 == source.index.start
+        precs, tlines = source.readUntil(np.inf)
+        assert len(precs) == len(planes)
+        assert [l.split() for l in tlines] == [l.split() for l in tel]
+        merged = openReplay(os.path.join(folder, 'rx*'), 1000)
+        assert isinstance(merged, MergedSource)
+        assert merged.start == t0
+
+
+def test_merged_bad_time():
+    """A telescope line whose time is not a number must be left out of
+    a merged replay rather than stop it"""
+    planes = fakeLines(3, 100)
+    tel = ['56395 {:.3f} telscp 75.00 65.00 1'.format(40000.5 + k)
+           for k in xrange(0, 100, 10)]
+    with tempdir() as folder:
+        writeDump(os.path.join(folder, 'rx1.txt'),
+                  planes[:150] + tel[:5] + ['56395 x telscp 75.00 65.00 1'] +
+                  tel[5:] + planes[150:])
+        writeDump(os.path.join(folder, 'rx2.txt'), planes)
+        source = openReplay(os.path.join(folder, 'rx*'), 1000)
+        assert isinstance(source, MergedSource)
+        got = [source.readUntil(t) for t in source.start + np.arange(1, 101)]
+        assert source.finished
+        assert sum(len(precs) for precs, _ in got) == 2 * len(planes)
+        assert [l.split() for _, tlines in got for l in tlines] == \
+            [l.split() for l in tel]
+
+
+def test_parse_time():
+    """Dates and times of day as --start and --end take them; anything
+    else is a ValueError"""
+    assert replay.parseTime('2013-04-15T10:00') == T0
+    assert replay.parseTime('10:00:30', T0 - 60) == T0 + 30
+    assert replay.parseTime('09:59', T0) == T0 + 86400 - 60
+    for bad in ('14h32', '2013-04-13T', '14', '1:2:3:4', ''):
+        try:
+            replay.parseTime(bad, T0)
+        except ValueError:
+            continue
+        raise AssertionError('{!r} accepted'.format(bad))
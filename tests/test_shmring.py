@@ -0,0 +1,48 @@
+import numpy as np
+
+import beacons
+import shmring
+from shmring import BeaconRing
+
+
+def _records(start, n):
+    recs = np.zeros(n, beacons.PLANE_DTYPE)
+    recs['epc'] = np.arange(start, start + n)
+    return recs
+
+
+def test_order():
+    """Records come out in order, wrapping around the end of the ring,
+    and the oldest are dropped when the ring overflows"""
+    ring = BeaconRing(10)
+    ring.put(_records(0, 7))
+    assert (ring.drain(max_records=5)['epc'] == np.arange(5)).all()
+    ring.put(_records(7, 6))
+    assert len(ring) == 8
+    assert (ring.drain()['epc'] == np.arange(5, 13)).all()
+    ring.put(_records(13, 25))
+    assert (ring.drain()['epc'] == np.arange(28, 38)).all()
+    assert ring.dropped == 15 and len(ring.drain()) == 0
+
+
+def test_overwrite_during_drain():
+    """Records the producer starts to overwrite while the consumer is
+    copying them are dropped, not returned half written"""
+    ring = BeaconRing(10)
+    ring.put(_records(0, 10))
+    counter = ring._counter
+
+    def interrupted(offset):
+        # The producer reserves and writes 3 slots just after drain has
+        # read the counters, but has not published them yet
+        value = counter(offset)
+        if offset == shmring._TAIL:
+            ring._set(shmring._RESERVE, 13)
+            ring._slots[:3] = _records(10, 3)
+        return value
+
+    ring._counter = interrupted
+    recs = ring.drain()
+    del ring._counter
+    assert (recs['epc'] == np.arange(3, 10)).all()
+    assert ring.dropped == 3
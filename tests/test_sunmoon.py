@@ -0,0 +1,20 @@
+import math
+
+import numpy as np
+
+import sunmoon
+
+
+def test_vec(JD0=2456395.5, n=500):
+    '''Compares the Numpy versions with the scalar ones over a day'''
+    JD = JD0 + np.linspace(0, 1, n)
+    for fvec, fscalar in [(sunmoon.sunazel_vec, sunmoon.sunazel),
+                          (sunmoon.sunazel_lacc_vec, sunmoon.sunazel_lacc),
+                          (sunmoon.moonazel_vec, sunmoon.moonazel)]:
+        a, e, r = fvec(JD)
+        for i in xrange(n):
+            a1, e1, r1 = fscalar(JD[i])
+            da = abs(a[i] - a1)
+            assert min(da, 2 * math.pi - da) < 1e-9, fvec.__name__
+            assert abs(e[i] - e1) < 1e-9, fvec.__name__
+            assert abs(r[i] - r1) < 1e-9 * r1, fvec.__name__
@@ -0,0 +1,56 @@
+import StringIO
+
+import numpy as np
+import pytest
+
+import termview
+from termview import TableView
+from tracks import Plane
+from helpers import T0, planeRecords
+
+
+def _planes(els, ids='abcdef'):
+    return [Plane(planeRecords(T0 + np.arange(3), ids='{}{:05d}'.format(
+                  ids[k], k), el=el), minel=0) for k, el in enumerate(els)]
+
+
+def test_sort():
+    """Rows must follow the chosen sort order"""
+    planes = _planes([10., 30., 20.])
+    view = TableView(sort='el')
+    assert [row.split()[0] for row in view.rows(planes)] == \
+        ['b00001', 'c00002', 'a00000']
+    view.sort = 'tel'
+    tel = (planes[0].az[-1], np.radians(10.))
+    rows = view.rows(planes, tel)
+    assert rows[0].split()[0] == 'a00000'
+    assert float(rows[0].split()[-1]) == 0.
+    with pytest.raises(ValueError):
+        TableView(sort='alt')
+
+
+def test_redraw():
+    """Only the rows that changed must be rewritten, at most max_rate
+    times per second unless forced, and a complete redraw every
+    full_every seconds"""
+    out = StringIO.StringIO()
+    view = TableView(out, max_rate=1e-3, max_rows=10, full_every=1e6)
+    planes = _planes([10., 30., 20.])
+    view.show(planes)
+    first = out.getvalue()
+    assert first.startswith(termview.CLEAR)
+    assert first.count(termview.CLEAR_LINE) == len(termview.HEADER) + 3
+    view.show(planes[:2])
+    assert out.getvalue() == first
+    out.truncate(0)
+    view.show(planes[:2], force=True)
+    # The last row goes, and the one of plane a moves up; nothing else
+    # is rewritten
+    drawn = out.getvalue()
+    assert termview.CLEAR not in drawn
+    assert drawn.count(termview.CLEAR_LINE) == 1 and 'a00000' in drawn
+    assert termview.CLEAR_BELOW in drawn
+    out.truncate(0)
+    view.reset()
+    view.show(planes, force=True)
+    assert out.getvalue().startswith(termview.CLEAR)
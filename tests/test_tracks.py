@@ -0,0 +1,65 @@
+import os
+
+import numpy as np
+
+import beacons
+import coords
+from tracks import Plane, Retention, TrackSpill, addPlanes
+from helpers import T0, tempdir, planeRecords
+
+
+def test_expiry(time_alive=15):
+    """Planes must expire by absolute time, also across midnight"""
+    line = '{} {:.3f} {} RYR1 50.97 -0.61 29525 68.66 280.17 7.16 0 0 0'
+    P = addPlanes([line.format(56395, 86390., 'aaaaaa'),
+                   line.format(56395, 86395., 'bbbbbb')], {},
+                  time_alive=time_alive)
+    # 10 s later, just after midnight: both still alive
+    P = addPlanes([line.format(56396, 0., 'bbbbbb')], P,
+                  time_alive=time_alive)
+    assert sorted(P) == ['aaaaaa', 'bbbbbb'], sorted(P)
+    # 20 s after midnight 'aaaaaa' has been silent for 30 s
+    P = addPlanes([line.format(56396, 10., 'bbbbbb')], P,
+                  time_alive=time_alive)
+    assert sorted(P) == ['bbbbbb'], sorted(P)
+    assert np.all(np.diff(P['bbbbbb'].epc) > 0)
+
+
+def test_azel(n=50, keep=20):
+    """Tracks re-projected to another station, added to in pieces and
+    with old points discarded, must match projecting them in one go"""
+    station = coords.Station(28.3, -16.5, 2390., name='other')
+    line = '56395 {:.3f} aaaaaa RYR1 {:.4f} {:.4f} {:.0f} 100 180 5 0 0 0'
+    lines = [line.format(40000. + k, 28. + 0.01 * k, -16. - 0.02 * k,
+                         30000 + 10 * k) for k in xrange(n)]
+    plane = Plane(beacons.parse_lines(lines[:5])[0], minel=0,
+                  retention=Retention(max_points=keep))
+    plane.azel(station, 3)
+    for k in xrange(5, n, 7):
+        plane.addRecords(beacons.parse_lines(lines[k:k + 7])[0])
+        if k % 2:
+            plane.azel(station, 1)
+    az, el = plane.azel(station, keep)
+    az1, el1, _ = station.geod2azel(plane.lat, plane.lon, plane.alt)
+    assert len(plane) == keep and len(az) == keep
+    assert np.allclose(az, az1) and np.allclose(el, el1 * 180 / np.pi)
+
+
+def test_spill(n=30, keep=10):
+    """Points discarded and retired go to the spill file, each plane's
+    in time order"""
+    with tempdir() as folder:
+        spill = TrackSpill(os.path.join(folder, 'spill.txt'))
+        retention = Retention(max_points=keep, spill=spill)
+        planes = [Plane(planeRecords(T0 + np.arange(n), ids=pid, el=10 + k),
+                        minel=0, retention=retention)
+                  for k, pid in enumerate(('aaaaaa', 'bbbbbb'))]
+        spill.flush()
+        planes[0].retire()
+        spill.close()
+        precs = beacons.parse_lines(open(spill.fname).read())[0]
+    assert spill.points == len(precs) == 2 * (n - keep) + keep
+    assert list(precs['id']) == (['aaaaaa'] * (n - keep) +
+                                 ['bbbbbb'] * (n - keep) + ['aaaaaa'] * keep)
+    t = beacons.unixTime(precs['mjd'], precs['epc'])
+    assert (t == np.r_[T0 + np.arange(n - keep), T0 + np.arange(n)]).all()
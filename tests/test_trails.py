@@ -0,0 +1,81 @@
+import numpy as np
+from matplotlib import cm
+from matplotlib.figure import Figure
+from matplotlib.backends.backend_agg import FigureCanvasAgg
+
+from tracks import Plane, Retention
+from trails import TrackArtists
+from helpers import T0, planeRecords
+
+
+def _artists():
+    fig = Figure(figsize=(4, 4))
+    FigureCanvasAgg(fig)
+    ax = fig.add_subplot(111, projection='polar')
+    ax.set_ylim(0, 90)
+    return TrackArtists(ax, npoints=10, step=1, ncolours=10)
+
+
+def _plane(pid, el, n=5, t=T0):
+    recs = planeRecords(t + np.arange(n), ids=pid, el=el)
+    recs['az'] = np.linspace(10, 20, n)
+    return Plane(recs, minel=0)
+
+
+def test_bins():
+    """Trails are grouped by the colour of the current elevation"""
+    artists = _artists()
+    # (el + 5) / 100 * 10: bins 0, 3, 3 and 9 (above 95 degrees clipped)
+    planes = [_plane('aaaaaa', 1), _plane('bbbbbb', 30),
+              _plane('cccccc', 32), _plane('dddddd', 99)]
+    artists.update(planes)
+    paths = artists.trails.get_paths()
+    assert [len(p.vertices) for p in paths] == [5, 10, 5]
+    assert (paths[1].codes == [1, 2, 2, 2, 2] * 2).all()
+    colours = cm.jet((np.array([0, 3, 9]) + 0.5) / 10)
+    assert np.allclose(artists.trails.get_edgecolors(), colours)
+    assert len(artists.points.get_offsets()) == 4
+
+
+def test_changes():
+    """Only the bins whose planes changed are rebuilt, and the trails
+    of planes no longer shown go away"""
+    artists = _artists()
+    a, b, c = _plane('aaaaaa', 1), _plane('bbbbbb', 30), _plane('cccccc', 60)
+    artists.update([a, b, c])
+    before = artists.trails.get_paths()
+    b.addRecords(planeRecords([T0 + 10], ids='bbbbbb', el=30))
+    artists.update([a, b, c])
+    after = artists.trails.get_paths()
+    assert after[0] is before[0] and after[2] is before[2]
+    assert after[1] is not before[1] and len(after[1].vertices) == 6
+    # c leaves (e.g. expired): its bin and position disappear
+    artists.update([a, b])
+    assert len(artists.trails.get_paths()) == 2
+    assert len(artists.points.get_offsets()) == 2
+    # A new view projects every trail again
+    artists.ax.set_ylim(0, 60)
+    artists.update([a, b])
+    assert artists.trails.get_paths()[0] is not before[0]
+    artists.clear()
+    assert not artists.trails.get_paths()
+    assert len(artists.points.get_offsets()) == 0
+
+
+def test_full_track():
+    """A plane at its retention limit whose new point has the same time
+    as its latest one must still have its trail projected again"""
+    artists = _artists()
+    recs = planeRecords(T0 + np.arange(5), ids='aaaaaa', el=30)
+    recs['az'] = np.linspace(10, 20, 5)
+    a = Plane(recs, minel=0, retention=Retention(max_points=5))
+    artists.update([a])
+    before = artists.trails.get_paths()[0].vertices.copy()
+    late = planeRecords([T0 + 4], ids='aaaaaa', el=30)
+    late['az'] = 90
+    a.addRecords(late)
+    assert len(a) == 5 and a.last_time == T0 + 4
+    artists.update([a])
+    after = artists.trails.get_paths()[0].vertices
+    assert (after[:-1] == before[1:]).all()
+    assert not (after[-1] == before[-1]).all()